@@ -187,7 +187,8 @@ class FilterModule(object):
         """
         Extract all datasets marked for backup from a ZFS configuration dictionary.
 
-        Returns datasets that have policy: high or policy: critical.
+        Returns datasets that have policy: high or policy: critical, each with
+        its dataset path, policy and (if set) properties and delegation.
 
         Args:
             zfs_dict: ZFS configuration dictionary
@@ -219,7 +220,8 @@ class FilterModule(object):
 
                     if should_backup:
                         dataset_dict = {
-                            'dataset': '/'.join(dataset_path)
+                            'dataset': '/'.join(dataset_path),
+                            'policy': dataset_value['policy'],
                         }
 
                         if 'properties' in dataset_value:
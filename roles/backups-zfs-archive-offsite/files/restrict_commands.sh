@@ -8,18 +8,31 @@ export PATH=/usr/sbin:/usr/bin:$PATH
 # Regex patterns for validation
 _RE_DATASET='[a-zA-Z0-9/_-]+'
 _RE_SNAPSHOT='[a-zA-Z0-9/_-]+@[a-zA-Z0-9/_:-]+'
+_RE_SIZE='[0-9]+[kMG%]?'
+# Optional buffer and decompressor stages in front of zfs receive (--mbuffer-size, --compress)
+_RE_RECEIVE_STAGES="(mbuffer -q -s ${_RE_SIZE} -m ${_RE_SIZE} 2>/dev/null \| )?((lzop -d|zstd -q -d) \| )?"
 
 _WHITELIST=(
     # Connectivity check
     -e "^ls$"
+    # Check the buffer and decompressor used by the receive stages are installed
+    -e "^command -v (lzop|zstd|mbuffer)$"
     # List datasets (for checking existence)
     -e "^zfs list ${_RE_DATASET}$"
-    # List snapshots (for incremental sync detection)
-    -e "^zfs list -t snapshot -H -o name -s creation -r ${_RE_DATASET}$"
+    # List the whole destination tree with guids and resume tokens (for planning the push)
+    -e "^zfs list -t filesystem,volume,snapshot -Hp -o name,guid,receive_resume_token -s createtxg -r ${_RE_DATASET}$"
+    # List snapshots with guids (for incremental sync detection)
+    -e "^zfs list -t snapshot -Hp -o name,guid -s createtxg -d 1 ${_RE_DATASET}$"
+    # Check the snapshots in the replication journal are still here
+    -e "^zfs get -H -p -o name,value guid ${_RE_SNAPSHOT}( ${_RE_SNAPSHOT})*$"
+    # Read the resume token an interrupted receive left behind
+    -e "^zfs get -H -o value receive_resume_token ${_RE_DATASET}$"
     # Create parent datasets one level at a time (unmounted, since we don't need to access data here)
-    -e "^zfs create -o canmount=off ${_RE_DATASET}$"
-    # Receive backup streams unmounted (the main operation)
-    -e "^zfs receive -F -u ${_RE_DATASET}$"
+    -e "^zfs create -o canmount=off ${_RE_DATASET}( && zfs create -o canmount=off ${_RE_DATASET})*$"
+    # Receive backup streams unmounted and resumable (the main operation)
+    -e "^${_RE_RECEIVE_STAGES}zfs receive -s (-F )?-u ${_RE_DATASET}$"
+    # Discard a partial receive whose resume token can no longer be used
+    -e "^zfs receive -A ${_RE_DATASET}$"
 )
 
 # Check if command matches whitelist
@@ -0,0 +1,402 @@
+#! /opt/zfsbackup/bin/python
+"""
+ZFS Backup Orchestrator - Runs every client pull and the offsite push from one service
+
+Replaces the per-client pull cron jobs and the offsite push cron job. Each pull
+and push still runs as its own zfs-pull-backups / zfs-push-backups process, with
+the arguments the cron jobs would pass; the orchestrator only decides when and
+how many at once: the number of clients pulled at a time and their share of the
+bandwidth budget follow from the fleet-wide limits, critical datasets are pulled
+fleet-wide before anything else, and the offsite push runs between pull cycles
+so it never competes with them.
+
+Usage:
+    zfs-backup-orchestrator [--once pull|push] [--debug] [--quiet]
+"""
+import argparse
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+SCRIPT_PATH = "{{ backups_zfs_server_script_path }}"
+
+# Clients to pull from (injected by Ansible): [{name, host, user, healthcheck, datasets: [{dataset, policy}]}]
+CLIENTS = json.loads(r'''{{ backups_zfs_server_orchestrator_clients | default([]) | to_json }}''')
+
+# Offsite hosts to push to (injected by Ansible): [{host, user, destination, datasets: [...]}]
+OFFSITE = json.loads(r'''{{ backups_zfs_server_orchestrator_offsite | default([]) | to_json }}''')
+
+PULL_SCHEDULE = ("{{ backups_zfs_server_cron_hour }}", "{{ backups_zfs_server_cron_minute }}")
+PUSH_SCHEDULE = ("{{ backups_zfs_server_offsite_cron_hour }}", "{{ backups_zfs_server_offsite_cron_minute }}")
+
+# Transfers running at once across all clients, and datasets per client
+JOBS = {{ backups_zfs_server_orchestrator_jobs }}
+CLIENT_JOBS = {{ backups_zfs_server_pull_jobs }}
+
+PULL_ORDER = "{{ backups_zfs_server_pull_order }}"
+PULL_RECURSIVE = {{ backups_zfs_server_pull_recursive | bool }}
+PULL_BOOTSTRAP = json.loads(r'''{{ backups_zfs_server_pull_bootstrap | to_json }}''')
+BOOTSTRAP_ANCHORS = ",".join(json.loads(r'''{{ backups_zfs_server_bootstrap_anchors | to_json }}'''))
+PULL_PROTECT = "{{ backups_zfs_server_pull_protect }}"
+PULL_SEND_FLAGS = json.loads(r'''{{ backups_zfs_server_pull_send_flags | to_json }}''')
+PULL_BWLIMIT = "{{ backups_zfs_server_pull_bwlimit }}" or None
+PULL_COMPRESS = "{{ backups_zfs_server_pull_compress }}" or None
+PULL_MBUFFER_SIZE = "{{ backups_zfs_server_pull_mbuffer_size }}" or None
+PUSH_BOOTSTRAP = "{{ backups_zfs_server_offsite_bootstrap }}"
+PUSH_PROTECT = "{{ backups_zfs_server_offsite_protect }}"
+PUSH_FANOUT = {{ backups_zfs_server_offsite_fanout | bool }}
+PUSH_BWLIMIT = "{{ backups_zfs_server_offsite_bwlimit }}" or None
+PUSH_BWLIMIT_SCHEDULE = "{{ backups_zfs_server_offsite_bwlimit_schedule }}" or None
+PUSH_COMPRESS = "{{ backups_zfs_server_offsite_compress }}" or None
+PUSH_MBUFFER_SIZE = "{{ backups_zfs_server_offsite_mbuffer_size }}" or None
+
+MQTT_HOST = "{{ backups_zfs_server_mqtt_host if backups_zfs_server_mqtt_enabled | bool else '' }}" or None
+MQTT_TOPIC_PREFIX = "{{ backups_zfs_server_mqtt_topic_prefix }}"
+MQTT_TRANSFERS = {{ backups_zfs_server_mqtt_transfers | bool }}
+
+HEALTHCHECKS_URL = "https://hc-ping.com"
+
+_quiet = False
+_debug = False
+
+# Pull and push processes currently running, so a signal can be passed on to
+# them; reentrant because the signal handler runs in the main thread, which
+# may be starting a push itself
+_children = {}
+_children_lock = threading.RLock()
+_stop = threading.Event()
+
+
+def info(message):
+    """Print informational message unless quiet mode is enabled."""
+    if not _quiet:
+        print("* " + message)
+
+def debug(message):
+    """Print debug messages."""
+    if _debug and not _quiet:
+        print("ℹ️ " + message)
+
+def error(message):
+    """Print error messages to stderr."""
+    print("🚨 " + message, file=sys.stderr)
+
+
+def parse_size_to_bytes(size_str):
+    """Parse a size like the scripts' --bwlimit (100k, 10m, 1g) to bytes."""
+    match = re.match(r'^([\d.]+)\s*([KMGTP])?I?B?$', size_str.strip().upper())
+    if not match:
+        return None
+    multipliers = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4, 'P': 1024 ** 5}
+    return int(float(match.group(1)) * multipliers[match.group(2) or ''])
+
+
+def parse_cron_field(field, low, high):
+    """Expand a cron field (*, */n, a-b, a,b,...) into a sorted list of values."""
+    values = set()
+    for part in field.split(','):
+        part, _, step = part.partition('/')
+        step = int(step) if step else 1
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(x) for x in part.split('-', 1))
+        else:
+            start = end = int(part)
+        values.update(range(start, end + 1, step))
+    return sorted(v for v in values if low <= v <= high)
+
+
+def next_run(schedule, after):
+    """Return the first time after `after` matching a (cron hour, cron minute) schedule."""
+    hours = parse_cron_field(schedule[0], 0, 23)
+    minutes = parse_cron_field(schedule[1], 0, 59)
+    day = after.replace(hour=0, minute=0, second=0, microsecond=0)
+    for offset in range(2):
+        for hour in hours:
+            for minute in minutes:
+                candidate = day + timedelta(days=offset, hours=hour, minutes=minute)
+                if candidate > after:
+                    return candidate
+    return None
+
+
+def ping_healthcheck(uuid, ok):
+    """Ping a healthchecks.io check, on its /fail endpoint if the pull failed."""
+    url = f"{HEALTHCHECKS_URL}/{uuid}" + ("" if ok else "/fail")
+    for attempt in range(3):
+        try:
+            with urllib.request.urlopen(url, timeout=10):
+                return
+        except OSError as e:
+            debug(f"Healthcheck ping to {url} failed (attempt {attempt + 1}): {e}")
+    error(f"Could not ping healthcheck {uuid}")
+
+
+def split_waves(datasets):
+    """Split a client's datasets into (critical, all).
+
+    The first wave is the critical datasets whose declared ancestors are
+    critical too, since a child can't be received before its parent. The
+    second wave is the client's whole pull, so its journal and MQTT status
+    cover every dataset; what the first wave pulled is normally unchanged by
+    then and skipped.
+    """
+    rest = [d['dataset'] for d in datasets if d.get('policy') != 'critical']
+    critical = [d['dataset'] for d in datasets if d.get('policy') == 'critical'
+                and not any(d['dataset'].startswith(parent + '/') for parent in rest)]
+    return critical, [d['dataset'] for d in datasets]
+
+
+def relay_output(stream, dst, prefix):
+    """Copy a child's output to dst line by line, each line prefixed with prefix."""
+    for line in stream:
+        dst.write(prefix + line)
+        dst.flush()
+    stream.close()
+
+
+def run_script(label, command):
+    """Run one pull or push process to completion, prefixing its output with label.
+
+    Returns its exit code, or None if the orchestrator is stopping and it
+    wasn't started.
+    """
+    debug(' '.join(command))
+    with _children_lock:
+        if _stop.is_set():
+            return None
+        proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                encoding='utf-8', errors='replace', env=dict(os.environ, PYTHONUNBUFFERED='1'))
+        _children[proc] = label
+    relays = [threading.Thread(target=relay_output, args=(proc.stdout, sys.stdout, f"[{label}] ")),
+              threading.Thread(target=relay_output, args=(proc.stderr, sys.stderr, f"[{label}] "))]
+    for relay in relays:
+        relay.start()
+    try:
+        proc.wait()
+        for relay in relays:
+            relay.join()
+    finally:
+        with _children_lock:
+            _children.pop(proc, None)
+    return proc.returncode
+
+
+def output_args():
+    """--quiet / --debug as given to the orchestrator, for the scripts it runs."""
+    return (['--quiet'] if _quiet else []) + (['--debug'] if _debug else [])
+
+
+def pull_command(client, datasets, bwlimit, mqtt):
+    """The zfs-pull-backups command line for datasets of client, as the client's
+    pull cron job runs it but with this share of the bandwidth budget. mqtt
+    adds the MQTT status publish (if enabled).
+
+    The scripts run with this interpreter, which their shebang names too.
+    """
+    command = [
+        sys.executable, os.path.join(SCRIPT_PATH, 'zfs-pull-backups'),
+        '--host', client['host'],
+        '--name', client['name'],
+        '--user', client['user'],
+        '--jobs', str(CLIENT_JOBS),
+        '--order', PULL_ORDER,
+        '--protect', PULL_PROTECT,
+        '--bootstrap', PULL_BOOTSTRAP.get('high', 'history'),
+        '--bootstrap-critical', PULL_BOOTSTRAP.get('critical', 'history'),
+        '--bootstrap-anchors', BOOTSTRAP_ANCHORS,
+    ]
+    if PULL_RECURSIVE:
+        command.append('--recursive')
+    command += [f"--{flag.replace('_', '-')}" for flag in PULL_SEND_FLAGS]
+    critical = [d['dataset'] for d in client['datasets'] if d.get('policy') == 'critical']
+    if critical:
+        command += ['--critical'] + critical
+    if bwlimit:
+        command += ['--bwlimit', bwlimit]
+    if PULL_COMPRESS:
+        command += ['--compress', PULL_COMPRESS]
+    if PULL_MBUFFER_SIZE:
+        command += ['--mbuffer-size', PULL_MBUFFER_SIZE]
+    command += ['--datasets'] + datasets
+    if mqtt and MQTT_HOST:
+        command += ['--mqtt-host', MQTT_HOST, '--mqtt-topic-prefix', MQTT_TOPIC_PREFIX, '--mqtt-name', client['name']]
+        if MQTT_TRANSFERS:
+            command.append('--mqtt-transfers')
+    return command + output_args()
+
+
+def push_command(targets):
+    """The zfs-push-backups command line pushing the offsite datasets to targets
+    (several of them make a fan-out push), as the push cron job runs it."""
+    command = [sys.executable, os.path.join(SCRIPT_PATH, 'zfs-push-backups')]
+    command += ['--host'] + [target['host'] for target in targets]
+    command += ['--user', targets[0]['user']]
+    command += ['--destination'] + [target['destination'] for target in targets]
+    command += ['--datasets'] + targets[0]['datasets']
+    command += ['--protect', PUSH_PROTECT, '--bootstrap', PUSH_BOOTSTRAP, '--bootstrap-anchors', BOOTSTRAP_ANCHORS]
+    if PUSH_BWLIMIT:
+        command += ['--bwlimit', PUSH_BWLIMIT]
+    if PUSH_BWLIMIT_SCHEDULE:
+        command += ['--bwlimit-schedule', PUSH_BWLIMIT_SCHEDULE]
+    if PUSH_COMPRESS:
+        command += ['--compress', PUSH_COMPRESS]
+    if PUSH_MBUFFER_SIZE:
+        command += ['--mbuffer-size', PUSH_MBUFFER_SIZE]
+    return command + output_args()
+
+
+def client_slots(count):
+    """How many of count clients are pulled at once, and the --bwlimit each gets.
+
+    Every pull runs up to CLIENT_JOBS transfers, so JOBS // CLIENT_JOBS clients
+    keep the fleet at JOBS transfers; PULL_BWLIMIT is split evenly between them.
+    """
+    slots = max(1, min(count, JOBS // max(1, CLIENT_JOBS)))
+    bwlimit = None
+    if PULL_BWLIMIT:
+        bwlimit = f"{max(1, parse_size_to_bytes(PULL_BWLIMIT) // slots // 1024)}k"
+    return slots, bwlimit
+
+
+def run_pulls():
+    """Pull every client: critical datasets fleet-wide first, then everything.
+
+    Returns True if every client succeeded.
+    """
+    started = time.monotonic()
+    waves = {client['name']: split_waves(client['datasets']) for client in CLIENTS}
+    results = {}
+    for wave, label in ((0, 'critical'), (1, 'all')):
+        clients = [client for client in CLIENTS
+                   if waves[client['name']][wave] and results.get(client['name']) is not False]
+        if not clients or _stop.is_set():
+            continue
+        slots, bwlimit = client_slots(len(clients))
+        info(f"Pulling {label} datasets from {len(clients)} clients, {slots} at a time")
+        executor = ThreadPoolExecutor(max_workers=slots)
+        try:
+            futures = {client['name']: executor.submit(
+                run_script, client['name'],
+                pull_command(client, waves[client['name']][wave], bwlimit, mqtt=wave == 1))
+                for client in clients}
+            for name, future in futures.items():
+                returncode = future.result()
+                if returncode is not None:
+                    results[name] = results.get(name, True) and returncode == 0
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    if _stop.is_set():
+        return False
+
+    for client in CLIENTS:
+        if client['name'] in results and client.get('healthcheck'):
+            ping_healthcheck(client['healthcheck'], results[client['name']])
+
+    failed = sorted(name for name, ok in results.items() if not ok)
+    info(f"Pull cycle finished in {time.monotonic() - started:.0f}s, "
+         f"{len(results) - len(failed)} clients ok" + (f", failed: {', '.join(failed)}" if failed else ""))
+    return not failed
+
+
+def run_pushes():
+    """Push the offsite datasets to every offsite host in turn, or to all of them
+    at once with PUSH_FANOUT. Returns True if all succeeded."""
+    targets = [target for target in OFFSITE if target['datasets']]
+    batches = [targets] if PUSH_FANOUT and len(targets) > 1 else [[target] for target in targets]
+    ok = True
+    for batch in batches:
+        hosts = ', '.join(target['host'] for target in batch)
+        info(f"Pushing {len(batch[0]['datasets'])} datasets to {hosts}")
+        returncode = run_script(f"push {hosts}", push_command(batch))
+        if returncode is None:
+            return False
+        if returncode != 0:
+            error(f"Push to {hosts} failed")
+            ok = False
+    return ok
+
+
+def signal_handler(signum, frame):
+    """Stop the daemon, passing the signal on to the running pulls and push.
+
+    They stop their transfers and release their own locks; the cycle they
+    belong to returns once they have exited, without starting anything new.
+    """
+    _stop.set()
+    with _children_lock:
+        children = dict(_children)
+    if children:
+        debug(f"Received signal {signum}, stopping {', '.join(children.values())}")
+    for proc in children:
+        proc.send_signal(signum)
+
+
+def bwlimit_signal_handler(signum, frame):
+    """Pass SIGUSR1 on to a running push, which re-reads its bandwidth limit control file."""
+    with _children_lock:
+        children = dict(_children)
+    for proc, label in children.items():
+        if label.startswith('push '):
+            proc.send_signal(signum)
+
+
+def main():
+    global _quiet, _debug
+
+    parser = argparse.ArgumentParser(description='Run all ZFS backup pulls and the offsite push on a schedule.')
+    parser.add_argument('--once', choices=['pull', 'push'], help='Run one pull or push cycle now and exit')
+    parser.add_argument('--debug', default=False, help='Debug code', action=argparse.BooleanOptionalAction)
+    parser.add_argument('--quiet', '-q', default=False, help='Suppress informational output (errors still shown)', action=argparse.BooleanOptionalAction)
+    args = parser.parse_args()
+
+    _quiet = args.quiet
+    _debug = args.debug
+
+    signal.signal(signal.SIGTERM, signal_handler)
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGUSR1, bwlimit_signal_handler)
+
+    if args.once == 'pull':
+        sys.exit(0 if run_pulls() else 1)
+    if args.once == 'push':
+        sys.exit(0 if run_pushes() else 1)
+
+    info(f"Scheduling {len(CLIENTS)} clients and {len(OFFSITE)} offsite hosts, {JOBS} transfers at a time")
+    now = datetime.now()
+    next_pull = next_run(PULL_SCHEDULE, now) if CLIENTS else None
+    next_push = next_run(PUSH_SCHEDULE, now) if OFFSITE else None
+
+    while not _stop.is_set():
+        due = [t for t in (next_pull, next_push) if t is not None]
+        if not due:
+            info("Nothing to schedule")
+            break
+        debug(f"Next pull at {next_pull}, next push at {next_push}")
+        if _stop.wait(max(0, (min(due) - datetime.now()).total_seconds())):
+            break
+
+        # Pulls go first when both are due, so the push sends what was just pulled
+        now = datetime.now()
+        if next_pull is not None and next_pull <= now:
+            run_pulls()
+            next_pull = next_run(PULL_SCHEDULE, datetime.now())
+        if next_push is not None and next_push <= datetime.now():
+            run_pushes()
+            next_push = next_run(PUSH_SCHEDULE, datetime.now())
+
+    info("Stopping")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,34 +8,171 @@ import re
 import os
 import atexit
 import signal
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import quote
 
 DEFAULT_destination = "{{ backups_zfs_server_local_dataset }}"
 DEFAULT_user="{{ vault_zfsbackups_user }}"
 DEFAULT_debug = False
 DEFAULT_quiet = False
-
-# Lockfile to prevent concurrent executions (set dynamically per host)
-_lockfile = None
+DEFAULT_jobs = 1
+DEFAULT_compress = None
+DEFAULT_mbuffer_size = None
+DEFAULT_mbuffer_block = "128k"
+DEFAULT_bwlimit = None  # No bandwidth limit by default
+DEFAULT_metrics_log = "{{ backups_zfs_server_logging_dir }}/{{ backups_zfs_server_logging_metricsfile }}"
+DEFAULT_journal_dir = "{{ backups_zfs_server_script_path }}/state"
+DEFAULT_order = "smallest"
+DEFAULT_estimate = "written"
+DEFAULT_protect = "none"
+DEFAULT_bootstrap = "history"
+DEFAULT_bootstrap_anchors = "yearly,monthly"
+DEFAULT_protect_tag = "zfs-pull-backups-{{ inventory_hostname }}"
+
+SCRIPT_NAME = "zfs-pull-backups"
+
+# Where --profile writes its summaries
+PROFILE_DIR = "{{ backups_zfs_server_logging_dir }}"
+
+# Largest amount moved per call when relaying (and metering) the stream between processes
+RELAY_CHUNK = 1024 * 1024
+
+# Smallest amount the rate limiter lets through at once, so low limits don't
+# degenerate into tiny writes
+RELAY_MIN_CHUNK = 64 * 1024
+
+# Stream compressors for --compress: (command on the sending side, command on the receiving side)
+COMPRESSORS = {
+    'lzop': ('lzop', 'lzop -d'),
+    'zstd': ('zstd -q', 'zstd -q -d'),
+}
+
+# Orders the queue can be pulled in (--order): estimated size, critical
+# datasets first, longest since last received first, or plain listing order
+ORDERS = ['smallest', 'policy', 'staleness', 'listing']
+
+# How a dataset new to the backup server is first pulled (--bootstrap): every
+# snapshot, only the anchor snapshots (see --bootstrap-anchors) and the latest,
+# or only the latest
+BOOTSTRAP_MODES = ['history', 'anchors', 'latest']
+
+# Ways to keep the newest pulled snapshot usable as the next incremental base
+# when the client prunes it (--protect): a hold stops it from being destroyed,
+# a bookmark keeps enough of it to send from after it is gone
+PROTECT_MODES = ['none', 'hold', 'bookmark']
+
+# How long (seconds) an idle SSH master connection may outlive its last command
+SSH_CONTROL_PERSIST = 600
+
+# Lockfiles currently held by this process (one per dataset being pulled)
+_lockfiles = set()
+
+# What pull_worker() returns for a dataset another instance holds the lock of
+SKIPPED = 'skipped'
+
+# Processes of the send/receive pipelines currently running, so that a signal
+# can stop them before the locks are given up. Reentrant because the signal
+# handler runs in the main thread, which may be starting a pipeline itself.
+_pipelines = set()
+_pipelines_lock = threading.RLock()
+_stopping = threading.Event()
+
+# How long (seconds) a terminated pipeline process gets before it is killed
+PIPELINE_STOP_TIMEOUT = 10
 
 # Module-level variables for output control (set by main)
 _quiet = False
 _debug = False
 
-
-def get_lockfile_path(host):
-    """Generate a host-specific lockfile path.
-
-    Sanitizes the hostname to create a safe filesystem path.
-    This allows parallel pulls from different hosts.
+# Pipeline stages (set by main): compressor name and mbuffer sizes, None to disable
+_compress = None
+_mbuffer_size = None
+_mbuffer_block = DEFAULT_mbuffer_block
+
+# zfs send flags enabled with --raw/--compressed/--large-block (set by main)
+_send_flags = []
+
+# Send flags and the pool features whose blocks they pass through as-is:
+# when one of these is active on the client's pool, the local pool must
+# support it too or the receive fails part-way through.
+SEND_FLAGS = {
+    'raw': ('-w', ['encryption', 'lz4_compress', 'zstd_compress', 'large_blocks']),
+    'compressed': ('-c', ['lz4_compress', 'zstd_compress']),
+    'large_block': ('-L', ['large_blocks']),
+}
+
+# Per-transfer metrics: JSON-lines log path (set by main, None to disable) and this run's records
+_metrics_log = None
+_transfers = []
+_transfers_lock = threading.Lock()
+
+# Directory of the replication journals (set by main, None to disable)
+_journal_dir = None
+
+# Transfer planning (set by main): queue order, how sizes are estimated
+# (snapshot `written` properties or `zfs send -nvP`), whether to stop after
+# printing the plan, and the datasets --order policy puts first
+_order = DEFAULT_order
+_estimate = DEFAULT_estimate
+_plan_only = False
+_critical = set()
+
+# Initial sync mode for datasets not given with --critical and for those that
+# were, and the snapshot types kept as anchors (set by main)
+_bootstrap = DEFAULT_bootstrap
+_bootstrap_critical = DEFAULT_bootstrap
+_bootstrap_anchors = set(DEFAULT_bootstrap_anchors.split(','))
+
+# Base protection on the remote: mode and the hold tag / bookmark prefix (set by main)
+_protect = DEFAULT_protect
+_protect_tag = DEFAULT_protect_tag
+
+# Replicate each root with one `zfs send -R` stream where possible (set by main)
+_recursive = False
+
+# Bandwidth limit in bytes/second shared by all parallel transfers (None for
+# unlimited), and the token bucket that enforces it
+_bwlimit_bytes = None
+_io_bucket = {'tokens': 0.0, 'last': 0.0}
+_io_bucket_lock = threading.Lock()
+
+# Serialises creation of shared parent datasets between workers
+_parent_lock = threading.Lock()
+
+# Local datasets known to exist (loaded once per run, kept up to date as
+# datasets are created or received); guarded by _parent_lock
+_local_datasets = set()
+
+# Per-thread output context (dataset prefix when running with --jobs > 1)
+_context = threading.local()
+
+# Multiplexed SSH master connections ("user@host" -> control socket path)
+_ssh_masters = {}
+_ssh_control_dir = None
+_ssh_lock = threading.Lock()
+
+
+def get_lockfile_path(host, dataset):
+    """Generate a dataset-specific lockfile path.
+
+    Sanitizes the hostname and dataset to create a safe filesystem path.
+    This allows parallel pulls from different hosts and of different
+    datasets on the same host, while never pulling one dataset twice.
     """
     # Sanitize hostname: replace non-alphanumeric chars with hyphens
     safe_host = re.sub(r'[^a-zA-Z0-9.-]', '-', host)
-    return f"/var/run/zfs-pull-backups-{safe_host}.lock"
+    # Percent-encode the dataset so that "a/b-c" and "a-b/c" never collide
+    safe_dataset = quote(dataset, safe='')
+    return f"/var/run/zfs-pull-backups-{safe_host}-{safe_dataset}.lock"
 
 def info(message):
     """Print informational message unless quiet mode is enabled."""
     if not _quiet:
-        print("* " + message)
+        print("* " + getattr(_context, 'prefix', '') + message)
 
 def debug(message):
     """Print debug messages."""
@@ -47,16 +184,135 @@ def error(message):
     print("🚨 " + message, file=sys.stderr)
 
 
-def acquire_lock():
-    """Acquire lockfile to prevent concurrent executions.
+# -- Profiling (--profile) ---------------------------------------------------
+# This block is the same in zfs-pull-backups, zfs-push-backups, zfs-snapshot,
+# zfs-prune and zfs-snapshot-report; tests/test_zfs_scripts.py checks that it
+# stays that way, so change all five together.
+
+# ssh options that take a value, skipped to find the remote command
+SSH_VALUE_OPTIONS = ('-S', '-O', '-o', '-p', '-i', '-l')
+
+# Phase profile of this run: None unless profiling, otherwise the current
+# phase, when it started, and the wall time and commands of each phase
+_profile = None
+_profile_lock = threading.Lock()
+
+
+def command_name(args):
+    """Name a command is profiled under: the program, with the subcommand for
+    zfs and zpool, and ssh followed by the name of what it runs remotely."""
+    if isinstance(args, str):
+        args = args.split(' ')
+    args = list(args)
+    program = os.path.basename(args[0]) if args else ''
+    if program == 'ssh':
+        rest = args[1:]
+        while rest and rest[0].startswith('-'):
+            rest = rest[2:] if rest[0] in SSH_VALUE_OPTIONS else rest[1:]
+        remote = ' '.join(rest[1:]).split()
+        return f"ssh {command_name(remote)}" if remote else 'ssh'
+    if program in ('zfs', 'zpool') and len(args) > 1:
+        return f"{program} {args[1]}"
+    return program
+
+
+def record_command(args, started):
+    """Count a command that ran since started (time.monotonic()) towards the
+    current phase (with --profile)."""
+    if _profile is None:
+        return
+    seconds = time.monotonic() - started
+    with _profile_lock:
+        phase = get_profile_phase(_profile['phase'])
+        phase['subprocesses'] += 1
+        phase['command_seconds'] += seconds
+        command = phase['commands'].setdefault(command_name(args), {'count': 0, 'seconds': 0.0})
+        command['count'] += 1
+        command['seconds'] += seconds
+
+
+def run_command(args, **kwargs):
+    """Run a command with subprocess.run() and add the time it took to the
+    current phase (with --profile)."""
+    started = time.monotonic()
+    try:
+        return subprocess.run(args, **kwargs)
+    finally:
+        record_command(args, started)
+
+
+def get_profile_phase(name):
+    """Totals of phase name in the profile, started at zero on first use."""
+    return _profile['phases'].setdefault(name, {'seconds': 0.0, 'subprocesses': 0, 'command_seconds': 0.0, 'commands': {}})
+
+
+def start_profile():
+    """Profile this run: every command run from here on is timed (see
+    run_command()), and the summary is written to PROFILE_DIR when the script
+    exits."""
+    global _profile
+    _profile = {'started': time.time(), 'phase': 'startup', 'phase_started': time.monotonic(), 'phases': {}}
+    atexit.register(write_profile)
+
+
+def profile_phase(name):
+    """Count wall time and commands from here on towards phase name (with --profile)."""
+    if _profile is None:
+        return
+    now = time.monotonic()
+    with _profile_lock:
+        get_profile_phase(_profile['phase'])['seconds'] += now - _profile['phase_started']
+        _profile['phase'] = name
+        _profile['phase_started'] = now
+
+
+def write_profile():
+    """Write the per-phase wall time, subprocess count and command times of this run as JSON."""
+    profile_phase('exit')
+    commands = {}
+    for phase in _profile['phases'].values():
+        phase['seconds'] = round(phase['seconds'], 3)
+        phase['command_seconds'] = round(phase['command_seconds'], 3)
+        for name, command in phase['commands'].items():
+            total = commands.setdefault(name, {'count': 0, 'seconds': 0.0})
+            total['count'] += command['count']
+            total['seconds'] += command['seconds']
+            command['seconds'] = round(command['seconds'], 3)
+    for command in commands.values():
+        command['seconds'] = round(command['seconds'], 3)
+    started = datetime.fromtimestamp(_profile['started'])
+    summary = {
+        'script': SCRIPT_NAME,
+        'args': sys.argv[1:],
+        'started': started.isoformat(timespec='seconds'),
+        'seconds': round(time.time() - _profile['started'], 3),
+        'subprocesses': sum(command['count'] for command in commands.values()),
+        'phases': _profile['phases'],
+        'commands': commands,
+    }
+    path = os.path.join(PROFILE_DIR, f"{SCRIPT_NAME}-profile-{started.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.json")
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(summary, f, indent=2)
+        # stderr, so that output meant for other programs (e.g. --json) stays clean
+        print(f"Profile written to {path}", file=sys.stderr)
+    except OSError as e:
+        print(f"Could not write profile {path}: {e}", file=sys.stderr)
+
+# -- End of profiling ---------------------------------------------------------
+
+
+def acquire_lock(lockfile):
+    """Acquire a lockfile to prevent concurrent pulls of the same dataset.
 
     Uses PID-based locking to detect and clean up stale locks.
     Returns True if lock acquired successfully, False otherwise.
     """
-    if os.path.exists(_lockfile):
+    if os.path.exists(lockfile):
         # Lockfile exists - check if it's stale
         try:
-            with open(_lockfile, 'r') as f:
+            with open(lockfile, 'r') as f:
                 old_pid = int(f.read().strip())
 
             # Check if process with that PID is still running
@@ -64,75 +320,184 @@ def acquire_lock():
                 os.kill(old_pid, 0)  # Signal 0 just checks if process exists
                 # Process exists - lock is valid
                 error(f"Another instance is already running (PID {old_pid})")
-                error("If you believe this is an error, remove the lockfile: " + _lockfile)
+                error("If you believe this is an error, remove the lockfile: " + lockfile)
                 return False
             except (OSError, ProcessLookupError):
                 # Process doesn't exist - stale lockfile
                 debug(f"Removing stale lockfile (PID {old_pid} not running)")
-                os.remove(_lockfile)
+                os.remove(lockfile)
         except (ValueError, IOError) as e:
             # Corrupted lockfile - remove it
             debug(f"Removing corrupted lockfile: {e}")
             try:
-                os.remove(_lockfile)
+                os.remove(lockfile)
             except OSError:
                 pass
 
     # Create lockfile with current PID
     try:
-        with open(_lockfile, 'w') as f:
+        with open(lockfile, 'w') as f:
             f.write(str(os.getpid()))
-        debug(f"Acquired lock for {_lockfile} (PID {os.getpid()})")
+        _lockfiles.add(lockfile)
+        debug(f"Acquired lock for {lockfile} (PID {os.getpid()})")
         return True
     except IOError as e:
         error(f"Failed to create lockfile: {e}")
         return False
 
 
-def release_lock():
-    """Release the lockfile."""
-    try:
-        if os.path.exists(_lockfile):
-            # Verify it's our lockfile before removing
-            with open(_lockfile, 'r') as f:
-                pid = int(f.read().strip())
-            if pid == os.getpid():
-                os.remove(_lockfile)
-                debug(f"Released lock for {_lockfile} (PID {os.getpid()})")
-            else:
-                debug(f"Not removing lockfile - belongs to PID {pid}, not {os.getpid()}")
-    except (ValueError, IOError, OSError) as e:
-        debug(f"Error releasing lock: {e}")
+def release_lock(lockfile=None):
+    """Release a lockfile, or every lockfile held by this process if none given.
+
+    Releasing everything means the run is over, so the SSH master connections
+    are torn down as well.
+    """
+    if lockfile is None:
+        close_ssh_masters()
+
+    lockfiles = [lockfile] if lockfile else list(_lockfiles)
+    for path in lockfiles:
+        _lockfiles.discard(path)
+        try:
+            if os.path.exists(path):
+                # Verify it's our lockfile before removing
+                with open(path, 'r') as f:
+                    pid = int(f.read().strip())
+                if pid == os.getpid():
+                    os.remove(path)
+                    debug(f"Released lock for {path} (PID {os.getpid()})")
+                else:
+                    debug(f"Not removing lockfile - belongs to PID {pid}, not {os.getpid()}")
+        except (ValueError, IOError, OSError) as e:
+            debug(f"Error releasing lock: {e}")
+
+
+def stop_pipelines():
+    """Terminate every running send/receive pipeline and keep new ones from starting.
+
+    Waits for the processes to exit (killing those that don't within
+    PIPELINE_STOP_TIMEOUT), so nothing is still receiving once this returns.
+    """
+    with _pipelines_lock:
+        _stopping.set()
+        procs = list(_pipelines)
+    for proc in procs:
+        if proc.poll() is None:
+            proc.terminate()
+    for proc in procs:
+        try:
+            proc.wait(timeout=PIPELINE_STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
 
 
 def signal_handler(signum, frame):
-    """Handle termination signals by cleaning up lockfile."""
+    """Handle termination signals: stop the transfers, then exit.
+
+    The pipelines are stopped first; exiting then shuts down the worker pool
+    (see run_pull_queue()), and the lockfiles are only released by the atexit
+    handler after that, so no other run can start on a dataset still being
+    received here.
+    """
     signal_names = {
         signal.SIGTERM: 'SIGTERM',
         signal.SIGINT: 'SIGINT',
         signal.SIGHUP: 'SIGHUP'
     }
+    if _stopping.is_set():
+        debug(f"Received {signal_names.get(signum, signum)}, already stopping")
+        return
     debug(f"Received {signal_names.get(signum, signum)}, cleaning up...")
-    release_lock()
+    stop_pipelines()
     sys.exit(1)
 
 
-def preflight(host, name, datasets, user, destination):
+def open_ssh_master(user, host):
+    """Open a persistent, multiplexed SSH connection to user@host.
+
+    Every later ssh_command() for the same user@host reuses this connection's
+    control socket instead of paying for a new key exchange. ControlPersist
+    bounds how long an orphaned master can outlive a crashed run. A master
+    that is already open and alive is reused.
+    Returns (True, None) on success, or (False, stderr) if the connection failed.
+    """
+    with _ssh_lock:
+        return _open_ssh_master(user, host)
+
+
+def _open_ssh_master(user, host):
+    global _ssh_control_dir
+    if _ssh_control_dir is None:
+        _ssh_control_dir = tempfile.mkdtemp(prefix='zfs-pull-backups-ssh-')
+
+    target = f"{user}@{host}"
+    if target in _ssh_masters:
+        check = run_command(['ssh', '-S', _ssh_masters[target], '-O', 'check', target],
+                            capture_output=True, check=False)
+        if check.returncode == 0:
+            return True, None
+
+    control_path = os.path.join(_ssh_control_dir, f"{len(os.listdir(_ssh_control_dir))}.sock")
+    command = f"ssh -M -S {control_path} -o ControlPersist={SSH_CONTROL_PERSIST} -f -N {target}"
+
+    debug(command)
+
+    # ssh -f forks into the background and keeps its stdio open, so capturing
+    # through a pipe would block until the master exits; use a file instead.
+    with tempfile.TemporaryFile() as stderr:
+        result = run_command(
+            command.split(' '),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=stderr,
+            check=False
+        )
+        if result.returncode != 0:
+            stderr.seek(0)
+            return False, stderr.read().decode().strip()
+
+    _ssh_masters[target] = control_path
+    debug(f"Opened SSH master connection to {target}")
+    return True, None
+
+
+def ssh_command(user, host):
+    """Return the ssh command prefix used for every remote command on user@host."""
+    control_path = _ssh_masters.get(f"{user}@{host}")
+    if control_path:
+        return f"ssh -S {control_path} {user}@{host}"
+    return f"ssh {user}@{host}"
+
+
+def close_ssh_masters():
+    """Tear down every SSH master connection opened by this run."""
+    global _ssh_control_dir
+    profile_phase('cleanup')
+    for target, control_path in list(_ssh_masters.items()):
+        run_command(['ssh', '-S', control_path, '-O', 'exit', target],
+                    capture_output=True, check=False)
+        del _ssh_masters[target]
+        debug(f"Closed SSH master connection to {target}")
+
+    if _ssh_control_dir is not None:
+        shutil.rmtree(_ssh_control_dir, ignore_errors=True)
+        _ssh_control_dir = None
+
+
+def preflight(host, name, datasets, user, destination, jobs=DEFAULT_jobs, critical=None):
+    profile_phase('preflight')
     info('Checking remote host is up')
-    result = subprocess.run(['ssh', f'{user}@{host}', 'ls'],
-            shell=False,
-            check=False,
-            capture_output=True
-            )
-    if result.returncode != 0:
-        error(f'Could not connect to {host}\n  ssh: {result.stderr.decode().strip()}')
+    connected, ssh_error = open_ssh_master(user, host)
+    if not connected:
+        error(f'Could not connect to {host}\n  ssh: {ssh_error}')
         sys.exit(1)
     info(f'{host} is up')
 
     for dataset in datasets:
         debug(f'Checking remote source {dataset} exists')
-        result = subprocess.run(
-            ['ssh', f'{user}@{host}', f'zfs list {dataset}'],
+        result = run_command(
+            ssh_command(user, host).split(' ') + [f'zfs list {dataset}'],
             shell=False,
             check=False,
             capture_output=True
@@ -142,8 +507,22 @@ def preflight(host, name, datasets, user, destination):
             sys.exit(1)
         debug(f'{dataset} exists')
 
+    for tool in stage_tools():
+        debug(f'Checking {tool} is available locally and on {host}')
+        if not shutil.which(tool):
+            error(f'{tool} is not installed locally')
+            sys.exit(1)
+        result = run_command(
+            ssh_command(user, host).split(' ') + [f'command -v {tool}'],
+            check=False,
+            capture_output=True
+            )
+        if result.returncode != 0:
+            error(f'{tool} is not installed on {host}')
+            sys.exit(1)
+
     debug(f'Checking local destination {destination} exists')
-    result = subprocess.run(['zfs', 'list', f'{destination}'],
+    result = run_command(['zfs', 'list', f'{destination}'],
             shell=False,
             check=False,
             capture_output=True
@@ -153,155 +532,1155 @@ def preflight(host, name, datasets, user, destination):
         sys.exit(1)
     debug(f'Destination {destination} exists')
 
-    pulldatasets_init(host, name, datasets, user, destination)
+    check_pool_features(host, datasets, user, destination)
+    check_raw_targets(host, name, datasets, user, destination)
+
+    pulldatasets_init(host, name, datasets, user, destination, jobs, critical)
+
+def check_pool_features(host, datasets, user, destination):
+    """Check the local pool can receive what the enabled send flags pass through.
 
-def get_remote_child_datasets(host, dataset, user):
-    """Get all datasets under a parent (including the parent itself)."""
-    command = f"ssh {user}@{host} zfs list -H -o name -r {dataset}"
+    Features are read from every source pool in one SSH command. A feature
+    the remote zfs doesn't know about can't be active there, so only
+    features reported as `active` are required locally.
+    """
+    features = sorted({feature for flag in _send_flags for feature in SEND_FLAGS[flag][1]})
+    if not features:
+        return
+
+    pools = sorted({dataset.split('/')[0] for dataset in datasets})
+    queries = [(pool, feature) for pool in pools for feature in features]
+    command = '; '.join(f"zpool get -H -o value feature@{feature} {pool} 2>/dev/null || echo -" for pool, feature in queries)
+    debug(f'Checking pool features on {host}: {", ".join(features)}')
+    result = run_command(
+        ssh_command(user, host).split(' ') + [command],
+        shell=False,
+        check=False,
+        capture_output=True
+        )
+    values = result.stdout.decode().split('\n')
+    if result.returncode != 0 or len(values) < len(queries):
+        error(f'Could not read pool features on {host}\n  zpool: {result.stderr.decode().strip()}')
+        sys.exit(1)
+
+    local_pool = destination.split('/')[0]
+    local_states = {}
+    for (pool, feature), value in zip(queries, values):
+        debug(f'  {pool}: feature@{feature} {value.strip()}')
+        if value.strip() != 'active':
+            continue
+        if feature not in local_states:
+            result = run_command(['zpool', 'get', '-H', '-o', 'value', f'feature@{feature}', local_pool],
+                    shell=False,
+                    check=False,
+                    capture_output=True
+                    )
+            local_states[feature] = result.stdout.decode().strip() if result.returncode == 0 else '-'
+        if local_states[feature] not in ('enabled', 'active'):
+            flags = ', '.join(f"--{flag.replace('_', '-')}" for flag in _send_flags if feature in SEND_FLAGS[flag][1])
+            error(f'{pool} on {host} uses feature@{feature}, which {local_pool} does not support ({flags})')
+            sys.exit(1)
+
+
+def check_raw_targets(host, name, datasets, user, destination):
+    """Check that --raw streams can be received into the encrypted datasets
+    already on the backup server; exits if not.
+
+    A raw incremental of an encrypted dataset only applies on top of a copy
+    that was received raw too, which keeps the client's encryption root. One
+    pulled without --raw was encrypted again under the local parent, and
+    every raw incremental into it would fail.
+    """
+    if 'raw' not in _send_flags:
+        return
+
+    command = f"{ssh_command(user, host)} zfs get -H -o name,value -t filesystem,volume -r encryptionroot {' '.join(datasets)}"
+    debug(command)
+    result = run_command(command.split(' '), check=False, capture_output=True)
+    if result.returncode != 0:
+        error(f'Could not read the encryption roots on {host}\n  zfs: {result.stderr.decode().strip()}')
+        sys.exit(1)
+    # Local counterpart of each encrypted remote dataset -> that of its encryption root
+    roots = {}
+    for line in result.stdout.decode().splitlines():
+        dataset, _, root = line.partition('\t')
+        if root != '-':
+            roots[f"{destination}/{name}/{dataset}"] = f"{destination}/{name}/{root}"
+    if not roots:
+        return
+
+    # Datasets not pulled yet are reported on stderr; the rest are still listed
+    result = run_command(['zfs', 'get', '-H', '-o', 'name,value', 'encryptionroot'] + sorted(roots),
+            shell=False,
+            check=False,
+            capture_output=True
+            )
+    # A raw receive makes a dataset its own encryption root, or with -R keeps
+    # it under the received copy of the client's root
+    mismatched = [dataset for dataset, _, root in (line.partition('\t') for line in result.stdout.decode().splitlines())
+                  if dataset in roots and root not in (dataset, roots[dataset])]
+    if mismatched:
+        error(f"--raw can't be used for encrypted datasets already pulled without it, as raw incrementals can't be received onto them:\n  "
+              + '\n  '.join(mismatched)
+              + "\n  Pull them without --raw, or destroy them on the backup server so the next pull starts them over raw")
+        sys.exit(1)
+
+
+# Properties fetched for every dataset and snapshot in a single listing
+INVENTORY_PROPERTIES = "name,guid,createtxg,creation,receive_resume_token,referenced,written,userrefs"
+
+
+def parse_inventory(output):
+    """Parse `zfs list -Hp -o <INVENTORY_PROPERTIES>` output into an index.
+
+    Returns a dict mapping each dataset (in listing order) to an entry with:
+      - snapshots: ordered by createtxg, each a dict with its short name
+        (without the "dataset@" prefix), guid, createtxg, creation time,
+        referenced bytes, bytes written since the previous snapshot and
+        number of holds
+      - bookmarks: ordered by createtxg, each with its short name, guid and createtxg
+      - resume_token: the dataset's receive_resume_token, or None
+    """
+    index = {}
+    for line in output.splitlines():
+        fields = line.split('\t')
+        if len(fields) < 8:
+            continue
+        full_name, guid, createtxg, creation, resume_token, referenced, written, userrefs = fields[:8]
+        if '#' in full_name:
+            dataset, _, bookmark = full_name.partition('#')
+            entry = index.setdefault(dataset, {'snapshots': [], 'bookmarks': [], 'resume_token': None})
+            entry['bookmarks'].append({'name': bookmark, 'guid': guid, 'createtxg': int(createtxg)})
+            continue
+        dataset, _, snapshot = full_name.partition('@')
+        entry = index.setdefault(dataset, {'snapshots': [], 'bookmarks': [], 'resume_token': None})
+        if snapshot:
+            entry['snapshots'].append({
+                'name': snapshot,
+                'guid': guid,
+                'createtxg': int(createtxg),
+                'creation': int(creation),
+                'referenced': int(referenced) if referenced.isdigit() else 0,
+                'written': int(written) if written.isdigit() else 0,
+                'userrefs': int(userrefs) if userrefs.isdigit() else 0,
+            })
+        elif resume_token != '-':
+            entry['resume_token'] = resume_token
+
+    for entry in index.values():
+        entry['snapshots'].sort(key=lambda s: s['createtxg'])
+        entry['bookmarks'].sort(key=lambda b: b['createtxg'])
+
+    return index
+
+
+def find_latest_common(source_snapshots, target_snapshots):
+    """Return the newest source snapshot that also exists on the target, or None.
+
+    Snapshots are matched by guid rather than name, so a snapshot that was
+    destroyed and recreated under the same name is not mistaken for a base
+    the target can receive an incremental on top of.
+    """
+    target_guids = {s['guid'] for s in target_snapshots}
+    for snapshot in reversed(source_snapshots):
+        if snapshot['guid'] in target_guids:
+            return snapshot
+    return None
+
+
+def find_bookmark_base(remote_entry, local_snapshots):
+    """Return the newest remote bookmark of a snapshot the target still has, or None.
+
+    Used when the client has pruned every snapshot the target shares with it:
+    an incremental can still be sent from the bookmark (with -i, as -I can't
+    start at a bookmark) as long as the target has the snapshot it marks and
+    the client has snapshots after it.
+    """
+    remote_snapshots = remote_entry['snapshots']
+    if not remote_snapshots:
+        return None
+    local_guids = {s['guid'] for s in local_snapshots}
+    for bookmark in reversed(remote_entry.get('bookmarks', [])):
+        if bookmark['guid'] in local_guids and bookmark['createtxg'] < remote_snapshots[-1]['createtxg']:
+            return bookmark
+    return None
+
+
+def get_remote_inventory(host, datasets, user):
+    """List every dataset, snapshot and bookmark under the source datasets in one SSH round trip."""
+    command = f"{ssh_command(user, host)} zfs list -t filesystem,volume,snapshot,bookmark -Hp -o {INVENTORY_PROPERTIES} -r {' '.join(datasets)}"
 
     debug(command)
 
     try:
-        result = subprocess.run(
+        result = run_command(
             command.split(' '),
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             check=True
         )
-        datasets = result.stdout.decode().strip().splitlines()
+        index = parse_inventory(result.stdout.decode())
 
-        debug(f"Found {len(datasets)} datasets under {dataset}")
+        debug(f"Found {len(index)} remote datasets, {sum(len(e['snapshots']) for e in index.values())} snapshots")
 
-        return datasets
+        return index
 
     except subprocess.CalledProcessError as e:
         error(f"Could not list remote datasets:\n{e.stderr.decode()}")
         sys.exit(1)
 
 
-def pulldatasets_init(host, name, datasets, user, destination):
-    # Expand each dataset to include all children
-    all_datasets = []
-    for dataset in datasets:
-        children = get_remote_child_datasets(host, dataset, user)
-        all_datasets.extend(children)
-
-    # Remove duplicates while preserving order
-    seen = set()
-    unique_datasets = []
-    for ds in all_datasets:
-        if ds not in seen:
-            seen.add(ds)
-            unique_datasets.append(ds)
-
-    info(f"Datasets in queue: {len(unique_datasets)}")
-    for dataset in unique_datasets:
-        info(f'{host}:{dataset}')
-        pulldatasets(host, name, dataset, user, destination)
+def get_local_inventory(dataset):
+    """List every dataset and snapshot under a local dataset, or {} if it doesn't exist yet."""
+    command = f"zfs list -t filesystem,volume,snapshot -Hp -o {INVENTORY_PROPERTIES} -r {dataset}"
+
+    debug(command)
+
+    result = run_command(
+        command.split(' '),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=False  # Don't fail if dataset doesn't exist
+    )
+    if result.returncode != 0:
+        return {}  # Dataset doesn't exist yet
 
-def get_remote_snapshots(host, dataset, user):
-    """Get all snapshot names for a dataset on remote host, sorted by creation time."""
-    command = f"ssh {user}@{host} zfs list -t snapshot -H -o name -s creation -r {dataset}"
+    return parse_inventory(result.stdout.decode())
 
+
+def bootstrap_chain(snapshots, mode):
+    """Snapshots an initial sync of a dataset sends, oldest first.
+
+    history sends the earliest snapshot and then everything up to the latest
+    with -I; the other modes send only their snapshots, each as an -i
+    incremental on the one before, so the history in between is skipped.
+    """
+    if mode == 'latest' or len(snapshots) == 1:
+        return [snapshots[-1]]
+    if mode == 'anchors':
+        # Snapshot names end in their type, e.g. autosnap_2025-01-01_00:25:00_yearly
+        return [s for s in snapshots[:-1] if s['name'].rsplit('_', 1)[-1] in _bootstrap_anchors] + [snapshots[-1]]
+    return [snapshots[0], snapshots[-1]]
+
+
+def plan_transfer(dataset, remote_entry, local_entry, bootstrap=DEFAULT_bootstrap):
+    """Work out what pulling one dataset involves, without running anything.
+
+    Returns a plan item with the dataset, the kind of transfer (full,
+    incremental, resume or none), the snapshots it sends, the estimated bytes
+    and the creation time of the newest snapshot already received (None if
+    there is none). A full transfer also gets the snapshots its bootstrap mode
+    sends (chain). Sizes come from the inventory: a snapshot's `written` is
+    what changed since the previous one, so summing it over the snapshots to be
+    sent gives the remote's `written@<base>` at the latest snapshot, and a full
+    send adds the `referenced` size of the first snapshot. Skipping history
+    sends at most the target's `referenced` per step, which caps the estimate.
+    """
+    remote_snapshots = remote_entry['snapshots']
+    local_snapshots = local_entry['snapshots'] if local_entry else []
+    item = {
+        'dataset': dataset,
+        'kind': 'none',
+        'base': None,
+        'first': remote_snapshots[0]['name'] if remote_snapshots else None,
+        'latest': remote_snapshots[-1]['name'] if remote_snapshots else None,
+        'bytes': 0,
+        'newest_local': local_snapshots[-1]['creation'] if local_snapshots else None,
+        'resume_token': None,
+        'chain': None,
+        'bootstrap': bootstrap,
+    }
+
+    if local_entry and local_entry['resume_token']:
+        # What the resumed stream still has to deliver isn't in the listing
+        item.update(kind='resume', bytes=None, resume_token=local_entry['resume_token'])
+        return item
+    if not remote_snapshots:
+        return item
+
+    common = find_latest_common(remote_snapshots, local_snapshots)
+    bookmark = find_bookmark_base(remote_entry, local_snapshots) if common is None else None
+    if bookmark is not None:
+        after = [s for s in remote_snapshots if s['createtxg'] > bookmark['createtxg']]
+        item.update(kind='incremental', base=f"#{bookmark['name']}", first=after[0]['name'],
+                    bytes=sum(s['written'] for s in after))
+    elif common is None and bootstrap == 'history':
+        item.update(kind='full', chain=[s['name'] for s in bootstrap_chain(remote_snapshots, bootstrap)],
+                    bytes=remote_snapshots[0]['referenced'] + sum(s['written'] for s in remote_snapshots[1:]))
+    elif common is None:
+        chain = bootstrap_chain(remote_snapshots, bootstrap)
+        size = chain[0]['referenced']
+        for previous, snapshot in zip(chain, chain[1:]):
+            written = sum(s['written'] for s in remote_snapshots
+                          if previous['createtxg'] < s['createtxg'] <= snapshot['createtxg'])
+            size += min(written, snapshot['referenced'])
+        item.update(kind='full', chain=[s['name'] for s in chain], bytes=size)
+    elif common is not remote_snapshots[-1]:
+        position = remote_snapshots.index(common)
+        item.update(kind='incremental', base=common['name'],
+                    bytes=sum(s['written'] for s in remote_snapshots[position + 1:]))
+    return item
+
+
+def estimate_send_sizes(host, user, plan):
+    """Replace the plan's estimates with `zfs send -nvP` dry runs on the remote.
+
+    All dry runs go through one SSH command; each dataset's output is preceded
+    by a marker line so failed estimates can't shift the rest.
+    """
+    commands = []
+    for item in plan:
+        dataset = item['dataset']
+        if item['kind'] == 'resume':
+            sends = [f"-t {item['resume_token']}"]
+        elif item['kind'] == 'incremental' and item['base'].startswith('#'):
+            sends = [f"-i {dataset}{item['base']} {dataset}@{item['first']}"]
+            if item['first'] != item['latest']:
+                sends.append(f"-I {dataset}@{item['first']} {dataset}@{item['latest']}")
+        elif item['kind'] == 'incremental':
+            sends = [f"-I {dataset}@{item['base']} {dataset}@{item['latest']}"]
+        elif item['kind'] == 'full':
+            # Same steps as the transfer: the first snapshot of the chain, then
+            # everything after it (history) or each following chain snapshot
+            chain = item['chain']
+            sends = [f"{dataset}@{chain[0]}"]
+            option = '-I' if item['bootstrap'] == 'history' else '-i'
+            sends.extend(f"{option} {dataset}@{a} {dataset}@{b}" for a, b in zip(chain, chain[1:]))
+        else:
+            continue
+        commands.append(f"echo '#{dataset}'")
+        commands.extend(f"zfs send -nvP{send_flags(args)} {args} 2>&1" for args in sends)
+    if not commands:
+        return
+
+    command = '; '.join(commands)
     debug(command)
+    result = run_command(ssh_command(user, host).split(' ') + [command], capture_output=True, check=False)
+
+    sizes = {}
+    dataset = None
+    for line in result.stdout.decode().splitlines():
+        if line.startswith('#'):
+            dataset = line[1:]
+            continue
+        parts = line.split()
+        if dataset and len(parts) == 2 and parts[0] == 'size' and parts[1].isdigit():
+            sizes[dataset] = sizes.get(dataset, 0) + int(parts[1])
+
+    for item in plan:
+        if item['dataset'] in sizes:
+            item['bytes'] = sizes[item['dataset']]
+        elif item['kind'] != 'none':
+            debug(f"No send estimate for {item['dataset']}, keeping {item['bytes']}")
+
 
+def is_critical(dataset, critical=None):
+    """Whether dataset, or one of its ancestors, is in critical (default: --critical)."""
+    critical = _critical if critical is None else critical
+    parts = dataset.split('/')
+    return any('/'.join(parts[:i]) in critical for i in range(len(parts), 0, -1))
+
+
+def order_plan(plan, order, critical=None):
+    """Return the plan sorted for the executor. Ties keep listing order.
+
+    Unknown sizes (resumes) sort after every estimate with --order smallest;
+    datasets never received count as the stalest with --order staleness.
+    """
+    if order == 'smallest':
+        return sorted(plan, key=lambda item: float('inf') if item['bytes'] is None else item['bytes'])
+    if order == 'policy':
+        return sorted(plan, key=lambda item: not is_critical(item['dataset'], critical))
+    if order == 'staleness':
+        return sorted(plan, key=lambda item: item['newest_local'] or 0)
+    return list(plan)
+
+
+def get_observed_rate(host):
+    """Average throughput (bytes/second) of recent successful pulls from host,
+    taken from the metrics log, or None if there is no usable history."""
+    if not _metrics_log:
+        return None
     try:
-        result = subprocess.run(
-            command.split(' '),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True
-        )
-        snapshots = result.stdout.decode().strip().splitlines()
-        # Filter to only direct snapshots of this dataset (not child datasets)
-        direct_snapshots = [s.split("@")[1] for s in snapshots if s.startswith(f"{dataset}@")]
+        with open(_metrics_log, 'rb') as f:
+            # Only the tail matters; the log grows forever
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 256 * 1024))
+            lines = f.read().decode(errors='replace').splitlines()[1:]
+    except OSError:
+        return None
 
-        debug(f"Found {len(direct_snapshots)} remote snapshots")
+    total_bytes = total_seconds = 0
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        # Tiny transfers are dominated by setup time and say little about throughput
+        if (record.get('direction') == 'pull' and record.get('host') == host and record.get('ok')
+                and record.get('bytes', 0) >= 1024 * 1024 and record.get('seconds')):
+            total_bytes += record['bytes']
+            total_seconds += record['seconds']
+    return total_bytes / total_seconds if total_seconds else None
+
+
+def format_bytes(size_bytes):
+    """Format bytes as human-readable string."""
+    for unit in ['B', 'KiB', 'MiB', 'GiB', 'TiB']:
+        if abs(size_bytes) < 1024:
+            return f"{size_bytes:.1f} {unit}"
+        size_bytes /= 1024
+    return f"{size_bytes:.1f} PiB"
+
+
+def format_duration(seconds):
+    """Format seconds as human-readable duration."""
+    if seconds < 60:
+        return f"{int(seconds)}s"
+    elif seconds < 3600:
+        mins = int(seconds // 60)
+        secs = int(seconds % 60)
+        return f"{mins}m {secs}s"
+    else:
+        hours = int(seconds // 3600)
+        mins = int((seconds % 3600) // 60)
+        return f"{hours}h {mins}m"
 
-        return direct_snapshots
 
-    except subprocess.CalledProcessError as e:
-        error(f"Could not list remote snapshots:\n{e.stderr.decode()}")
-        sys.exit(1)
+def print_plan(host, plan, jobs):
+    """Print the pending transfers in execution order with total size and ETA.
 
+    The ETA assumes the throughput seen in recent pulls from this host (times
+    the number of jobs), capped by --bwlimit.
+    """
+    pending = [item for item in plan if item['kind'] != 'none']
+    if not pending:
+        info(f"Plan: nothing to transfer, {len(plan)} datasets up to date")
+        return
+
+    total = sum(item['bytes'] or 0 for item in pending)
+    summary = f"Plan: {len(pending)} transfers, {format_bytes(total)} estimated"
+    rate = get_observed_rate(host)
+    if rate:
+        rate *= max(1, min(jobs, len(pending)))
+    if _bwlimit_bytes:
+        rate = min(rate, _bwlimit_bytes) if rate else _bwlimit_bytes
+    if rate:
+        summary += f", ETA {format_duration(total / rate)} at {format_bytes(rate)}/s"
+    info(summary)
+
+    for item in pending:
+        size = 'unknown' if item['bytes'] is None else format_bytes(item['bytes'])
+        info(f"  {item['kind']:<11} {size:>11}  {item['dataset']}")
+    debug(f"{len(plan) - len(pending)} datasets up to date")
+
+
+def get_journal_path(name):
+    """Path of the replication journal for pulls from one host, or None if disabled."""
+    if not _journal_dir:
+        return None
+    safe_name = re.sub(r'[^a-zA-Z0-9.-]', '-', name)
+    return os.path.join(_journal_dir, f"pull-{safe_name}.json")
 
-def get_local_snapshots(dataset):
-    """Get all snapshot names for a local dataset, sorted by creation time."""
-    command = f"zfs list -t snapshot -H -o name -s creation -r {dataset}"
+
+def load_journal(path):
+    """Load a replication journal: {dataset: {snapshot, guid, createtxg}} of the
+    newest snapshot last replicated. A missing or unreadable journal is empty."""
+    if not path:
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        debug(f"Ignoring unreadable journal {path}: {e}")
+        return {}
+
+
+def save_journal(path, updates, removed):
+    """Apply this run's changes to the journal on disk.
+
+    The file is re-read first so that entries written by an overlapping run for
+    the same host are kept, and replaced atomically.
+    """
+    if not path or not (updates or removed):
+        return
+    journal = load_journal(path)
+    journal.update(updates)
+    for dataset in removed:
+        journal.pop(dataset, None)
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(journal, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        error(f"Could not write journal {path}: {e}")
+
+
+def get_remote_newest_snapshots(host, datasets, user):
+    """Return {dataset: newest snapshot {name, guid, createtxg} or None} under the
+    source datasets.
+
+    The remote side still walks its snapshots, but only one line per dataset
+    comes back over SSH, which is all that's needed to tell whether anything
+    changed since the journal was written.
+    """
+    newest_only = "awk -F'\\t' '{split($1, p, \"@\"); if (p[2] == \"\") print; else last[p[1]] = $0} END {for (d in last) print last[d]}'"
+    command = f"zfs list -t filesystem,volume,snapshot -Hp -o name,guid,createtxg -s createtxg -r {' '.join(datasets)} | {newest_only}"
 
     debug(command)
 
+    result = run_command(
+        ssh_command(user, host).split(' ') + [command],
+        capture_output=True,
+        check=False
+    )
+    if result.returncode != 0:
+        debug(f"Could not probe remote snapshots: {result.stderr.decode().strip()}")
+        return {}
+
+    newest = {}
+    for line in result.stdout.decode().splitlines():
+        fields = line.split('\t')
+        if len(fields) < 3:
+            continue
+        dataset, _, snapshot = fields[0].partition('@')
+        if snapshot:
+            newest[dataset] = {'name': snapshot, 'guid': fields[1], 'createtxg': int(fields[2])}
+        else:
+            newest.setdefault(dataset, None)
+    return newest
+
+
+def get_journal_matches(journal, newest, local_prefix):
+    """Return the datasets with nothing to pull: those whose newest remote
+    snapshot is the one the journal recorded and which still hold that snapshot
+    locally, plus those without any remote snapshots.
+
+    The local side is checked with a single `zfs get` of the journalled
+    snapshots, so a rolled back or destroyed backup is not taken on trust.
+    """
+    matches = {dataset for dataset, snapshot in newest.items() if snapshot is None}
+    candidates = [
+        dataset for dataset, snapshot in newest.items()
+        if snapshot and journal.get(dataset, {}).get('guid') == snapshot['guid']
+    ]
+    if not candidates:
+        return matches
+
+    snapshots = {f"{local_prefix}/{dataset}@{newest[dataset]['name']}": dataset for dataset in candidates}
+    command = ['zfs', 'get', '-H', '-p', '-o', 'name,value', 'guid'] + list(snapshots)
+    debug(' '.join(command))
+    # Snapshots that don't exist are reported on stderr; the rest are still listed
+    result = run_command(command, capture_output=True, check=False)
+
+    for line in result.stdout.decode().splitlines():
+        full_name, _, guid = line.partition('\t')
+        dataset = snapshots.get(full_name)
+        if dataset and guid == newest[dataset]['guid']:
+            matches.add(dataset)
+    return matches
+
+
+def plan_recursive(root, tree, remote_index, local_index, local_prefix, bootstrap=DEFAULT_bootstrap):
+    """Decide whether a root and all its children can be pulled as one
+    `zfs send -R` replication stream.
+
+    That is only safe when the tree moves in lockstep: every remote child's
+    newest snapshot is the root's latest snapshot, no receive is waiting to be
+    resumed, and each child already received has the root's base snapshot
+    (same guid) as its newest. New children are fine, a replication stream
+    creates them. A full replication stream carries every snapshot, so a tree
+    whose root is bootstrapped without its history is pulled per dataset.
+    Returns {'kind', 'base', 'latest'} (kind full, incremental or none), or
+    None with the reason logged if the tree has to be pulled per dataset.
+    """
+    remote_root = remote_index[root]['snapshots']
+    if not remote_root:
+        debug(f"{root}: no remote snapshots, pulling per dataset")
+        return None
+    latest = remote_root[-1]
+    local_root = local_index.get(f"{local_prefix}/{root}")
+
+    for dataset in tree:
+        local_entry = local_index.get(f"{local_prefix}/{dataset}")
+        if local_entry and local_entry['resume_token']:
+            debug(f"{dataset} has an interrupted receive, pulling {root} per dataset")
+            return None
+        snapshots = remote_index[dataset]['snapshots']
+        if not snapshots or snapshots[-1]['name'] != latest['name']:
+            debug(f"{dataset} is not at '{latest['name']}', pulling {root} per dataset")
+            return None
+
+    if local_root is None:
+        if any(f"{local_prefix}/{dataset}" in local_index for dataset in tree):
+            debug(f"Parts of {root} were already received, pulling it per dataset")
+            return None
+        if bootstrap != 'history':
+            debug(f"{root} is new and bootstrapped from {bootstrap}, pulling it per dataset")
+            return None
+        return {'kind': 'full', 'base': None, 'latest': latest['name']}
+
+    common = find_latest_common(remote_root, local_root['snapshots'])
+    if common is None:
+        debug(f"{root} has no common snapshot, pulling it per dataset")
+        return None
+
+    up_to_date = True
+    for dataset in tree:
+        local_entry = local_index.get(f"{local_prefix}/{dataset}")
+        if local_entry is None:
+            up_to_date = False
+            continue
+        remote_snapshots = {s['name']: s for s in remote_index[dataset]['snapshots']}
+        local_guids = {s['guid'] for s in local_entry['snapshots']}
+        base = remote_snapshots.get(common['name'])
+        if base is None or base['guid'] not in local_guids:
+            debug(f"{dataset} diverged from '{common['name']}', pulling {root} per dataset")
+            return None
+        if remote_snapshots[latest['name']]['guid'] in local_guids:
+            continue
+        up_to_date = False
+        if local_entry['snapshots'][-1]['guid'] != base['guid']:
+            debug(f"{dataset} has snapshots after '{common['name']}', pulling {root} per dataset")
+            return None
+
+    if up_to_date:
+        return {'kind': 'none', 'base': common['name'], 'latest': latest['name']}
+    return {'kind': 'incremental', 'base': common['name'], 'latest': latest['name']}
+
+
+def pull_recursive(host, name, root, tree, user, destination, plan):
+    """Pull a whole tree with one replication stream. Returns True on success.
+
+    The per-dataset locks of every dataset in the tree are held for the
+    duration, so an overlapping per-dataset run can't receive into it.
+    No -F: with a replication stream it would also destroy every snapshot
+    the client has pruned, and the backups keep their own history.
+    No -s either, as replication streams can't be resumed.
+    """
+    local_root = f"{destination}/{name}/{root}"
+    lockfiles = []
     try:
-        result = subprocess.run(
-            command.split(' '),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=False  # Don't fail if dataset doesn't exist
+        for dataset in tree:
+            lockfile = get_lockfile_path(name, dataset)
+            if not acquire_lock(lockfile):
+                info(f"{dataset} is being pulled by another instance, pulling {root} per dataset")
+                return False
+            lockfiles.append(lockfile)
+
+        info(f"{host}:{root} - replicating {len(tree)} datasets with one stream")
+        if plan['kind'] == 'full':
+            if not ensure_parent_datasets_exist(local_root):
+                return False
+            info(f"Pulling '{plan['latest']}' and all earlier snapshots")
+            send_cmd = remote_send_command(user, host, f"-R {root}@{plan['latest']}")
+        else:
+            info(f"Updating from '{plan['base']}' to '{plan['latest']}'")
+            send_cmd = remote_send_command(user, host, f"-R -I {root}@{plan['base']} {root}@{plan['latest']}")
+
+        if not send_and_receive(send_cmd, f"zfs receive -u {local_root}", host, root, f"{plan['kind']}-recursive"):
+            return False
+        for dataset in tree:
+            mark_local_dataset(f"{destination}/{name}/{dataset}")
+        info(f"Success. Latest snapshot is now '{plan['latest']}'.")
+        return True
+    finally:
+        for lockfile in lockfiles:
+            release_lock(lockfile)
+
+
+def pull_recursive_roots(host, name, roots, user, destination, remote_index, local_index, unchanged, bootstrap):
+    """Replicate each root that allows it (see plan_recursive) as one stream.
+
+    Returns the datasets that are now up to date. Trees that can't be
+    replicated in one go, or whose stream fails, are left to the per-dataset
+    queue, which picks up from whatever state the stream left behind.
+    bootstrap maps each dataset to its initial sync mode.
+    """
+    done = set()
+    local_prefix = f"{destination}/{name}"
+    # A root nested under another root is covered by the outer one
+    top_roots = [r for r in roots if not any(r.startswith(other + '/') for other in roots)]
+
+    for root in top_roots:
+        if root not in remote_index:
+            continue
+        tree = [d for d in remote_index if d == root or d.startswith(root + '/')]
+        if all(dataset in unchanged for dataset in tree):
+            done.update(tree)
+            continue
+
+        plan = plan_recursive(root, tree, remote_index, local_index, local_prefix, bootstrap[root])
+        if plan is None:
+            continue
+        if plan['kind'] == 'none':
+            debug(f"{root}: all {len(tree)} datasets up to date")
+            done.update(tree)
+            continue
+        if _plan_only:
+            info(f"Plan: {root} as one {plan['kind']} replication stream of {len(tree)} datasets")
+            done.update(tree)
+            continue
+
+        if pull_recursive(host, name, root, tree, user, destination, plan):
+            done.update(tree)
+        else:
+            info(f"Falling back to pulling {root} per dataset")
+            local_index.update(get_local_inventory(f"{local_prefix}/{root}"))
+
+    return done
+
+
+def protect_bases(host, user, remote_index, datasets):
+    """Protect the newest snapshot of each dataset on the remote as the base of
+    the next incremental (see PROTECT_MODES), in one SSH command.
+
+    The protection of older snapshots is dropped only after the new one is in
+    place. Failures are reported but don't fail the pull; at worst the next
+    pull has to start over if the client prunes its base first.
+    """
+    commands = []
+    for dataset in sorted(datasets):
+        entry = remote_index[dataset]
+        if not entry['snapshots']:
+            continue
+        latest = entry['snapshots'][-1]
+        if _protect == 'hold':
+            # Only snapshots with holds can carry ours; other tags' holds are left alone
+            commands.append(f"zfs hold {_protect_tag} {dataset}@{latest['name']}")
+            commands.extend(f"zfs release {_protect_tag} {dataset}@{s['name']} 2>/dev/null"
+                            for s in entry['snapshots'][:-1] if s['userrefs'])
+        else:
+            bookmark = f"{_protect_tag}_{latest['name']}"
+            stale = [b['name'] for b in entry['bookmarks']
+                     if b['name'].startswith(f"{_protect_tag}_") and b['name'] != bookmark]
+            if bookmark not in {b['name'] for b in entry['bookmarks']}:
+                commands.append(f"zfs bookmark {dataset}@{latest['name']} {dataset}#{bookmark}"
+                                + ''.join(f" && zfs destroy {dataset}#{b}" for b in stale))
+            else:
+                commands.extend(f"zfs destroy {dataset}#{b}" for b in stale)
+    if not commands:
+        return
+
+    command = '; '.join(commands)
+    debug(command)
+    result = run_command(
+        ssh_command(user, host).split(' ') + [command],
+        shell=False,
+        check=False,
+        capture_output=True
         )
-        if result.returncode != 0:
-            return []  # Dataset doesn't exist yet
+    # Holds placed by an earlier run that stopped before releasing the old ones
+    problems = [line for line in result.stderr.decode().splitlines() if line and 'tag already exists' not in line]
+    if problems:
+        error(f"Could not protect every incremental base on {host} with a {_protect}:\n  " + '\n  '.join(problems))
+    else:
+        debug(f"Protected the newest snapshot of {len(datasets)} datasets with a {_protect}")
+
+
+def pulldatasets_init(host, name, datasets, user, destination, jobs=DEFAULT_jobs, critical=None):
+    # The journal records what the last run replicated; when a cheap probe of the
+    # remote's newest snapshots agrees with it for every dataset, nothing moved
+    # and the full listings can be skipped.
+    profile_phase('journal')
+    journal_path = get_journal_path(name)
+    journal = load_journal(journal_path)
+    unchanged = set()
+    if journal:
+        newest = get_remote_newest_snapshots(host, datasets, user)
+        unchanged = get_journal_matches(journal, newest, f"{destination}/{name}")
+        debug(f"{len(unchanged)} of {len(newest)} datasets unchanged since the last run")
+        if newest and len(unchanged) == len(newest):
+            info(f"All {len(newest)} datasets unchanged since the last run")
+            return
 
-        snapshots = result.stdout.decode().strip().splitlines()
-        # Filter to only direct snapshots of this dataset (not child datasets)
-        direct_snapshots = [s.split("@")[1] for s in snapshots if s.startswith(f"{dataset}@")]
+    # One listing per side drives the whole run: the remote index expands each
+    # dataset to include all children, the local index gives what we already have.
+    profile_phase('listing')
+    remote_index = get_remote_inventory(host, datasets, user)
 
-        debug(f"Found {len(direct_snapshots)} local snapshots")
+    local_index = {}
+    for dataset in datasets:
+        local_index.update(get_local_inventory(f"{destination}/{name}/{dataset}"))
+    load_local_datasets(destination, name)
+
+    # critical datasets (and their children) can be bootstrapped differently
+    critical = _critical if critical is None else set(critical)
+    bootstrap = {dataset: _bootstrap_critical if is_critical(dataset, critical) else _bootstrap
+                 for dataset in remote_index}
+
+    finished = set()
+    skipped = set()
+    if _recursive:
+        profile_phase('transfer')
+        finished = pull_recursive_roots(host, name, datasets, user, destination, remote_index, local_index, unchanged, bootstrap)
+
+    unique_datasets = [dataset for dataset in remote_index if dataset not in unchanged and dataset not in finished]
+
+    # Plan every transfer up front, then hand the executor the queue in the
+    # chosen order (children still wait for their parents)
+    profile_phase('planning')
+    plan = [
+        plan_transfer(dataset, remote_index[dataset], local_index.get(f"{destination}/{name}/{dataset}"), bootstrap[dataset])
+        for dataset in unique_datasets
+    ]
+    if _estimate == 'send':
+        estimate_send_sizes(host, user, plan)
+    plan = order_plan(plan, _order, critical)
+    print_plan(host, plan, jobs)
+    if _plan_only:
+        return
+    unique_datasets = [item['dataset'] for item in plan]
+
+    info(f"Datasets in queue: {len(unique_datasets)}" + (f" ({len(unchanged)} unchanged)" if unchanged else ""))
+    if jobs > 1:
+        info(f"Pulling with {jobs} parallel jobs")
+
+    profile_phase('transfer')
+    ok = run_pull_queue(host, name, unique_datasets, user, destination, jobs, remote_index, local_index, finished, bootstrap, skipped)
+    # Datasets skipped for another instance's lock are that instance's to
+    # protect and journal; this run didn't transfer them
+    if _protect != 'none':
+        profile_phase('protect')
+        protect_bases(host, user, remote_index, finished - unchanged)
+
+    profile_phase('journal')
+
+    updates = {}
+    for dataset in finished:
+        snapshots = remote_index[dataset]['snapshots']
+        if snapshots:
+            newest = snapshots[-1]
+            updates[dataset] = {'snapshot': newest['name'], 'guid': newest['guid'], 'createtxg': newest['createtxg']}
+    save_journal(journal_path, updates, set(unique_datasets) - finished - skipped)
+
+    if not ok:
+        sys.exit(1)
 
-        return direct_snapshots
 
-    except Exception as e:
-        error(f"Could not get local snapshots: {e}")
-        return []
+def pull_worker(host, name, dataset, user, destination, jobs, remote_entry, local_entry, bootstrap=DEFAULT_bootstrap):
+    """Pull a single dataset while holding its lockfile.
 
+    Returns True on success, False if the transfer failed, or SKIPPED if the
+    dataset is locked by another instance (which doesn't fail the run, as the
+    host lock used to).
+    """
+    if jobs > 1:
+        _context.prefix = f"[{dataset}] "
+
+    lockfile = get_lockfile_path(name, dataset)
+    if not acquire_lock(lockfile):
+        info(f"Skipping {dataset} - already being pulled by another instance")
+        return SKIPPED
 
-def send_and_receive(send_cmd, receive_cmd):
-    """Execute a zfs send | zfs receive pipeline using streaming (no memory buffering)."""
     try:
-        debug(f"{send_cmd}")
-        debug(f"{receive_cmd}")
+        info(f'{host}:{dataset}')
+        return pulldatasets(host, name, dataset, user, destination, remote_entry, local_entry, bootstrap)
+    finally:
+        release_lock(lockfile)
+
+
+def run_pull_queue(host, name, datasets, user, destination, jobs, remote_index, local_index, finished=None, bootstrap=None, skipped=None):
+    """Pull datasets through a bounded worker pool.
+
+    A child can only be received once its parent exists locally, so each
+    dataset waits until the nearest ancestor that is also queued has finished.
+    On the first failure nothing new is started, matching the serial behaviour
+    of stopping at the first failed transfer.
+    Datasets that succeeded are added to finished, if given, and those left to
+    another instance (locked, or below a locked dataset) to skipped. bootstrap
+    maps datasets to their initial sync mode (default: history).
+    Returns True if every dataset succeeded or was skipped.
+    """
+    queued = set(datasets)
+
+    def nearest_queued_ancestor(dataset):
+        parts = dataset.split('/')
+        for i in range(len(parts) - 1, 0, -1):
+            ancestor = '/'.join(parts[:i])
+            if ancestor in queued:
+                return ancestor
+        return None
 
-        # Create a true pipeline: send.stdout -> receive.stdin
-        # This streams data directly without buffering in memory
-        send_proc = subprocess.Popen(
-            send_cmd.split(' '),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
+    waiting = {dataset: nearest_queued_ancestor(dataset) for dataset in datasets}
+    if finished is None:
+        finished = set()
+    if skipped is None:
+        skipped = set()
+    running = {}
+    ok = True
+
+    # Not a with block: on a signal the queued futures are cancelled rather than
+    # started, and the running ones (whose pipelines were stopped) waited for
+    executor = ThreadPoolExecutor(max_workers=max(1, jobs))
+    try:
+        while waiting or running:
+            # The parent of these is being received by another instance
+            for dataset in sorted(waiting, key=lambda d: d.count('/')):
+                if waiting[dataset] in skipped:
+                    del waiting[dataset]
+                    skipped.add(dataset)
+                    info(f"Skipping {dataset} - its parent is being pulled by another instance")
+
+            if ok:
+                for dataset, ancestor in list(waiting.items()):
+                    if len(running) >= max(1, jobs):
+                        break
+                    if ancestor is None or ancestor in finished:
+                        del waiting[dataset]
+                        future = executor.submit(
+                            pull_worker, host, name, dataset, user, destination, jobs,
+                            remote_index[dataset],
+                            local_index.get(f"{destination}/{name}/{dataset}"),
+                            (bootstrap or {}).get(dataset, DEFAULT_bootstrap),
+                        )
+                        running[future] = dataset
+
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                dataset = running.pop(future)
+                result = future.result()
+                if result == SKIPPED:
+                    skipped.add(dataset)
+                elif result:
+                    finished.add(dataset)
+                else:
+                    ok = False
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    return ok
+
+def stage_tools():
+    """Programs the configured pipeline stages need on both ends."""
+    tools = []
+    if _compress:
+        tools.append(COMPRESSORS[_compress][0].split(' ')[0])
+    if _mbuffer_size:
+        tools.append('mbuffer')
+    return tools
+
+
+def send_stages():
+    """Shell pipeline appended to the remote zfs send (compressor, then buffer)."""
+    stages = []
+    if _compress:
+        stages.append(COMPRESSORS[_compress][0])
+    if _mbuffer_size:
+        stages.append(f"mbuffer -q -s {_mbuffer_block} -m {_mbuffer_size} 2>/dev/null")
+    return ''.join(f" | {stage}" for stage in stages)
+
+
+def receive_stages():
+    """Local commands run between ssh and zfs receive (buffer, then decompressor)."""
+    stages = []
+    if _mbuffer_size:
+        stages.append(f"mbuffer -q -s {_mbuffer_block} -m {_mbuffer_size}")
+    if _compress:
+        stages.append(COMPRESSORS[_compress][1])
+    return stages
+
+
+def send_flags(args):
+    """Flags from --raw/--compressed/--large-block, with a leading space.
+
+    A resumed send takes its flags from the token and refuses any others.
+    """
+    if not _send_flags or args.startswith('-t '):
+        return ''
+    return ' ' + ' '.join(SEND_FLAGS[flag][0] for flag in _send_flags)
+
+
+def remote_send_command(user, host, args):
+    """Build the ssh command that runs `zfs send <args>` on host, including send-side stages."""
+    return f"{ssh_command(user, host)} zfs send{send_flags(args)} {args}{send_stages()}"
+
+
+def parse_size_to_bytes(size_str):
+    """Parse a human-readable size string to bytes.
+
+    Supports formats like: 1.5G, 500M, 100K, 1T, 1.2GiB, etc.
+    """
+    size_str = size_str.strip().upper()
+    match = re.match(r'^([\d.]+)\s*([KMGTP])?I?B?$', size_str)
+    if not match:
+        return None
+
+    value = float(match.group(1))
+    unit = match.group(2) or ''
+    multipliers = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4, 'P': 1024 ** 5}
+    return int(value * multipliers[unit])
+
+
+def take_tokens(rate):
+    """Wait until the shared token bucket allows a write and take that allowance.
+
+    One bucket is shared by every transfer in the process, so the limit caps
+    their total rather than each one. It refills at rate bytes/second and
+    holds at most a quarter of a second's worth. Returns the bytes granted.
+    """
+    capacity = max(rate / 4, RELAY_MIN_CHUNK)
+    minimum = min(RELAY_MIN_CHUNK, capacity)
+    while True:
+        with _io_bucket_lock:
+            now = time.monotonic()
+            _io_bucket['tokens'] = min(capacity, _io_bucket['tokens'] + (now - _io_bucket['last']) * rate)
+            _io_bucket['last'] = now
+            if _io_bucket['tokens'] >= minimum:
+                granted = int(min(_io_bucket['tokens'], RELAY_CHUNK))
+                _io_bucket['tokens'] -= granted
+                return granted
+            delay = (minimum - _io_bucket['tokens']) / rate
+        time.sleep(delay)
+
+
+def return_tokens(count):
+    """Give back allowance taken with take_tokens() that wasn't used."""
+    with _io_bucket_lock:
+        _io_bucket['tokens'] += count
+
+
+def relay_stream(src, dst, meter):
+    """Copy src to dst until EOF, adding the bytes copied to meter['bytes'].
+
+    Applies the bandwidth limit (shared with any parallel transfers).
+    Closes both ends when done. If dst goes away the copy stops and src is
+    closed so the writer upstream gets SIGPIPE, as with a direct pipe.
+    """
+    try:
+        while True:
+            rate = _bwlimit_bytes
+            count = take_tokens(rate) if rate else RELAY_CHUNK
+            chunk = os.read(src.fileno(), count)
+            if rate and len(chunk) < count:
+                return_tokens(count - len(chunk))
+            if not chunk:
+                break
+            view = memoryview(chunk)
+            while view:
+                view = view[os.write(dst.fileno(), view):]
+            meter['bytes'] += len(chunk)
+    except (BrokenPipeError, OSError):
+        pass
+    finally:
+        for stream in (dst, src):
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+
+def record_transfer(record):
+    """Report a finished transfer and append it to the metrics log."""
+    if record['ok']:
+        info(f"Transferred {record['bytes'] / 1e6:.1f} MB in {record['seconds']:.1f}s ({record['mb_per_s']:.1f} MB/s)")
+    with _transfers_lock:
+        _transfers.append(record)
+        if not _metrics_log:
+            return
+        try:
+            with open(_metrics_log, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+        except OSError as e:
+            error(f"Could not write transfer metrics to {_metrics_log}: {e}")
 
-        receive_proc = subprocess.Popen(
-            receive_cmd.split(' '),
-            stdin=send_proc.stdout,
-            stderr=subprocess.PIPE
-        )
 
-        # Allow send_proc to receive SIGPIPE if receive_proc exits
-        send_proc.stdout.close()
+def send_and_receive(send_cmd, receive_cmd, host, dataset, kind):
+    """Execute a zfs send | zfs receive pipeline using streaming (no memory buffering).
 
-        # Wait for receive to complete and capture stderr
-        _, receive_stderr = receive_proc.communicate()
+    send_cmd is expected to come from remote_send_command(); when --mbuffer-size
+    or --compress are set the matching receive-side stages are inserted locally:
+        ssh zfs send | lzop | mbuffer  ->  mbuffer | lzop -d | zfs receive
 
-        # Now wait for send to complete
-        _, send_stderr = send_proc.communicate()
+    The stream coming out of ssh is relayed through this process and metered;
+    a record of the transfer (kind is "full", "incremental" or "resume") is
+    passed to record_transfer() whether or not it succeeded.
+    """
+    commands = [send_cmd] + receive_stages() + [receive_cmd]
+    names = ['zfs send'] + [stage.split(' ')[0] for stage in commands[1:-1]] + ['zfs receive']
+    meter = {'bytes': 0}
+    started = datetime.now()
+    start = time.monotonic()
+    procs = []
+    try:
+        for command in commands:
+            debug(command)
+
+        # Create a true pipeline: send.stdout -> relay -> [stages ->] receive.stdin
+        # This streams data directly without buffering in memory
+        with _pipelines_lock:
+            if _stopping.is_set():
+                return False
+            for i, command in enumerate(commands):
+                last = i == len(commands) - 1
+                procs.append(subprocess.Popen(
+                    command.split(' '),
+                    stdin=subprocess.PIPE if i == 1 else (procs[-1].stdout if procs else None),
+                    stdout=None if last else subprocess.PIPE,
+                    stderr=subprocess.PIPE
+                ))
+                _pipelines.add(procs[-1])
+                if i > 1:
+                    # Allow the previous process to receive SIGPIPE if this one exits
+                    procs[-2].stdout.close()
+
+        # The relay owns both ends of the metered link; detach them so that
+        # communicate() below doesn't read from or close them underneath it
+        relay_src, relay_dst = procs[0].stdout, procs[1].stdin
+        procs[0].stdout = procs[1].stdin = None
+        relay = threading.Thread(target=relay_stream, args=(relay_src, relay_dst, meter), daemon=True)
+        relay.start()
+
+        # Wait from the receiving end backwards and capture stderr
+        stderrs = [None] * len(procs)
+        for i in reversed(range(len(procs))):
+            _, stderrs[i] = procs[i].communicate()
+            record_command(procs[i].args, start)
+
+        relay.join()
+        seconds = time.monotonic() - start
 
         # Check if any part of the pipeline failed
-        send_failed = send_proc.returncode != 0
-        receive_failed = receive_proc.returncode != 0
+        failed = [proc.returncode != 0 for proc in procs]
+        record_transfer({
+            'started': started.strftime("%Y-%m-%dT%H:%M:%S"),
+            'direction': 'pull',
+            'host': host,
+            'dataset': dataset,
+            'kind': kind,
+            'bytes': meter['bytes'],
+            'seconds': round(seconds, 3),
+            'mb_per_s': round(meter['bytes'] / seconds / 1e6, 2) if seconds > 0 else 0.0,
+            'compress': _compress,
+            'ok': not any(failed),
+        })
+
+        if any(failed) and _stopping.is_set():
+            debug(f"Transfer of {dataset} stopped")
+            return False
 
-        if send_failed or receive_failed:
+        if any(failed):
             # Report which component(s) failed
-            if send_failed:
-                error(f"zfs send failed with code {send_proc.returncode}")
-            if receive_failed:
-                error(f"zfs receive failed with code {receive_proc.returncode}")
+            for name, proc, proc_failed in zip(names, procs, failed):
+                if proc_failed:
+                    error(f"{name} failed with code {proc.returncode}")
 
             # Report all captured stderr (the real error is often in receive)
-            if send_stderr and send_stderr.strip():
-                error(f"  send stderr: {send_stderr.decode().strip()}")
-            if receive_stderr and receive_stderr.strip():
-                error(f"  receive stderr: {receive_stderr.decode().strip()}")
+            for name, stderr in zip(names, stderrs):
+                if stderr and stderr.strip():
+                    error(f"  {name.replace('zfs ', '')} stderr: {stderr.decode().strip()}")
 
             # If send failed but had no stderr, hint that the error is likely elsewhere
-            if send_failed and not (send_stderr and send_stderr.strip()):
+            send_stderr, receive_stderr = stderrs[0], stderrs[-1]
+            if failed[0] and not (send_stderr and send_stderr.strip()):
                 if receive_stderr and receive_stderr.strip():
                     error("  (send likely failed due to broken pipe from receive failure)")
                 else:
@@ -315,6 +1694,34 @@ def send_and_receive(send_cmd, receive_cmd):
         error(f"Transfer failed: {e}")
         return False
 
+    finally:
+        with _pipelines_lock:
+            _pipelines.difference_update(procs)
+
+
+def load_local_datasets(destination, name):
+    """Seed the local dataset cache from one listing of the host's backup tree.
+
+    The destination and its ancestors are known to exist from preflight.
+    """
+    parts = destination.split('/')
+    known = {'/'.join(parts[:i]) for i in range(1, len(parts) + 1)}
+
+    command = f"zfs list -H -o name -t filesystem,volume -r {destination}/{name}"
+    debug(command)
+    result = run_command(command.split(' '), capture_output=True, check=False)
+    if result.returncode == 0:
+        known.update(result.stdout.decode().splitlines())
+
+    with _parent_lock:
+        _local_datasets.update(known)
+
+
+def mark_local_dataset(dataset):
+    """Record that a local dataset now exists (e.g. after its first receive)."""
+    with _parent_lock:
+        _local_datasets.add(dataset)
+
 
 def ensure_parent_datasets_exist(dataset_path):
     """Create all parent datasets if they don't exist.
@@ -325,6 +1732,8 @@ def ensure_parent_datasets_exist(dataset_path):
       - pool/backups/raw
       - pool/backups/raw/host
       - pool/backups/raw/host/pool
+
+    Returns True on success, False if a parent could not be created.
     """
     parts = dataset_path.split('/')
 
@@ -334,10 +1743,25 @@ def ensure_parent_datasets_exist(dataset_path):
         parent = '/'.join(parts[:i])
         parents.append(parent)
 
-    # Check and create each parent in order
+    # Check and create each parent in order. Sibling workers share parents,
+    # so only one of them may check-and-create at a time.
+    with _parent_lock:
+        return _create_missing_parents(parents)
+
+
+def _create_missing_parents(parents):
+    """Create each missing dataset in parents, in order.
+
+    Parents in the local dataset cache are skipped without running zfs; anything
+    else is checked once and then cached, so each ancestor costs at most one
+    `zfs list` per run.
+    """
     for parent in parents:
+        if parent in _local_datasets:
+            continue
+
         # Check if dataset exists
-        result = subprocess.run(
+        result = run_command(
             ['zfs', 'list', '-H', '-o', 'name', parent],
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
@@ -348,7 +1772,7 @@ def ensure_parent_datasets_exist(dataset_path):
             # Dataset doesn't exist, create it
             debug(f"Creating missing parent dataset: {parent}")
 
-            create_result = subprocess.run(
+            create_result = run_command(
                 ['zfs', 'create', '-o', 'canmount=off', '-o', 'acltype=posix', '-o', 'xattr=sa', parent],
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
@@ -358,92 +1782,168 @@ def ensure_parent_datasets_exist(dataset_path):
             if create_result.returncode != 0:
                 error(f"Failed to create parent dataset {parent}")
                 error(f"  zfs create: {create_result.stderr.decode().strip()}")
-                sys.exit(1)
+                return False
 
             info(f"Created parent dataset: {parent}")
 
+        _local_datasets.add(parent)
+
+    return True
+
 
-def pulldatasets(host, name, dataset, user, destination):
+def resume_receive(host, dataset, user, local_dataset, token):
+    """Finish an interrupted receive into local_dataset from its resume token.
+
+    The token is validated with a dry-run send first. A token that can no
+    longer be resumed (e.g. its source snapshot was pruned) has its partial
+    state aborted so the normal logic can start over; any other failure keeps
+    the partial state for the next run to resume.
+    Returns True if the resumed stream was received completely.
+    """
+    info(f"Resuming interrupted receive of {dataset}")
+
+    check_cmd = f"{ssh_command(user, host)} zfs send -nvP -t {token}"
+    debug(check_cmd)
+    result = run_command(check_cmd.split(' '), capture_output=True, check=False)
+    if result.returncode == 255:
+        error(f"Could not connect to {host} to resume {dataset}")
+        return False
+    if result.returncode != 0:
+        info(f"Resume token is no longer valid, discarding partial receive of {dataset}")
+        debug(f"  zfs send -t: {result.stderr.decode().strip()}")
+        abort = run_command(['zfs', 'receive', '-A', local_dataset], capture_output=True, check=False)
+        if abort.returncode != 0:
+            error(f"Failed to abort partial receive into {local_dataset}")
+            error(f"  zfs receive -A: {abort.stderr.decode().strip()}")
+        return False
+
+    send_cmd = remote_send_command(user, host, f"-t {token}")
+    receive_cmd = f"zfs receive -s -u {local_dataset}"
+    if not send_and_receive(send_cmd, receive_cmd, host, dataset, 'resume'):
+        return False
+    info("Success! Resumed receive completed.")
+    return True
+
+
+def pulldatasets(host, name, dataset, user, destination, remote_entry, local_entry, bootstrap=DEFAULT_bootstrap):
+    """Pull one dataset. Returns True on success (including no-op), False on failure.
+
+    remote_entry and local_entry are this dataset's entries from the run's
+    inventory indexes (local_entry is None if it hasn't been received yet).
+    bootstrap is the initial sync mode if the dataset is new (see bootstrap_chain).
+    """
     local_dataset = f"{destination}/{name}/{dataset}"
 
-    remote_snapshots = get_remote_snapshots(host, dataset, user)
+    # An interrupted receive leaves a resume token on the target; continue that
+    # stream before anything else, then carry on from whatever it delivered.
+    if local_entry and local_entry['resume_token']:
+        resumed = resume_receive(host, dataset, user, local_dataset, local_entry['resume_token'])
+        local_entry = get_local_inventory(local_dataset).get(local_dataset)
+        if not resumed and local_entry and local_entry['resume_token']:
+            # Partial state that was kept must be resumed by a later run, not overwritten
+            return False
+
+    remote_snapshots = remote_entry['snapshots']
     if not remote_snapshots:
         info(f"Skipping {dataset} - no snapshots found on remote")
-        return
+        return True
+
+    local_snapshots = local_entry['snapshots'] if local_entry else []
 
-    local_snapshots = get_local_snapshots(local_dataset)
+    earliest_remote = remote_snapshots[0]['name']
+    latest_remote = remote_snapshots[-1]['name']
 
-    earliest_remote = remote_snapshots[0]
-    latest_remote = remote_snapshots[-1]
+    # Newest snapshot both sides share, by guid; the incremental is sent from it
+    common = find_latest_common(remote_snapshots, local_snapshots)
+    bookmark = find_bookmark_base(remote_entry, local_snapshots) if common is None else None
 
-    # Find common snapshots between local and remote
-    common_snapshots = [s for s in local_snapshots if s in remote_snapshots]
+    if bookmark is not None:
+        # The shared snapshots were pruned on the client, but a bookmark of one
+        # is left: send the first snapshot after it with -i, then the rest
+        after = [s['name'] for s in remote_snapshots if s['createtxg'] > bookmark['createtxg']]
+        info(f"No common snapshots left, updating from bookmark '#{bookmark['name']}'")
+        send_cmd = remote_send_command(user, host, f"-i {dataset}#{bookmark['name']} {dataset}@{after[0]}")
+        receive_cmd = f"zfs receive -s -F -u {local_dataset}"
+        if not send_and_receive(send_cmd, receive_cmd, host, dataset, 'incremental'):
+            return False
+        if after[0] != latest_remote:
+            info(f"Pulling incremental snapshots between '{after[0]}' and '{latest_remote}'")
+            send_cmd = remote_send_command(user, host, f"-I {dataset}@{after[0]} {dataset}@{latest_remote}")
+            if not send_and_receive(send_cmd, receive_cmd, host, dataset, 'incremental'):
+                return False
+        info(f"Success! Latest snapshot is '{latest_remote}'")
 
-    if not common_snapshots:
+    elif common is None:
         # Initial sync: no common snapshots, need full send
         info(f"No common snapshots found.")
         info(f"Remote has {len(remote_snapshots)} snapshots: {earliest_remote} -> {latest_remote}")
         info(f"Performing initial sync.")
 
         # Ensure all parent datasets exist before receiving
-        ensure_parent_datasets_exist(local_dataset)
+        if not ensure_parent_datasets_exist(local_dataset):
+            return False
+
+        chain = [s['name'] for s in bootstrap_chain(remote_snapshots, bootstrap)]
+        first = chain[0]
 
-        # Step 1: Full send of earliest snapshot
+        # Step 1: Full send of the earliest snapshot (or the first one the bootstrap mode keeps)
         # Don't use -F for initial receive - let dataset be created with inherited properties
-        info(f"{dataset} is new. Pulling the earliest snapshot: '@{earliest_remote}'")
-        send_cmd = f"ssh {user}@{host} zfs send {dataset}@{earliest_remote}"
-        receive_cmd = f"zfs receive -u {local_dataset}"
+        # -s keeps partially received state if interrupted so the next run can resume it
+        if bootstrap == 'history':
+            info(f"{dataset} is new. Pulling the earliest snapshot: '@{first}'")
+        else:
+            info(f"{dataset} is new. Pulling {len(chain)} of {len(remote_snapshots)} snapshots ({bootstrap}), starting with '@{first}'")
+        send_cmd = remote_send_command(user, host, f"{dataset}@{first}")
+        receive_cmd = f"zfs receive -s -u {local_dataset}"
 
-        if not send_and_receive(send_cmd, receive_cmd):
-            sys.exit(1)
-        info(f"Success! Received earliest snapshot.")
-        debug(f"{dataset}@{earliest_remote}")
-
-        # Step 2: Incremental from earliest to latest (if more than one snapshot)
-        if earliest_remote != latest_remote:
-            info(f"Pulling incremental snapshots between '{earliest_remote}' and '{latest_remote}'")
-            send_cmd = f"ssh {user}@{host} zfs send -I {dataset}@{earliest_remote} {dataset}@{latest_remote}"
-            # Only use -F for incrementals once dataset exists
-            receive_cmd_incremental = f"zfs receive -F -u {local_dataset}"
-
-            if not send_and_receive(send_cmd, receive_cmd_incremental):
-                sys.exit(1)
+        if not send_and_receive(send_cmd, receive_cmd, host, dataset, 'full'):
+            return False
+        info(f"Success! Received '{first}'.")
+        mark_local_dataset(local_dataset)
+        debug(f"{dataset}@{first}")
+
+        # Only use -F for incrementals once dataset exists
+        receive_cmd_incremental = f"zfs receive -s -F -u {local_dataset}"
+
+        # Step 2: Incremental from earliest to latest (if more than one snapshot),
+        # or from each kept snapshot to the next, skipping the history in between
+        if bootstrap == 'history' and first != latest_remote:
+            info(f"Pulling incremental snapshots between '{first}' and '{latest_remote}'")
+            send_cmd = remote_send_command(user, host, f"-I {dataset}@{first} {dataset}@{latest_remote}")
+
+            if not send_and_receive(send_cmd, receive_cmd_incremental, host, dataset, 'incremental'):
+                return False
+            info(f"Success! Latest snapshot is '{latest_remote}'")
+        elif len(chain) > 1:
+            for previous, snapshot in zip(chain, chain[1:]):
+                info(f"Pulling '{snapshot}' on top of '{previous}'")
+                send_cmd = remote_send_command(user, host, f"-i {dataset}@{previous} {dataset}@{snapshot}")
+                if not send_and_receive(send_cmd, receive_cmd_incremental, host, dataset, 'incremental'):
+                    return False
             info(f"Success! Latest snapshot is '{latest_remote}'")
         else:
-            info("Only one snapshot exists, no incremental receive needed.")
+            info("Only one snapshot to pull, no incremental receive needed.")
 
     else:
-        # Incremental sync: find latest common snapshot and sync from there
-        latest_common = common_snapshots[-1]
+        # Incremental sync: sync from the latest common snapshot
+        latest_common = common['name']
 
-        if latest_common == latest_remote:
+        if common is remote_snapshots[-1]:
             info(f"Up-to-date!")
             debug(f"Latest is {dataset}@{latest_remote}")
-            return
+            return True
 
         info(f"Partially synced.")
         info(f"Updating from {latest_common}' to '{latest_remote}'.")
-        send_cmd = f"ssh {user}@{host} zfs send -I {dataset}@{latest_common} {dataset}@{latest_remote}"
-        receive_cmd = f"zfs receive -F -u {local_dataset}"
+        send_cmd = remote_send_command(user, host, f"-I {dataset}@{latest_common} {dataset}@{latest_remote}")
+        receive_cmd = f"zfs receive -s -F -u {local_dataset}"
 
-        if not send_and_receive(send_cmd, receive_cmd):
-            sys.exit(1)
+        if not send_and_receive(send_cmd, receive_cmd, host, dataset, 'incremental'):
+            return False
         info(f"Success. Latest snapshot is now '{latest_remote}'.")
 
     print('\n')
-
-def get_newest_autosnap_time(dataset):
-    """Return the datetime of the newest autosnap snapshot for a local dataset, or None."""
-    snapshots = get_local_snapshots(dataset)
-    autosnap_snaps = [s for s in snapshots if s.startswith('autosnap_')]
-    if not autosnap_snaps:
-        return None
-    newest = autosnap_snaps[-1]
-    match = re.match(r'^autosnap_(\d{4}-\d{2}-\d{2}_\d{2}:\d{2}:\d{2})_', newest)
-    if match:
-        return datetime.strptime(match.group(1), "%Y-%m-%d_%H:%M:%S")
-    return None
-
+    return True
 
 def publish_mqtt_discovery(name, mqtt_host, mqtt_topic_prefix):
     """Publish HA MQTT discovery config for the pull binary sensor."""
@@ -462,70 +1962,78 @@ def publish_mqtt_discovery(name, mqtt_host, mqtt_topic_prefix):
     })
     cmd = ["mosquitto_pub", "-h", mqtt_host, "-t", discovery_topic, "-m", payload, "-r"]
     try:
-        result = subprocess.run(cmd, capture_output=True, timeout=10, check=False)
+        result = run_command(cmd, capture_output=True, timeout=10, check=False)
         if result.returncode != 0:
             error(f"mosquitto_pub discovery failed: {result.stderr.decode().strip()}")
     except Exception as e:
         error(f"Failed to publish MQTT discovery: {e}")
 
 
-def get_local_backup_datasets(name, datasets, destination):
-    """Return all local datasets under this host's backup destination.
+def get_newest_autosnap_times(name, datasets, destination):
+    """Return {dataset: creation time of its newest autosnap snapshot, or None}.
 
-    Expands each requested dataset to include its local children, so that
-    discovered children (pulled via snapshots_discover_children) are reported.
+    Covers every local dataset under this host's backup of the requested
+    datasets (so discovered children are reported too), from a single
+    recursive listing. Times are the numeric `creation` property (epoch
+    seconds). A requested dataset that doesn't exist locally maps to None.
     """
-    result_datasets = []
+    prefix = f"{destination}/{name}/"
+    command = f"zfs list -Hp -t filesystem,volume,snapshot -o name,creation -r {destination}/{name}"
+    debug(command)
+
+    newest = {}
+    result = run_command(command.split(' '), capture_output=True, check=False)
+    output = result.stdout.decode() if result.returncode == 0 else ''
+
+    for line in output.splitlines():
+        full_name, _, creation = line.partition('\t')
+        local_ds, _, snapshot = full_name.partition('@')
+        dataset = local_ds[len(prefix):]
+        if not local_ds.startswith(prefix) or not any(
+                dataset == root or dataset.startswith(root + '/') for root in datasets):
+            continue
+        newest.setdefault(dataset, None)
+        if snapshot.startswith('autosnap_'):
+            created = int(creation)
+            if newest[dataset] is None or created > newest[dataset]:
+                newest[dataset] = created
+
     for dataset in datasets:
-        local_parent = f"{destination}/{name}/{dataset}"
-        try:
-            result = subprocess.run(
-                ["zfs", "list", "-H", "-o", "name", "-r", local_parent],
-                capture_output=True, check=False
-            )
-            if result.returncode == 0:
-                children = result.stdout.decode().strip().splitlines()
-                # Strip the destination prefix to get relative dataset names
-                prefix = f"{destination}/{name}/"
-                result_datasets.extend(
-                    ds[len(prefix):] for ds in children if ds.startswith(prefix)
-                )
-            else:
-                result_datasets.append(dataset)
-        except Exception:
-            result_datasets.append(dataset)
-    return result_datasets
+        newest.setdefault(dataset, None)
+    return newest
 
 
-def publish_mqtt_status(name, datasets, destination, mqtt_host, mqtt_topic_prefix, stale_multiplier=2):
-    """Publish pull status to MQTT after a successful pull."""
-    now = datetime.now()
-    stale_threshold = timedelta(hours=stale_multiplier * 2)
+def publish_mqtt_status(name, datasets, destination, mqtt_host, mqtt_topic_prefix, stale_multiplier=2, transfers=None):
+    """Publish pull status to MQTT after a successful pull.
 
-    all_datasets = get_local_backup_datasets(name, datasets, destination)
+    If transfers is given (the run's transfer records), it is included in the payload.
+    """
+    now = datetime.now()
+    stale_threshold = timedelta(hours=stale_multiplier * 2).total_seconds()
 
     stale_datasets = []
     healthy_datasets = []
-    for dataset in all_datasets:
-        local_ds = f"{destination}/{name}/{dataset}"
-        newest_time = get_newest_autosnap_time(local_ds)
-        if newest_time is None or (now - newest_time) > stale_threshold:
+    for dataset, newest_time in get_newest_autosnap_times(name, datasets, destination).items():
+        if newest_time is None or (now.timestamp() - newest_time) > stale_threshold:
             stale_datasets.append(dataset)
         else:
             healthy_datasets.append(dataset)
 
     topic = f"{mqtt_topic_prefix}/{name}/backups"
-    payload = json.dumps({
+    status = {
         "ok": len(stale_datasets) == 0,
         "host": name,
         "pulled_at": now.strftime("%Y-%m-%dT%H:%M:%S"),
         "stale_datasets": stale_datasets,
         "healthy_datasets": healthy_datasets,
-    })
+    }
+    if transfers is not None:
+        status["transfers"] = transfers
+    payload = json.dumps(status)
 
     cmd = ["mosquitto_pub", "-h", mqtt_host, "-t", topic, "-m", payload, "-r"]
     try:
-        result = subprocess.run(cmd, capture_output=True, timeout=10, check=False)
+        result = run_command(cmd, capture_output=True, timeout=10, check=False)
         if result.returncode != 0:
             error(f"mosquitto_pub failed: {result.stderr.decode().strip()}")
         else:
@@ -546,10 +2054,56 @@ if __name__ == "__main__":
     parser.add_argument('--mqtt-host', type=str, default=None, help='MQTT broker hostname (enables MQTT publish)')
     parser.add_argument('--mqtt-topic-prefix', type=str, default='homeinfra/monitoring/zfs', help='MQTT topic prefix')
     parser.add_argument('--mqtt-name', type=str, default=None, help='Host name to use in MQTT topic (defaults to --name)')
+    parser.add_argument('--jobs', '-j', type=int, default=DEFAULT_jobs, help='Number of datasets to pull in parallel (default: %(default)s)')
+    parser.add_argument('--compress', choices=sorted(COMPRESSORS), default=DEFAULT_compress, help='Compress the stream on the remote host and decompress it locally')
+    parser.add_argument('--mbuffer-size', default=DEFAULT_mbuffer_size, help='Buffer the stream through mbuffer with this much memory on each side, e.g. 256M (default: no buffering)')
+    parser.add_argument('--mbuffer-block', default=DEFAULT_mbuffer_block, help='mbuffer block size (default: %(default)s)')
+    parser.add_argument('--bwlimit', default=DEFAULT_bwlimit, help='Bandwidth limit shared by all parallel transfers. Format: 100k, 10m, 1g for KB/s, MB/s, GB/s')
+    parser.add_argument('--metrics-log', default=DEFAULT_metrics_log, help='JSON-lines file to append per-transfer metrics to, empty to disable (default: %(default)s)')
+    parser.add_argument('--order', choices=ORDERS, default=DEFAULT_order, help='Order to pull datasets in: smallest estimated transfer first, --critical datasets first, longest since last received first, or listing order (default: %(default)s)')
+    parser.add_argument('--estimate', choices=['written', 'send'], default=DEFAULT_estimate, help='Estimate transfer sizes from snapshot written properties, or with zfs send -nvP dry runs on the remote (default: %(default)s)')
+    parser.add_argument('--critical', nargs='+', default=[], help='Datasets (with their children) that --order policy pulls first')
+    parser.add_argument('--raw', default=False, help='Send blocks as stored on the client (zfs send -w): no decompression or decryption on the client, no recompression here. Encrypted datasets stay encrypted with the client\'s key', action=argparse.BooleanOptionalAction)
+    parser.add_argument('--compressed', default=False, help='Send compressed blocks as they are (zfs send -c)', action=argparse.BooleanOptionalAction)
+    parser.add_argument('--large-block', default=False, help='Send blocks larger than 128k as they are (zfs send -L)', action=argparse.BooleanOptionalAction)
+    parser.add_argument('--bootstrap', choices=BOOTSTRAP_MODES, default=DEFAULT_bootstrap, help='How datasets new to the backup server are first pulled: every snapshot, only the --bootstrap-anchors snapshots and the latest, or only the latest (default: %(default)s)')
+    parser.add_argument('--bootstrap-critical', choices=BOOTSTRAP_MODES, default=None, help='--bootstrap for the --critical datasets (default: same as --bootstrap)')
+    parser.add_argument('--bootstrap-anchors', default=DEFAULT_bootstrap_anchors, help='Comma-separated snapshot types kept by --bootstrap anchors (default: %(default)s)')
+    parser.add_argument('--protect', choices=PROTECT_MODES, default=DEFAULT_protect, help='Keep the newest pulled snapshot of each dataset usable as the next incremental base on the remote with a hold or a bookmark (default: %(default)s)')
+    parser.add_argument('--protect-tag', default=DEFAULT_protect_tag, help='Hold tag, and bookmark name prefix, used by --protect (default: %(default)s)')
+    parser.add_argument('--recursive', default=False, help='Pull each of --datasets with its children as one zfs send -R stream where they are in step, per dataset otherwise', action=argparse.BooleanOptionalAction)
+    parser.add_argument('--plan', default=False, help='Print the transfer plan and exit without pulling', action=argparse.BooleanOptionalAction)
+    parser.add_argument('--journal-dir', default=DEFAULT_journal_dir, help='Directory for the replication journal used to skip unchanged hosts, empty to disable (default: %(default)s)')
+    parser.add_argument('--mqtt-transfers', default=False, help='Include this run\'s transfer metrics in the MQTT status payload', action=argparse.BooleanOptionalAction)
+    parser.add_argument('--profile', default=False, help=f'Write the wall time, subprocess count and command times of each phase of this run to {PROFILE_DIR} as JSON', action=argparse.BooleanOptionalAction)
     args = parser.parse_args()
 
+    if args.profile:
+        start_profile()
+
     _quiet = args.quiet
     _debug = args.debug
+    _metrics_log = args.metrics_log
+    _journal_dir = args.journal_dir
+    _order = args.order
+    _estimate = args.estimate
+    _critical = set(args.critical)
+    _plan_only = args.plan
+    _recursive = args.recursive
+    _bootstrap = args.bootstrap
+    _bootstrap_critical = args.bootstrap_critical or args.bootstrap
+    _bootstrap_anchors = set(args.bootstrap_anchors.split(','))
+    _protect = args.protect
+    _protect_tag = args.protect_tag
+    _send_flags = [flag for flag in SEND_FLAGS if getattr(args, flag)]
+    if args.bwlimit:
+        _bwlimit_bytes = parse_size_to_bytes(args.bwlimit)
+        if not _bwlimit_bytes:
+            print(f"Invalid --bwlimit '{args.bwlimit}'", file=sys.stderr)
+            sys.exit(1)
+    _compress = args.compress
+    _mbuffer_size = args.mbuffer_size
+    _mbuffer_block = args.mbuffer_block
 
     if not args.user or not args.host or not args.datasets:
         print("Usage: zfs-pull-backups --user <user> --host <host> --datasets-source <space-seperated list> [--datasets-destination <destination>]", file=sys.stderr)
@@ -557,23 +2111,18 @@ if __name__ == "__main__":
 
     name = args.name if args.name else args.host
 
-    # Set host-specific lockfile to allow parallel pulls from different hosts
-    _lockfile = get_lockfile_path(name)
-
-    # Acquire lockfile to prevent concurrent executions from this host
-    if not acquire_lock():
-        # Exit with 0 (success) to prevent cron email alerts when another instance is running
-        sys.exit(0)
-
+    # Lockfiles are taken per dataset by the workers, so overlapping runs for
+    # the same host can make progress on datasets the other run isn't touching.
     # Register cleanup handlers
     atexit.register(release_lock)
     signal.signal(signal.SIGTERM, signal_handler)
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGHUP, signal_handler)
 
-    preflight(args.host, name, args.datasets, args.user, args.destination)
+    preflight(args.host, name, args.datasets, args.user, args.destination, args.jobs)
 
-    if args.mqtt_host:
+    if args.mqtt_host and not _plan_only:
+        profile_phase('mqtt')
         mqtt_name = args.mqtt_name if args.mqtt_name else name
         publish_mqtt_discovery(mqtt_name, args.mqtt_host, args.mqtt_topic_prefix)
         publish_mqtt_status(
@@ -583,4 +2132,5 @@ if __name__ == "__main__":
             mqtt_host=args.mqtt_host,
             mqtt_topic_prefix=args.mqtt_topic_prefix,
             stale_multiplier={{ backups_zfs_server_stale_threshold_multiplier }},
+            transfers=_transfers if args.mqtt_transfers else None,
         )
@@ -6,22 +6,132 @@ from datetime import datetime, timedelta
 import re
 import os
 import atexit
+import collections
+import select
 import signal
+import shutil
+import tempfile
+import errno
+import json
+import threading
+import time
 
 DEFAULT_user="{{ vault_zfsbackups_user }}"
 DEFAULT_strip_prefix = "{{ backups_zfs_server_local_dataset }}"
 DEFAULT_debug = False
 DEFAULT_quiet = False
 DEFAULT_bwlimit = None  # No bandwidth limit by default
-
-# Lockfile to prevent concurrent executions (set dynamically per host)
+DEFAULT_bwlimit_schedule = None
+DEFAULT_compress = None
+DEFAULT_mbuffer_size = None
+DEFAULT_mbuffer_block = "128k"
+DEFAULT_metrics_log = "{{ backups_zfs_server_logging_dir }}/{{ backups_zfs_server_logging_metricsfile }}"
+DEFAULT_journal_dir = "{{ backups_zfs_server_script_path }}/state"
+DEFAULT_protect = "none"
+DEFAULT_bootstrap = "history"
+DEFAULT_bootstrap_anchors = "yearly,monthly"
+
+SCRIPT_NAME = "zfs-push-backups"
+
+# Where --profile writes its summaries
+PROFILE_DIR = "{{ backups_zfs_server_logging_dir }}"
+
+# Properties listed for local snapshots: the sizes let a run be planned and
+# estimated from the listing alone
+LOCAL_PROPERTIES = "name,guid,createtxg,referenced,written"
+
+# Largest amount moved per call when relaying (and metering) the stream between processes
+RELAY_CHUNK = 1024 * 1024
+
+# Smallest amount the rate limiter lets through at once, so low limits don't
+# degenerate into tiny writes
+RELAY_MIN_CHUNK = 64 * 1024
+
+# Most of the stream a fan-out relay keeps for a host whose receiver hasn't
+# taken it yet; reading pauses while any host has this much waiting
+FANOUT_BUFFER = 16 * RELAY_CHUNK
+
+# How long (seconds) a fan-out receiver may take nothing before it is taken
+# to be stuck and dropped, so that it can't hold up the other hosts
+FANOUT_STALL_TIMEOUT = 300
+
+# Stream compressors for --compress: (command on the sending side, command on the receiving side)
+COMPRESSORS = {
+    'lzop': ('lzop', 'lzop -d'),
+    'zstd': ('zstd -q', 'zstd -q -d'),
+}
+
+# How a dataset new to the remote is first pushed (--bootstrap): every
+# snapshot, only the anchor snapshots (see --bootstrap-anchors) and the latest,
+# or only the latest
+BOOTSTRAP_MODES = ['history', 'anchors', 'latest']
+
+# Ways to keep the newest pushed snapshot usable as the next incremental base
+# when it is pruned locally (--protect): a hold stops it from being destroyed,
+# a bookmark keeps enough of it to send from after it is gone
+PROTECT_MODES = ['none', 'hold', 'bookmark']
+
+# How long (seconds) an idle SSH master connection may outlive its last command
+SSH_CONTROL_PERSIST = 600
+
+# Lockfile to prevent concurrent executions (set dynamically per host), and
+# those of the other hosts of a fan-out push
 _lockfile = None
+_fanout_lockfiles = []
 
 # Module-level variables for output control (set by main)
 _quiet = False
 _debug = False
 _bwlimit = None
 
+# Bandwidth limit applied by the relay: bytes/second (None for unlimited), the
+# control file re-read on SIGUSR1 to change it mid-run, and the pending-reload flag
+_bwlimit_bytes = None
+_bwlimit_file = None
+_bwlimit_reload = threading.Event()
+
+# Time-of-day bandwidth windows (set by main, see parse_bwlimit_schedule), the
+# limit that applies outside them, and the window currently applied (None
+# outside all windows, -1 before the schedule was first applied)
+_bwlimit_schedule = []
+_bwlimit_default = (None, None)
+_bwlimit_window = -1
+
+# Pipeline stages (set by main): compressor name and mbuffer sizes, None to disable
+_compress = None
+_mbuffer_size = None
+_mbuffer_block = DEFAULT_mbuffer_block
+
+# JSON-lines file per-transfer metrics are appended to (set by main, None to disable)
+_metrics_log = None
+
+# Directory of the replication journals (set by main, None to disable)
+_journal_dir = None
+
+# Initial sync mode and the snapshot types it keeps as anchors (set by main)
+_bootstrap = DEFAULT_bootstrap
+_bootstrap_anchors = set(DEFAULT_bootstrap_anchors.split(','))
+
+# Base protection: mode and the hold tag / bookmark prefix for this host (set by main)
+_protect = DEFAULT_protect
+_protect_tag = None
+
+# Multiplexed SSH master connections ("user@host" -> control socket path)
+_ssh_masters = {}
+_ssh_control_dir = None
+
+
+def get_bwlimit_file_path(host):
+    """Path of the control file holding a new bandwidth limit for pushes to host."""
+    safe_host = re.sub(r'[^a-zA-Z0-9.-]', '-', host)
+    return f"/var/run/zfs-push-backups-{safe_host}.bwlimit"
+
+
+def get_protect_tag(host):
+    """Hold tag (and bookmark name prefix) protecting the bases of pushes to host."""
+    safe_host = re.sub(r'[^a-zA-Z0-9.-]', '-', host)
+    return f"zfs-push-backups-{safe_host}"
+
 
 def get_lockfile_path(host):
     """Generate a host-specific lockfile path.
@@ -48,16 +158,135 @@ def error(message):
     print("🚨 " + message, file=sys.stderr)
 
 
-def acquire_lock():
-    """Acquire lockfile to prevent concurrent executions.
+# -- Profiling (--profile) ---------------------------------------------------
+# This block is the same in zfs-pull-backups, zfs-push-backups, zfs-snapshot,
+# zfs-prune and zfs-snapshot-report; tests/test_zfs_scripts.py checks that it
+# stays that way, so change all five together.
+
+# ssh options that take a value, skipped to find the remote command
+SSH_VALUE_OPTIONS = ('-S', '-O', '-o', '-p', '-i', '-l')
+
+# Phase profile of this run: None unless profiling, otherwise the current
+# phase, when it started, and the wall time and commands of each phase
+_profile = None
+_profile_lock = threading.Lock()
+
+
+def command_name(args):
+    """Name a command is profiled under: the program, with the subcommand for
+    zfs and zpool, and ssh followed by the name of what it runs remotely."""
+    if isinstance(args, str):
+        args = args.split(' ')
+    args = list(args)
+    program = os.path.basename(args[0]) if args else ''
+    if program == 'ssh':
+        rest = args[1:]
+        while rest and rest[0].startswith('-'):
+            rest = rest[2:] if rest[0] in SSH_VALUE_OPTIONS else rest[1:]
+        remote = ' '.join(rest[1:]).split()
+        return f"ssh {command_name(remote)}" if remote else 'ssh'
+    if program in ('zfs', 'zpool') and len(args) > 1:
+        return f"{program} {args[1]}"
+    return program
+
+
+def record_command(args, started):
+    """Count a command that ran since started (time.monotonic()) towards the
+    current phase (with --profile)."""
+    if _profile is None:
+        return
+    seconds = time.monotonic() - started
+    with _profile_lock:
+        phase = get_profile_phase(_profile['phase'])
+        phase['subprocesses'] += 1
+        phase['command_seconds'] += seconds
+        command = phase['commands'].setdefault(command_name(args), {'count': 0, 'seconds': 0.0})
+        command['count'] += 1
+        command['seconds'] += seconds
+
+
+def run_command(args, **kwargs):
+    """Run a command with subprocess.run() and add the time it took to the
+    current phase (with --profile)."""
+    started = time.monotonic()
+    try:
+        return subprocess.run(args, **kwargs)
+    finally:
+        record_command(args, started)
+
+
+def get_profile_phase(name):
+    """Totals of phase name in the profile, started at zero on first use."""
+    return _profile['phases'].setdefault(name, {'seconds': 0.0, 'subprocesses': 0, 'command_seconds': 0.0, 'commands': {}})
+
+
+def start_profile():
+    """Profile this run: every command run from here on is timed (see
+    run_command()), and the summary is written to PROFILE_DIR when the script
+    exits."""
+    global _profile
+    _profile = {'started': time.time(), 'phase': 'startup', 'phase_started': time.monotonic(), 'phases': {}}
+    atexit.register(write_profile)
+
+
+def profile_phase(name):
+    """Count wall time and commands from here on towards phase name (with --profile)."""
+    if _profile is None:
+        return
+    now = time.monotonic()
+    with _profile_lock:
+        get_profile_phase(_profile['phase'])['seconds'] += now - _profile['phase_started']
+        _profile['phase'] = name
+        _profile['phase_started'] = now
+
+
+def write_profile():
+    """Write the per-phase wall time, subprocess count and command times of this run as JSON."""
+    profile_phase('exit')
+    commands = {}
+    for phase in _profile['phases'].values():
+        phase['seconds'] = round(phase['seconds'], 3)
+        phase['command_seconds'] = round(phase['command_seconds'], 3)
+        for name, command in phase['commands'].items():
+            total = commands.setdefault(name, {'count': 0, 'seconds': 0.0})
+            total['count'] += command['count']
+            total['seconds'] += command['seconds']
+            command['seconds'] = round(command['seconds'], 3)
+    for command in commands.values():
+        command['seconds'] = round(command['seconds'], 3)
+    started = datetime.fromtimestamp(_profile['started'])
+    summary = {
+        'script': SCRIPT_NAME,
+        'args': sys.argv[1:],
+        'started': started.isoformat(timespec='seconds'),
+        'seconds': round(time.time() - _profile['started'], 3),
+        'subprocesses': sum(command['count'] for command in commands.values()),
+        'phases': _profile['phases'],
+        'commands': commands,
+    }
+    path = os.path.join(PROFILE_DIR, f"{SCRIPT_NAME}-profile-{started.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.json")
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(summary, f, indent=2)
+        # stderr, so that output meant for other programs (e.g. --json) stays clean
+        print(f"Profile written to {path}", file=sys.stderr)
+    except OSError as e:
+        print(f"Could not write profile {path}: {e}", file=sys.stderr)
+
+# -- End of profiling ---------------------------------------------------------
+
+
+def acquire_lockfile(lockfile):
+    """Acquire one lockfile to prevent concurrent executions.
 
     Uses PID-based locking to detect and clean up stale locks.
     Returns True if lock acquired successfully, False otherwise.
     """
-    if os.path.exists(_lockfile):
+    if os.path.exists(lockfile):
         # Lockfile exists - check if it's stale
         try:
-            with open(_lockfile, 'r') as f:
+            with open(lockfile, 'r') as f:
                 old_pid = int(f.read().strip())
 
             # Check if process with that PID is still running
@@ -65,47 +294,70 @@ def acquire_lock():
                 os.kill(old_pid, 0)  # Signal 0 just checks if process exists
                 # Process exists - lock is valid
                 error(f"Another instance is already running (PID {old_pid})")
-                error("If you believe this is an error, remove the lockfile: " + _lockfile)
+                error("If you believe this is an error, remove the lockfile: " + lockfile)
                 return False
             except (OSError, ProcessLookupError):
                 # Process doesn't exist - stale lockfile
                 debug(f"Removing stale lockfile (PID {old_pid} not running)")
-                os.remove(_lockfile)
+                os.remove(lockfile)
         except (ValueError, IOError) as e:
             # Corrupted lockfile - remove it
             debug(f"Removing corrupted lockfile: {e}")
             try:
-                os.remove(_lockfile)
+                os.remove(lockfile)
             except OSError:
                 pass
 
     # Create lockfile with current PID
     try:
-        with open(_lockfile, 'w') as f:
+        with open(lockfile, 'w') as f:
             f.write(str(os.getpid()))
-        debug(f"Acquired lock for {_lockfile} (PID {os.getpid()})")
+        debug(f"Acquired lock for {lockfile} (PID {os.getpid()})")
         return True
     except IOError as e:
         error(f"Failed to create lockfile: {e}")
         return False
 
 
-def release_lock():
-    """Release the lockfile."""
+def release_lockfile(lockfile):
+    """Remove a lockfile if this process holds it."""
     try:
-        if os.path.exists(_lockfile):
+        if os.path.exists(lockfile):
             # Verify it's our lockfile before removing
-            with open(_lockfile, 'r') as f:
+            with open(lockfile, 'r') as f:
                 pid = int(f.read().strip())
             if pid == os.getpid():
-                os.remove(_lockfile)
-                debug(f"Released lock for {_lockfile} (PID {os.getpid()})")
+                os.remove(lockfile)
+                debug(f"Released lock for {lockfile} (PID {os.getpid()})")
             else:
                 debug(f"Not removing lockfile - belongs to PID {pid}, not {os.getpid()}")
     except (ValueError, IOError, OSError) as e:
         debug(f"Error releasing lock: {e}")
 
 
+def acquire_lock():
+    """Acquire the lockfile of every host this run pushes to, or none of them.
+
+    Returns True if all locks were acquired, False otherwise.
+    """
+    acquired = []
+    for lockfile in [_lockfile] + _fanout_lockfiles:
+        if not acquire_lockfile(lockfile):
+            for held in acquired:
+                release_lockfile(held)
+            return False
+        acquired.append(lockfile)
+    return True
+
+
+def release_lock():
+    """Release the lockfiles and tear down the SSH master connections."""
+    close_ssh_masters()
+
+    for lockfile in [_lockfile] + _fanout_lockfiles:
+        release_lockfile(lockfile)
+
+
 def signal_handler(signum, frame):
     """Handle termination signals by cleaning up lockfile."""
     signal_names = {
@@ -118,6 +370,157 @@ def signal_handler(signum, frame):
     sys.exit(1)
 
 
+def bwlimit_signal_handler(signum, frame):
+    """Handle SIGUSR1 by asking the relay to re-read the bandwidth limit control file."""
+    _bwlimit_reload.set()
+
+
+def reload_bwlimit():
+    """Apply the bandwidth limit written in the control file.
+
+    The file holds a rate in --bwlimit format; empty, "0" or "none" lifts the limit.
+    """
+    global _bwlimit, _bwlimit_bytes
+    try:
+        with open(_bwlimit_file) as f:
+            value = f.read().strip()
+    except OSError as e:
+        error(f"Could not read bandwidth limit from {_bwlimit_file}: {e}")
+        return
+
+    if value.lower() in ('', '0', 'none'):
+        _bwlimit = None
+        _bwlimit_bytes = None
+        info("Bandwidth limit lifted")
+        return
+
+    rate = parse_size_to_bytes(value)
+    if not rate:
+        error(f"Ignoring invalid bandwidth limit '{value}' in {_bwlimit_file}")
+        return
+    _bwlimit = value
+    _bwlimit_bytes = rate
+    info(f"Bandwidth limit set to {value}")
+
+
+def parse_bwlimit_schedule(spec):
+    """Parse a --bwlimit-schedule like "00:00-07:00=unlimited,07:00-23:00=2m"
+    into a list of (start minute, end minute, limit, bytes/second or None).
+
+    A window ending before it starts runs past midnight; 24:00 is only valid
+    as an end time. Returns None if the spec is invalid.
+    """
+    schedule = []
+    for window in spec.split(','):
+        match = re.match(r'^(\d{1,2}):(\d{2})-(\d{1,2}):(\d{2})=(\S+)$', window.strip())
+        if not match:
+            return None
+        start_h, start_m, end_h, end_m = (int(part) for part in match.groups()[:4])
+        limit = match.group(5)
+        if start_h > 23 or start_m > 59 or end_m > 59 or end_h > 24 or (end_h == 24 and end_m):
+            return None
+        rate = None
+        if limit.lower() not in ('unlimited', 'none', '0'):
+            rate = parse_size_to_bytes(limit)
+            if not rate:
+                return None
+        schedule.append((start_h * 60 + start_m, end_h * 60 + end_m, limit, rate))
+    return schedule
+
+
+def current_bwlimit_window(schedule, minute):
+    """Index of the first window of schedule covering minute of the day, or None."""
+    for index, (start, end, _, _) in enumerate(schedule):
+        if start <= minute < end or (end <= start and (minute >= start or minute < end)):
+            return index
+    return None
+
+
+def apply_bwlimit_schedule():
+    """Switch the bandwidth limit when the time of day enters another window of
+    --bwlimit-schedule (or leaves them all, back to --bwlimit).
+
+    Only changes of window apply, so a limit set through the control file
+    holds until the next one.
+    """
+    global _bwlimit, _bwlimit_bytes, _bwlimit_window
+    if not _bwlimit_schedule:
+        return
+    now = time.localtime()
+    window = current_bwlimit_window(_bwlimit_schedule, now.tm_hour * 60 + now.tm_min)
+    if window == _bwlimit_window:
+        return
+    # The run reports the limit it starts with itself
+    report = info if _bwlimit_window != -1 else debug
+    _bwlimit_window = window
+    if window is None:
+        _bwlimit, _bwlimit_bytes = _bwlimit_default
+    else:
+        _, _, limit, rate = _bwlimit_schedule[window]
+        _bwlimit, _bwlimit_bytes = (limit, rate) if rate else (None, None)
+    report(f"Bandwidth limit set to {_bwlimit} by schedule" if _bwlimit else "Bandwidth limit lifted by schedule")
+
+
+def open_ssh_master(user, host):
+    """Open a persistent, multiplexed SSH connection to user@host.
+
+    Every later ssh_command() for the same user@host reuses this connection's
+    control socket instead of paying for a new key exchange. ControlPersist
+    bounds how long an orphaned master can outlive a crashed run.
+    Returns (True, None) on success, or (False, stderr) if the connection failed.
+    """
+    global _ssh_control_dir
+    if _ssh_control_dir is None:
+        _ssh_control_dir = tempfile.mkdtemp(prefix='zfs-push-backups-ssh-')
+
+    target = f"{user}@{host}"
+    control_path = os.path.join(_ssh_control_dir, f"{len(_ssh_masters)}.sock")
+    command = f"ssh -M -S {control_path} -o ControlPersist={SSH_CONTROL_PERSIST} -f -N {target}"
+
+    debug(command)
+
+    # ssh -f forks into the background and keeps its stdio open, so capturing
+    # through a pipe would block until the master exits; use a file instead.
+    with tempfile.TemporaryFile() as stderr:
+        result = run_command(
+            command.split(' '),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=stderr,
+            check=False
+        )
+        if result.returncode != 0:
+            stderr.seek(0)
+            return False, stderr.read().decode().strip()
+
+    _ssh_masters[target] = control_path
+    debug(f"Opened SSH master connection to {target}")
+    return True, None
+
+
+def ssh_command(user, host):
+    """Return the ssh command prefix used for every remote command on user@host."""
+    control_path = _ssh_masters.get(f"{user}@{host}")
+    if control_path:
+        return f"ssh -S {control_path} {user}@{host}"
+    return f"ssh {user}@{host}"
+
+
+def close_ssh_masters():
+    """Tear down every SSH master connection opened by this run."""
+    global _ssh_control_dir
+    profile_phase('cleanup')
+    for target, control_path in list(_ssh_masters.items()):
+        run_command(['ssh', '-S', control_path, '-O', 'exit', target],
+                    capture_output=True, check=False)
+        del _ssh_masters[target]
+        debug(f"Closed SSH master connection to {target}")
+
+    if _ssh_control_dir is not None:
+        shutil.rmtree(_ssh_control_dir, ignore_errors=True)
+        _ssh_control_dir = None
+
+
 def parse_size_to_bytes(size_str):
     """Parse a human-readable size string to bytes.
 
@@ -165,8 +568,8 @@ def format_duration(seconds):
         return f"{hours}h {mins}m"
 
 
-def get_send_size(dataset, snapshot, incremental_from=None):
-    """Get estimated size of a zfs send operation using -nv (dry run).
+def get_send_size(args):
+    """Get estimated size of `zfs send <args>` using -nvP (dry run).
 
     Returns size in bytes, or None if estimation fails.
 
@@ -175,15 +578,13 @@ def get_send_size(dataset, snapshot, incremental_from=None):
         size    1234567890
     The 'size' line contains the total bytes to transfer.
     """
-    if incremental_from:
-        cmd = f"zfs send -nv -w -I {dataset}@{incremental_from} {dataset}@{snapshot}"
-    else:
-        cmd = f"zfs send -nv -w {dataset}@{snapshot}"
+    # -t streams carry their own flags
+    cmd = f"zfs send -nvP {args}" if args.startswith('-t ') else f"zfs send -nvP -w {args}"
 
     debug(f"Estimating size: {cmd}")
 
     try:
-        result = subprocess.run(
+        result = run_command(
             cmd.split(' '),
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
@@ -224,34 +625,11 @@ def get_send_size(dataset, snapshot, incremental_from=None):
         return None
 
 
-def preflight(host, datasets, user, destination, strip_prefix):
-    # Check pv is available if bandwidth limiting is requested
-    if _bwlimit:
-        debug('Checking pv is installed for bandwidth limiting')
-        result = subprocess.run(['which', 'pv'],
-                shell=False,
-                check=False,
-                capture_output=True
-                )
-        if result.returncode != 0:
-            error('pv is required for bandwidth limiting but not found.')
-            sys.exit(1)
-        info(f'Bandwidth limit set to {_bwlimit}')
-
-    info('Checking remote host is up')
-    result = subprocess.run(['ssh', f'{user}@{host}', 'ls'],
-            shell=False,
-            check=False,
-            capture_output=True
-            )
-    if result.returncode != 0:
-        error(f'Could not connect to {host}\n  ssh: {result.stderr.decode().strip()}')
-        sys.exit(1)
-    info(f'{host} is up')
-
+def check_local(datasets):
+    """Check that the local datasets and stage tools are there; exits if not."""
     for dataset in datasets:
         debug(f'Checking local source {dataset} exists')
-        result = subprocess.run(
+        result = run_command(
             ['zfs', 'list', dataset],
             shell=False,
             check=False,
@@ -262,98 +640,701 @@ def preflight(host, datasets, user, destination, strip_prefix):
             sys.exit(1)
         debug(f'{dataset} exists')
 
+    for tool in stage_tools():
+        debug(f'Checking {tool} is available locally')
+        if not shutil.which(tool):
+            error(f'{tool} is not installed locally')
+            sys.exit(1)
+
+
+def check_remote(host, user, destination):
+    """Connect to host and check it has the stage tools and the destination dataset.
+
+    Returns True if the host can be pushed to; the reason is reported if not.
+    """
+    info(f'Checking {host} is up')
+    connected, ssh_error = open_ssh_master(user, host)
+    if not connected:
+        error(f'Could not connect to {host}\n  ssh: {ssh_error}')
+        return False
+    info(f'{host} is up')
+
+    for tool in stage_tools():
+        debug(f'Checking {tool} is available on {host}')
+        result = run_command(
+            ssh_command(user, host).split(' ') + [f'command -v {tool}'],
+            check=False,
+            capture_output=True
+            )
+        if result.returncode != 0:
+            error(f'{tool} is not installed on {host}')
+            return False
+
     debug(f'Checking remote destination dataset {destination} exists')
-    result = subprocess.run(['ssh', f'{user}@{host}', f'zfs list {destination}'],
+    result = run_command(ssh_command(user, host).split(' ') + [f'zfs list {destination}'],
             shell=False,
             check=False,
             capture_output=True
             )
     if result.returncode != 0:
-        error(f'Remote destination {destination} does not exist\n  zfs: {result.stderr.decode().strip()}')
-        sys.exit(1)
+        error(f'Remote destination {destination} does not exist on {host}\n  zfs: {result.stderr.decode().strip()}')
+        return False
     debug(f'Destination {destination} exists')
+    return True
+
+
+def preflight(host, datasets, user, destination, strip_prefix):
+    profile_phase('preflight')
+    apply_bwlimit_schedule()
+    if _bwlimit:
+        info(f'Bandwidth limit set to {_bwlimit}')
+    debug(f'Bandwidth limit can be changed by writing it to {_bwlimit_file} and sending SIGUSR1 (PID {os.getpid()})')
+
+    check_local(datasets)
+    if not check_remote(host, user, destination):
+        sys.exit(1)
 
     pushdatasets_init(host, datasets, user, destination, strip_prefix)
 
-def get_local_child_datasets(dataset):
-    """Get all datasets under a parent (including the parent itself)."""
-    command = f"zfs list -H -o name -r {dataset}"
+
+def preflight_fanout(targets, datasets, strip_prefix):
+    """preflight() for a fan-out push to several targets ({host, user, destination}).
+
+    A target that fails its checks is left out and the push goes ahead to the
+    others; exits with an error at the end if any target was left out or failed.
+    """
+    profile_phase('preflight')
+    apply_bwlimit_schedule()
+    if _bwlimit:
+        info(f'Bandwidth limit set to {_bwlimit}')
+    debug(f'Bandwidth limit can be changed by writing it to {_bwlimit_file} and sending SIGUSR1 (PID {os.getpid()})')
+
+    check_local(datasets)
+    reachable = [target for target in targets if check_remote(target['host'], target['user'], target['destination'])]
+
+    failed = [target['host'] for target in targets if target not in reachable]
+    if reachable:
+        failed += pushdatasets_fanout(reachable, datasets, strip_prefix)
+    if failed:
+        error(f"Push failed for: {', '.join(failed)}")
+        sys.exit(1)
+
+def get_journal_path(host):
+    """Path of the replication journal for pushes to one host, or None if disabled."""
+    if not _journal_dir:
+        return None
+    safe_host = re.sub(r'[^a-zA-Z0-9.-]', '-', host)
+    return os.path.join(_journal_dir, f"push-{safe_host}.json")
+
+
+def load_journal(path):
+    """Load a replication journal: {dataset: {snapshot, guid, createtxg}} of the
+    newest snapshot last replicated. A missing or unreadable journal is empty."""
+    if not path:
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        debug(f"Ignoring unreadable journal {path}: {e}")
+        return {}
+
+
+def save_journal(path, updates):
+    """Merge this run's entries into the journal on disk, replacing it atomically."""
+    if not path or not updates:
+        return
+    journal = load_journal(path)
+    journal.update(updates)
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(journal, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        error(f"Could not write journal {path}: {e}")
+
+
+def get_local_inventory(datasets):
+    """Return {dataset: [snapshots, oldest first]} for every dataset under the
+    given ones (including themselves), in hierarchy order, from one listing."""
+    command = f"zfs list -t filesystem,volume,snapshot -Hp -o {LOCAL_PROPERTIES} -s createtxg -r {' '.join(datasets)}"
 
     debug(command)
 
     try:
-        result = subprocess.run(
+        result = run_command(
             command.split(' '),
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             check=True
         )
-        datasets = result.stdout.decode().strip().splitlines()
-
-        debug(f"Found {len(datasets)} datasets under {dataset}")
-
-        return datasets
-
     except subprocess.CalledProcessError as e:
         error(f"Could not list local datasets: {e.stderr.decode()}")
         sys.exit(1)
 
+    inventory = {}
+    for line in result.stdout.decode().splitlines():
+        dataset = line.split('\t')[0].partition('@')[0]
+        inventory.setdefault(dataset, []).extend(parse_snapshots(line, dataset))
 
-def pushdatasets_init(host, datasets, user, destination, strip_prefix):
-    # Expand each dataset to include all children (like pull script does)
-    all_datasets = []
+    debug(f"Found {len(inventory)} datasets under {' '.join(datasets)}")
+
+    # Parents before children, as `zfs list -r` without sorting would list them
+    return {dataset: inventory[dataset] for dataset in sorted(inventory, key=lambda d: d.split('/'))}
+
+
+def get_remote_inventory(host, user, destination):
+    """Return {remote dataset: {'snapshots', 'resume_token'}} for the whole
+    destination tree, from one listing.
+
+    The run keeps it as its index of the remote side: what exists, what each
+    dataset holds and which receives were interrupted.
+    """
+    command = f"{ssh_command(user, host)} zfs list -t filesystem,volume,snapshot -Hp -o name,guid,receive_resume_token -s createtxg -r {destination}"
+
+    debug(command)
+
+    result = run_command(command.split(' '), capture_output=True, check=False)
+    if result.returncode != 0:
+        error(f"Could not list {destination} on {host}: {result.stderr.decode().strip()}")
+        return None
+    inventory = {}
+    for line in result.stdout.decode().splitlines():
+        fields = line.split('\t')
+        dataset, _, snapshot = fields[0].partition('@')
+        entry = inventory.setdefault(dataset, {'snapshots': [], 'resume_token': None})
+        if snapshot:
+            entry['snapshots'].append({'name': snapshot, 'guid': fields[1]})
+        elif len(fields) > 2 and fields[2] not in ('', '-'):
+            entry['resume_token'] = fields[2]
+    return inventory
+
+
+def create_remote_parents(host, user, datasets, destination, strip_prefix, remote_index, received):
+    """Create the missing ancestors of the remote counterparts of datasets, each
+    level with canmount=off, in one SSH command, and add them to remote_index.
+
+    Ancestors in received are left alone; their own full receive creates them.
+    Returns True on success.
+    """
+    missing = []
     for dataset in datasets:
-        children = get_local_child_datasets(dataset)
-        all_datasets.extend(children)
-
-    # Remove duplicates while preserving order
-    seen = set()
-    unique_datasets = []
-    for ds in all_datasets:
-        if ds not in seen:
-            seen.add(ds)
-            unique_datasets.append(ds)
-
-    info(f"Pushing {len(unique_datasets)} datasets individually")
-    for dataset in unique_datasets:
-        pushdatasets(host, dataset, user, destination, strip_prefix)
-    print('')
+        parts = get_remote_dataset(dataset, destination, strip_prefix).split('/')
+        # Not using -p so that we control the properties on each level
+        for i in range(destination.count('/') + 2, len(parts)):
+            ancestor = '/'.join(parts[:i])
+            if ancestor not in remote_index and ancestor not in received and ancestor not in missing:
+                missing.append(ancestor)
+    if not missing:
+        return True
+
+    for ancestor in missing:
+        info(f"Creating remote dataset: {ancestor}")
+    command = ' && '.join(f"zfs create -o canmount=off {ancestor}" for ancestor in missing)
+    debug(command)
+    result = run_command(ssh_command(user, host).split(' ') + [command], capture_output=True, check=False)
+    if result.returncode != 0:
+        error(f"Failed to create remote datasets on {host}: {result.stderr.decode().strip()}")
+        return False
+    for ancestor in missing:
+        remote_index[ancestor] = {'snapshots': [], 'resume_token': None}
+    return True
+
+
+def plan_push(dataset, local_snapshots, remote_entry):
+    """Work out what pushing one dataset involves, without sending anything.
+
+    Returns a plan item with the dataset, the kind of transfer (full,
+    incremental, resume or none), its steps (see plan_push_steps) and the
+    estimated bytes, None if unknown; a resume also carries the resume_token. Steps the snapshot properties can't size,
+    and resumes, get a `zfs send -nvP` dry run.
+    """
+    item = {'dataset': dataset, 'kind': 'none', 'steps': [], 'bytes': 0}
+    if not local_snapshots:
+        return item
+    if remote_entry and remote_entry['resume_token']:
+        # The rest of the dataset is planned after the resume has landed
+        item.update(kind='resume', resume_token=remote_entry['resume_token'],
+                    bytes=get_send_size(f"-t {remote_entry['resume_token']}"))
+        return item
+
+    remote_snapshots = remote_entry['snapshots'] if remote_entry else []
+    bookmarks = []
+    if remote_snapshots and find_latest_common(local_snapshots, remote_snapshots) is None:
+        bookmarks = get_local_bookmarks(dataset)
+    steps = plan_push_steps(dataset, local_snapshots, remote_snapshots, bookmarks)
+    for step in steps:
+        if step['bytes'] is None:
+            step['bytes'] = get_send_size(step['args'])
+    if steps:
+        sizes = [step['bytes'] for step in steps]
+        item.update(kind=steps[0]['kind'], steps=steps, bytes=None if None in sizes else sum(sizes))
+    return item
+
+
+def get_observed_rate(host):
+    """Average throughput (bytes/second) of recent successful pushes to host,
+    taken from the metrics log, or None if there is no usable history."""
+    if not _metrics_log:
+        return None
+    try:
+        with open(_metrics_log, 'rb') as f:
+            # Only the tail matters; the log grows forever
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 256 * 1024))
+            lines = f.read().decode(errors='replace').splitlines()[1:]
+    except OSError:
+        return None
+
+    total_bytes = total_seconds = 0
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        # Tiny transfers are dominated by setup time and say little about throughput
+        if (record.get('direction') == 'push' and record.get('host') == host and record.get('ok')
+                and record.get('bytes', 0) >= 1024 * 1024 and record.get('seconds')):
+            total_bytes += record['bytes']
+            total_seconds += record['seconds']
+    return total_bytes / total_seconds if total_seconds else None
 
 
-def get_local_snapshots(dataset):
-    """Get all snapshot names for a local dataset, sorted by creation time."""
-    command = f"zfs list -t snapshot -H -o name -s creation -r {dataset}"
+def print_plan(host, plan):
+    """Print the pending transfers to host with total size and ETA.
 
+    The ETA assumes the throughput seen in recent pushes to this host, capped
+    by --bwlimit. Returns the estimated total bytes.
+    """
+    pending = [item for item in plan if item['kind'] != 'none']
+    if not pending:
+        info(f"Plan for {host}: nothing to transfer, {len(plan)} datasets up to date")
+        return 0
+
+    total = sum(item['bytes'] or 0 for item in pending)
+    summary = f"Plan for {host}: {len(pending)} transfers, {format_bytes(total)} estimated"
+    rate = get_observed_rate(host)
+    if _bwlimit_bytes:
+        rate = min(rate, _bwlimit_bytes) if rate else _bwlimit_bytes
+    if rate:
+        summary += f", ETA {format_duration(total / rate)} at {format_bytes(rate)}/s"
+    info(summary)
+
+    for item in pending:
+        size = 'unknown' if item['bytes'] is None else format_bytes(item['bytes'])
+        info(f"  {item['kind']:<11} {size:>11}  {item['dataset']}")
+    debug(f"{len(plan) - len(pending)} datasets up to date")
+    return total
+
+
+def report_progress(count, total_count, done_bytes, total_bytes, started):
+    """Report how far through the plan the run is, with an ETA from the rate so far."""
+    message = f"Progress: {count}/{total_count} datasets"
+    if total_bytes:
+        message += f", {format_bytes(done_bytes)} of {format_bytes(total_bytes)} ({100 * done_bytes // total_bytes}%)"
+        elapsed = time.monotonic() - started
+        if 0 < done_bytes < total_bytes and elapsed > 0:
+            message += f", ETA {format_duration((total_bytes - done_bytes) / (done_bytes / elapsed))}"
+    info(message)
+
+
+def get_remote_dataset(dataset, destination, strip_prefix):
+    """Map a local dataset to its path under the remote destination.
+
+    e.g. with strip_prefix "slowpool/encryptedbackups",
+    "slowpool/encryptedbackups/host-storage/fastpool/data" becomes
+    "<destination>/host-storage/fastpool/data".
+    """
+    if strip_prefix and dataset.startswith(strip_prefix + "/"):
+        relative_path = dataset[len(strip_prefix) + 1:]
+    else:
+        relative_path = dataset
+    return f"{destination}/{relative_path}"
+
+
+def get_journal_matches(host, user, journal, newest, destination, strip_prefix):
+    """Return the datasets with nothing to push: those whose newest local
+    snapshot is the one the journal recorded and which the remote still holds,
+    plus those without any local snapshots.
+
+    The remote side is checked with a single `zfs get` of the journalled
+    snapshots, so a target that was rolled back or wiped is not taken on trust.
+    """
+    matches = {dataset for dataset, snapshot in newest.items() if snapshot is None}
+    snapshots = {
+        f"{get_remote_dataset(dataset, destination, strip_prefix)}@{snapshot['name']}": dataset
+        for dataset, snapshot in newest.items()
+        if snapshot and journal.get(dataset, {}).get('guid') == snapshot['guid']
+    }
+    if not snapshots:
+        return matches
+
+    command = f"{ssh_command(user, host)} zfs get -H -p -o name,value guid {' '.join(snapshots)}"
     debug(command)
+    # Snapshots that don't exist are reported on stderr; the rest are still listed
+    result = run_command(command.split(' '), capture_output=True, check=False)
+
+    for line in result.stdout.decode().splitlines():
+        full_name, _, guid = line.partition('\t')
+        dataset = snapshots.get(full_name)
+        if dataset and guid == newest[dataset]['guid']:
+            matches.add(dataset)
+    return matches
+
+
+def pushdatasets_init(host, datasets, user, destination, strip_prefix):
+    # One local listing expands each dataset to include all children and gives
+    # its newest snapshot; datasets the journal says were already pushed up to
+    # that snapshot are skipped without listing anything on the remote.
+    profile_phase('listing')
+    inventory = get_local_inventory(datasets)
+    newest = {dataset: snapshots[-1] if snapshots else None for dataset, snapshots in inventory.items()}
+    journal_path = get_journal_path(host)
+    journal = load_journal(journal_path)
+    unchanged = get_journal_matches(host, user, journal, newest, destination, strip_prefix) if journal else set()
+
+    queue = [dataset for dataset in newest if dataset not in unchanged]
+    if not queue:
+        info(f"All {len(newest)} datasets unchanged since the last run")
+        return
 
+    # Plan and size the whole queue up front from one listing per side; the
+    # remote one also tells which parents are missing, created in one go
+    remote_index = get_remote_inventory(host, user, destination)
+    if remote_index is None:
+        sys.exit(1)
+    profile_phase('planning')
+    received = {get_remote_dataset(dataset, destination, strip_prefix) for dataset in queue if inventory[dataset]}
+    plan = [plan_push(dataset, inventory[dataset], remote_index.get(get_remote_dataset(dataset, destination, strip_prefix)))
+            for dataset in queue]
+    total_bytes = print_plan(host, plan)
+    profile_phase('parents')
+    if not create_remote_parents(host, user, queue, destination, strip_prefix, remote_index, received):
+        sys.exit(1)
+
+    info(f"Pushing {len(queue)} datasets individually" + (f" ({len(unchanged)} unchanged)" if unchanged else ""))
+    profile_phase('transfer')
+    updates = {}
+    done_bytes = 0
+    started = time.monotonic()
     try:
-        result = subprocess.run(
-            command.split(' '),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True
-        )
-        snapshots = result.stdout.decode().strip().splitlines()
+        for count, item in enumerate(plan, 1):
+            dataset = item['dataset']
+            pushdatasets(host, dataset, user, destination, strip_prefix, inventory[dataset], item)
+            if item['kind'] != 'none':
+                done_bytes += item['bytes'] or 0
+                report_progress(count, len(plan), done_bytes, total_bytes, started)
+            if newest[dataset]:
+                updates[dataset] = {
+                    'snapshot': newest[dataset]['name'],
+                    'guid': newest[dataset]['guid'],
+                    'createtxg': newest[dataset]['createtxg'],
+                }
+    finally:
+        # Also on sys.exit() from a failed transfer, so the datasets before it count
+        profile_phase('journal')
+        save_journal(journal_path, updates)
+    print('')
+
+
+def pushdatasets_fanout(targets, datasets, strip_prefix):
+    """Push datasets to several targets at once, reading each stream locally only once.
+
+    Each target keeps its own journal, incremental bases and base protection;
+    targets in the same state share one `zfs send` (see pushdataset_fanout).
+    A target that fails a transfer gets nothing more this run, while the
+    others carry on. Returns the hosts that failed.
+    """
+    profile_phase('listing')
+    inventory = get_local_inventory(datasets)
+    newest = {dataset: snapshots[-1] if snapshots else None for dataset, snapshots in inventory.items()}
+    for target in targets:
+        target['journal'] = get_journal_path(target['host'])
+        journal = load_journal(target['journal'])
+        target['unchanged'] = get_journal_matches(target['host'], target['user'], journal, newest,
+                                                  target['destination'], strip_prefix) if journal else set()
+        target['updates'] = {}
+
+    queue = [dataset for dataset in newest if any(dataset not in target['unchanged'] for target in targets)]
+    if not queue:
+        info(f"All {len(newest)} datasets unchanged since the last run on {len(targets)} hosts")
+        return []
+
+    failed = []
+    for target in targets:
+        host, destination = target['host'], target['destination']
+        pending = [dataset for dataset in queue if dataset not in target['unchanged']]
+        profile_phase('listing')
+        target['index'] = get_remote_inventory(host, target['user'], destination)
+        if target['index'] is None:
+            failed.append(host)
+            continue
+        profile_phase('planning')
+        print_plan(host, [
+            plan_push(dataset, inventory[dataset], target['index'].get(get_remote_dataset(dataset, destination, strip_prefix)))
+            for dataset in pending
+        ])
+        received = {get_remote_dataset(dataset, destination, strip_prefix) for dataset in pending if inventory[dataset]}
+        profile_phase('parents')
+        if not create_remote_parents(host, target['user'], pending, destination, strip_prefix, target['index'], received):
+            failed.append(host)
+
+    info(f"Pushing {len(queue)} datasets to {', '.join(target['host'] for target in targets if target['host'] not in failed)}")
+    profile_phase('transfer')
+    try:
+        for dataset in queue:
+            pending = [target for target in targets
+                       if target['host'] not in failed and dataset not in target['unchanged']]
+            if not pending:
+                continue
+            done = pushdataset_fanout(dataset, inventory[dataset], pending, strip_prefix)
+            for target in pending:
+                if target['host'] not in done:
+                    error(f"Push of {dataset} to {target['host']} failed, skipping the rest for that host")
+                    failed.append(target['host'])
+                elif newest[dataset]:
+                    target['updates'][dataset] = {
+                        'snapshot': newest[dataset]['name'],
+                        'guid': newest[dataset]['guid'],
+                        'createtxg': newest[dataset]['createtxg'],
+                    }
+    finally:
+        profile_phase('journal')
+        for target in targets:
+            save_journal(target['journal'], target['updates'])
+    print('')
+    return failed
+
+
+def parse_snapshots(output, dataset, separator='@'):
+    """Parse `zfs list -t snapshot -Hp -o name,guid[,createtxg[,referenced,written]]`
+    output into a list of dicts with those keys for the direct snapshots of
+    dataset (or its bookmarks, with separator '#')."""
+    snapshots = []
+    for line in output.splitlines():
+        fields = line.split('\t')
         # Filter to only direct snapshots of this dataset (not child datasets)
-        direct_snapshots = [s.split("@")[1] for s in snapshots if s.startswith(f"{dataset}@")]
+        if len(fields) > 1 and fields[0].startswith(f"{dataset}{separator}"):
+            snapshot = {'name': fields[0].split(separator)[1], 'guid': fields[1]}
+            if len(fields) > 2:
+                snapshot['createtxg'] = int(fields[2])
+            if len(fields) > 4:
+                snapshot['referenced'] = int(fields[3]) if fields[3].isdigit() else 0
+                snapshot['written'] = int(fields[4]) if fields[4].isdigit() else 0
+            snapshots.append(snapshot)
+    return snapshots
+
+
+def find_latest_common(source_snapshots, target_snapshots):
+    """Return the newest source snapshot that also exists on the target, or None.
+
+    Snapshots are matched by guid rather than name, so a snapshot that was
+    destroyed and recreated under the same name is not mistaken for a base
+    the target can receive an incremental on top of.
+    """
+    target_guids = {s['guid'] for s in target_snapshots}
+    for snapshot in reversed(source_snapshots):
+        if snapshot['guid'] in target_guids:
+            return snapshot
+    return None
 
-        debug(f"Found {len(direct_snapshots)} local snapshots")
 
-        return direct_snapshots
+def bootstrap_chain(snapshots):
+    """Names of the snapshots an initial push of a dataset sends, oldest first.
+
+    history sends the earliest snapshot and then everything up to the latest
+    with -I; the other modes send only their snapshots, each as an -i
+    incremental on the one before, so the history in between is skipped.
+    """
+    if _bootstrap == 'latest' or len(snapshots) == 1:
+        return [snapshots[-1]['name']]
+    if _bootstrap == 'anchors':
+        # Snapshot names end in their type, e.g. autosnap_2025-01-01_00:25:00_yearly
+        return [s['name'] for s in snapshots[:-1] if s['name'].rsplit('_', 1)[-1] in _bootstrap_anchors] + [snapshots[-1]['name']]
+    return [snapshots[0]['name'], snapshots[-1]['name']]
 
-    except subprocess.CalledProcessError as e:
-        error(f"Could not get local snapshots: {e.stderr.decode()}")
-        sys.exit(1)
+
+def get_local_bookmarks(dataset):
+    """Get all bookmarks (name, guid and createtxg) of a local dataset, sorted by creation."""
+    command = f"zfs list -t bookmark -Hp -o name,guid,createtxg -s createtxg -d 1 {dataset}"
+
+    debug(command)
+
+    result = run_command(command.split(' '), capture_output=True, check=False)
+    if result.returncode != 0:
+        debug(f"Could not list bookmarks of {dataset}: {result.stderr.decode().strip()}")
+        return []
+    return parse_snapshots(result.stdout.decode(), dataset, separator='#')
+
+
+def find_bookmark_base(local_snapshots, bookmarks, remote_snapshots):
+    """Return the newest local bookmark of a snapshot the remote still has, or None.
+
+    Used when every snapshot shared with the remote has been pruned locally:
+    an incremental can still be sent from the bookmark (with -i, as -I can't
+    start at a bookmark) if there are local snapshots after it.
+    """
+    remote_guids = {s['guid'] for s in remote_snapshots}
+    for bookmark in reversed(bookmarks):
+        if bookmark['guid'] in remote_guids and bookmark['createtxg'] < local_snapshots[-1]['createtxg']:
+            return bookmark
+    return None
+
+
+def protect_base(dataset, snapshot, tag=None):
+    """Protect dataset@snapshot as the base of the next incremental push (see
+    PROTECT_MODES), then drop the protection of older snapshots.
+
+    Failures are reported but don't fail the push; at worst the next push has
+    to start over if the base is pruned first. tag defaults to this run's
+    --protect-tag.
+    """
+    tag = tag or _protect_tag
+    commands = []
+    if _protect == 'hold':
+        result = run_command(['zfs', 'list', '-t', 'snapshot', '-Hp', '-o', 'name,userrefs', '-d', '1', dataset],
+                             capture_output=True, check=False)
+        held = [line.split('\t')[0] for line in result.stdout.decode().splitlines()
+                if line.startswith(f"{dataset}@") and line.split('\t')[-1] not in ('0', '-')]
+        tagged = set()
+        if held:
+            result = run_command(['zfs', 'holds', '-H'] + held, capture_output=True, check=False)
+            tagged = {line.split('\t')[0] for line in result.stdout.decode().splitlines()
+                      if line.split('\t')[1:2] == [tag]}
+        if f"{dataset}@{snapshot}" not in tagged:
+            commands.append(['zfs', 'hold', tag, f"{dataset}@{snapshot}"])
+        commands.extend(['zfs', 'release', tag, name] for name in sorted(tagged) if name != f"{dataset}@{snapshot}")
+    else:
+        bookmark = f"{tag}_{snapshot}"
+        existing = [b['name'] for b in get_local_bookmarks(dataset)]
+        if bookmark not in existing:
+            commands.append(['zfs', 'bookmark', f"{dataset}@{snapshot}", f"{dataset}#{bookmark}"])
+        commands.extend(['zfs', 'destroy', f"{dataset}#{b}"] for b in existing
+                        if b.startswith(f"{tag}_") and b != bookmark)
+
+    for command in commands:
+        debug(' '.join(command))
+        result = run_command(command, capture_output=True, check=False)
+        if result.returncode != 0:
+            error(f"Could not protect {dataset}@{snapshot} with a {_protect}\n  zfs: {result.stderr.decode().strip()}")
+            # Keep the old protection until the new one is in place
+            return
+
+
+def written_between(snapshots, after, upto):
+    """Bytes written to a dataset after createtxg `after` up to and including
+    createtxg `upto`: what an incremental between the two carries."""
+    return sum(s.get('written', 0) for s in snapshots if after < s['createtxg'] <= upto)
+
+
+def plan_push_steps(dataset, local_snapshots, remote_snapshots, bookmarks):
+    """The sends that bring a remote holding remote_snapshots up to the latest
+    local snapshot, as {'args', 'kind', 'bytes'} dicts (args for `zfs send -w`);
+    empty if it is up to date.
+
+    An -I incremental from the newest common snapshot,
+    else -i from a bookmark of one, else a full send of the bootstrap chain.
+    bytes comes from the local snapshots' referenced and written properties,
+    and is None for an -i step skipping history, which they can't size.
+    """
+    latest = local_snapshots[-1]
+    common = find_latest_common(local_snapshots, remote_snapshots)
+    if common is latest:
+        return []
+    if common is not None:
+        return [{'args': f"-I {dataset}@{common['name']} {dataset}@{latest['name']}", 'kind': 'incremental',
+                 'bytes': written_between(local_snapshots, common['createtxg'], latest['createtxg'])}]
+
+    bookmark = find_bookmark_base(local_snapshots, bookmarks, remote_snapshots) if remote_snapshots else None
+    if bookmark is not None:
+        after = [s for s in local_snapshots if s['createtxg'] > bookmark['createtxg']]
+        steps = [{'args': f"-i {dataset}#{bookmark['name']} {dataset}@{after[0]['name']}", 'kind': 'incremental',
+                  'bytes': written_between(local_snapshots, bookmark['createtxg'], after[0]['createtxg'])}]
+        if after[0] is not latest:
+            steps.append({'args': f"-I {dataset}@{after[0]['name']} {dataset}@{latest['name']}", 'kind': 'incremental',
+                          'bytes': written_between(local_snapshots, after[0]['createtxg'], latest['createtxg'])})
+        return steps
+
+    by_name = {s['name']: s for s in local_snapshots}
+    chain = [by_name[name] for name in bootstrap_chain(local_snapshots)]
+    steps = [{'args': f"{dataset}@{chain[0]['name']}", 'kind': 'full', 'bytes': chain[0].get('referenced')}]
+    for previous, snapshot in zip(chain, chain[1:]):
+        if _bootstrap == 'history':
+            steps.append({'args': f"-I {dataset}@{previous['name']} {dataset}@{snapshot['name']}", 'kind': 'incremental',
+                          'bytes': written_between(local_snapshots, previous['createtxg'], snapshot['createtxg'])})
+        else:
+            steps.append({'args': f"-i {dataset}@{previous['name']} {dataset}@{snapshot['name']}", 'kind': 'incremental',
+                          'bytes': None})
+    return steps
+
+
+def pushdataset_fanout(dataset, local_snapshots, targets, strip_prefix):
+    """Bring dataset up to date on every target; returns the hosts that are.
+
+    The remote side comes from each target's index (see get_remote_inventory).
+    Resume tokens are dealt with per target first. Targets that then need the
+    same sends are grouped and fed from one `zfs send` each; a target on a
+    different base gets a stream of its own.
+    """
+    if not local_snapshots:
+        info(f"Skipping {dataset} - no snapshots found locally")
+        return {target['host'] for target in targets}
+    latest_local = local_snapshots[-1]['name']
+
+    done = set()
+    groups = {}
+    bookmarks = None
+    for target in targets:
+        host, user = target['host'], target['user']
+        remote_dataset = get_remote_dataset(dataset, target['destination'], strip_prefix)
+        remote_entry = target['index'].get(remote_dataset, {'snapshots': [], 'resume_token': None})
+
+        remote_snapshots = remote_entry['snapshots']
+        if remote_entry['resume_token']:
+            resumed = resume_send(host, dataset, user, remote_dataset, remote_entry['resume_token'])
+            if not resumed and get_remote_resume_token(host, remote_dataset, user):
+                continue
+            remote_snapshots = get_remote_snapshots(host, remote_dataset, user)
+        if bookmarks is None and remote_snapshots and find_latest_common(local_snapshots, remote_snapshots) is None:
+            bookmarks = get_local_bookmarks(dataset)
+        steps = plan_push_steps(dataset, local_snapshots, remote_snapshots, bookmarks or [])
+        if not steps:
+            info(f"Up-to-date - {dataset} on {host}")
+            done.add(host)
+            continue
+        receive_cmd = remote_receive_command(user, host, f"-s -F -u {remote_dataset}")
+        groups.setdefault(tuple((step['args'], step['kind']) for step in steps), {})[host] = receive_cmd
+
+    for steps, receivers in groups.items():
+        info(f"Pushing {dataset} to {', '.join(receivers)}")
+        for args, kind in steps:
+            received = send_and_receive_fanout(f"zfs send -w {args}", receivers, dataset, kind)
+            receivers = {host: command for host, command in receivers.items() if host in received}
+            if not receivers:
+                break
+        if receivers:
+            info(f"Successfully synced {', '.join(receivers)} up to '{latest_local}'")
+        done.update(receivers)
+
+    if _protect != 'none':
+        for host in done:
+            protect_base(dataset, latest_local, tag=get_protect_tag(host))
+    return done
 
 
 def get_remote_snapshots(host, dataset, user):
-    """Get all snapshot names for a dataset on remote host, sorted by creation time."""
-    command = f"ssh {user}@{host} zfs list -t snapshot -H -o name -s creation -r {dataset}"
+    """Get all snapshots (name and guid) for a dataset on remote host, sorted by creation."""
+    command = f"{ssh_command(user, host)} zfs list -t snapshot -Hp -o name,guid -s createtxg -d 1 {dataset}"
 
     debug(command)
 
     try:
-        result = subprocess.run(
+        result = run_command(
             command.split(' '),
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
@@ -362,9 +1343,7 @@ def get_remote_snapshots(host, dataset, user):
         if result.returncode != 0:
             return []  # Dataset doesn't exist yet on remote
 
-        snapshots = result.stdout.decode().strip().splitlines()
-        # Filter to only direct snapshots of this dataset (not child datasets)
-        direct_snapshots = [s.split("@")[1] for s in snapshots if s.startswith(f"{dataset}@")]
+        direct_snapshots = parse_snapshots(result.stdout.decode(), dataset)
 
         debug(f"Found {len(direct_snapshots)} remote snapshots")
 
@@ -375,138 +1354,362 @@ def get_remote_snapshots(host, dataset, user):
         return []
 
 
-def ensure_remote_parent_exists(host, dataset, user):
-    """Ensure parent dataset exists on remote, creating each level with canmount=off."""
-    parent = "/".join(dataset.split("/")[:-1])
-    if not parent:
-        return True  # No parent needed (top-level dataset)
+def get_remote_resume_token(host, dataset, user):
+    """Get the receive_resume_token of a remote dataset, or None if it has none."""
+    command = f"{ssh_command(user, host)} zfs get -H -o value receive_resume_token {dataset}"
 
-    # Build list of ancestors that need to be checked/created
-    # e.g., for "pool/a/b/c" we need to check: pool, pool/a, pool/a/b, pool/a/b/c
-    parts = parent.split("/")
-    ancestors = []
-    for i in range(1, len(parts) + 1):
-        ancestors.append("/".join(parts[:i]))
+    debug(command)
 
-    for ancestor in ancestors:
-        # Check if this ancestor exists
-        check_cmd = f"ssh {user}@{host} zfs list {ancestor}"
-        debug(f"Checking if {ancestor} exists")
+    result = run_command(
+        command.split(' '),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=False  # Don't fail if dataset doesn't exist
+    )
+    token = result.stdout.decode().strip()
+    if result.returncode != 0 or token in ('', '-'):
+        return None
+    return token
 
-        result = subprocess.run(
-            check_cmd.split(' '),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=False
-        )
 
-        if result.returncode == 0:
-            debug(f"{ancestor} already exists")
-            continue
+def resume_send(host, dataset, user, remote_dataset, token):
+    """Finish an interrupted receive into remote_dataset from its resume token.
 
-        # Create this single level with canmount=off
-        # Not using -p so that we control the properties on each level
-        info(f"Creating remote dataset: {ancestor}")
-        create_cmd = f"ssh {user}@{host} zfs create -o canmount=off {ancestor}"
-        debug(create_cmd)
+    A token that can no longer be resumed (e.g. its source snapshot was
+    pruned) has its partial state aborted on the remote so the normal logic
+    can start over. Returns True if the resumed stream was received completely.
+    """
+    info(f"Resuming interrupted push of {dataset}")
 
-        try:
-            subprocess.run(
-                create_cmd.split(' '),
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                check=True
-            )
-        except subprocess.CalledProcessError as e:
-            error(f"Failed to create remote dataset {ancestor}: {e.stderr.decode()}")
-            return False
+    check_cmd = f"zfs send -nvP -t {token}"
+    debug(check_cmd)
+    result = run_command(check_cmd.split(' '), capture_output=True, check=False)
+    if result.returncode != 0:
+        info(f"Resume token is no longer valid, discarding partial receive of {remote_dataset}")
+        debug(f"  zfs send -t: {result.stderr.decode().strip()}")
+        abort_cmd = f"{ssh_command(user, host)} zfs receive -A {remote_dataset}"
+        debug(abort_cmd)
+        abort = run_command(abort_cmd.split(' '), capture_output=True, check=False)
+        if abort.returncode != 0:
+            error(f"Failed to abort partial receive into {remote_dataset}")
+            error(f"  zfs receive -A: {abort.stderr.decode().strip()}")
+        return False
 
+    send_cmd = f"zfs send -t {token}"
+    receive_cmd = remote_receive_command(user, host, f"-s -u {remote_dataset}")
+    if not send_and_receive(send_cmd, receive_cmd, host, dataset, 'resume'):
+        return False
+    info(f"Successfully resumed push of {dataset}")
     return True
 
 
-def send_and_receive(send_cmd, receive_cmd):
-    """Execute a zfs send | ssh zfs receive pipeline using streaming (no memory buffering).
+def stage_tools():
+    """Programs the configured compress/buffer stages need on both ends."""
+    tools = []
+    if _compress:
+        tools.append(COMPRESSORS[_compress][0].split(' ')[0])
+    if _mbuffer_size:
+        tools.append('mbuffer')
+    return tools
+
+
+def send_stages():
+    """Local commands run between zfs send and ssh (compressor, then buffer)."""
+    stages = []
+    if _compress:
+        stages.append(COMPRESSORS[_compress][0])
+    if _mbuffer_size:
+        stages.append(f"mbuffer -q -s {_mbuffer_block} -m {_mbuffer_size}")
+    return stages
+
 
-    If _bwlimit is set, inserts pv for bandwidth throttling:
-        zfs send | pv -L <rate> | ssh zfs receive
+def receive_stages():
+    """Shell pipeline put in front of the remote zfs receive (buffer, then decompressor)."""
+    stages = []
+    if _mbuffer_size:
+        stages.append(f"mbuffer -q -s {_mbuffer_block} -m {_mbuffer_size} 2>/dev/null")
+    if _compress:
+        stages.append(COMPRESSORS[_compress][1])
+    return ''.join(f"{stage} | " for stage in stages)
+
+
+def remote_receive_command(user, host, args):
+    """Build the ssh command that runs `zfs receive <args>` on host, behind the receive-side stages."""
+    return f"{ssh_command(user, host)} {receive_stages()}zfs receive {args}"
+
+
+def take_tokens(bucket, rate):
+    """Wait until the token bucket allows a write and return how many bytes it allows.
+
+    The bucket refills at rate bytes/second and holds at most a quarter of a
+    second's worth, so a lifted stall can't turn into a long burst.
+    """
+    capacity = max(rate / 4, RELAY_MIN_CHUNK)
+    minimum = min(RELAY_MIN_CHUNK, capacity)
+    while True:
+        now = time.monotonic()
+        bucket['tokens'] = min(capacity, bucket['tokens'] + (now - bucket['last']) * rate)
+        bucket['last'] = now
+        if bucket['tokens'] >= minimum:
+            return int(min(bucket['tokens'], RELAY_CHUNK))
+        time.sleep((minimum - bucket['tokens']) / rate)
+
+
+def copy_chunk(src_fd, dst_fd, count, use_splice):
+    """Move up to count bytes from src_fd to dst_fd and return how many moved (0 at EOF).
+
+    With use_splice the data is moved pipe-to-pipe by splice(2) without being
+    copied through userspace; otherwise it is read and written in one buffer.
     """
+    if use_splice:
+        return os.splice(src_fd, dst_fd, count)
+    chunk = os.read(src_fd, count)
+    view = memoryview(chunk)
+    while view:
+        view = view[os.write(dst_fd, view):]
+    return len(chunk)
+
+
+def relay_stream(src, dst, meter):
+    """Copy src to dst until EOF, adding the bytes copied to meter['bytes'].
+
+    Applies the current bandwidth limit with a token bucket; the limit is
+    re-read from the control file whenever SIGUSR1 has been received, so it
+    takes effect mid-transfer.
+    Closes both ends when done. If dst goes away the copy stops and src is
+    closed so the writer upstream gets SIGPIPE, as with a direct pipe.
+    """
+    src_fd, dst_fd = src.fileno(), dst.fileno()
+    use_splice = hasattr(os, 'splice')
+    bucket = {'tokens': 0.0, 'last': time.monotonic()}
     try:
-        debug(f"{send_cmd}")
-        if _bwlimit:
-            debug(f"pv -q -L {_bwlimit}")
-        debug(f"{receive_cmd}")
+        while True:
+            if _bwlimit_reload.is_set():
+                _bwlimit_reload.clear()
+                reload_bwlimit()
+            apply_bwlimit_schedule()
+            rate = _bwlimit_bytes
+
+            count = take_tokens(bucket, rate) if rate else RELAY_CHUNK
+            try:
+                moved = copy_chunk(src_fd, dst_fd, count, use_splice)
+            except OSError as e:
+                if not use_splice or e.errno != errno.EINVAL:
+                    raise
+                # Not a pair of pipes splice can join; copy through a buffer instead
+                use_splice = False
+                continue
+            if not moved:
+                break
+            if rate:
+                bucket['tokens'] -= moved
+            meter['bytes'] += moved
+    except (BrokenPipeError, OSError):
+        pass
+    finally:
+        for stream in (dst, src):
+            try:
+                stream.close()
+            except OSError:
+                pass
 
-        # Create a true pipeline: send.stdout -> [pv ->] receive.stdin
-        # This streams data directly without buffering in memory
-        send_proc = subprocess.Popen(
-            send_cmd.split(' '),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
 
-        # If bandwidth limiting is enabled, insert pv in the pipeline
-        if _bwlimit:
-            # pv -q (quiet) -L <rate> limits bandwidth
-            # Rate format: 100k, 10m, 1g for KB/s, MB/s, GB/s
-            pv_proc = subprocess.Popen(
-                ['pv', '-q', '-L', _bwlimit],
-                stdin=send_proc.stdout,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            # Allow send_proc to receive SIGPIPE if pv exits
-            send_proc.stdout.close()
+def relay_fanout(src, dsts, meter, drop=None):
+    """Copy src to every stream in dsts ({host: stream}) until EOF, adding the
+    bytes each one took to meter[host].
 
-            receive_proc = subprocess.Popen(
-                receive_cmd.split(' '),
-                stdin=pv_proc.stdout,
-                stderr=subprocess.PIPE
-            )
-            # Allow pv_proc to receive SIGPIPE if receive_proc exits
-            pv_proc.stdout.close()
-        else:
-            pv_proc = None
-            receive_proc = subprocess.Popen(
-                receive_cmd.split(' '),
-                stdin=send_proc.stdout,
-                stderr=subprocess.PIPE
-            )
-            # Allow send_proc to receive SIGPIPE if receive_proc exits
-            send_proc.stdout.close()
+    The bandwidth limit applies to the stream read once, as in relay_stream().
+    Each chunk goes through this process's buffer, since splice(2) can only
+    move it to one pipe. Writes never block: each host has its own queue of
+    up to FANOUT_BUFFER bytes, and reading pauses while any queue is full, so
+    hosts are fed at the pace of the slowest. A destination that goes away,
+    or takes nothing for FANOUT_STALL_TIMEOUT seconds, is dropped while the
+    others carry on; a stuck one is also passed to drop(), e.g. to stop its
+    receiver. src is closed once none are left.
+    """
+    src_fd = src.fileno()
+    bucket = {'tokens': 0.0, 'last': time.monotonic()}
+    dsts = dict(dsts)
+    # Chunks not yet written to each host (shared between hosts, not copied),
+    # their total size, and when each host last took anything
+    queues = {host: collections.deque() for host in dsts}
+    queued = {host: 0 for host in dsts}
+    progress = {host: time.monotonic() for host in dsts}
+    for dst in dsts.values():
+        os.set_blocking(dst.fileno(), False)
+
+    def remove(host):
+        try:
+            dsts.pop(host).close()
+        except OSError:
+            pass
 
-        # Wait for all processes to complete and capture stderr
-        _, receive_stderr = receive_proc.communicate()
+    eof = False
+    try:
+        while dsts and not (eof and not any(queued[host] for host in dsts)):
+            if _bwlimit_reload.is_set():
+                _bwlimit_reload.clear()
+                reload_bwlimit()
+            apply_bwlimit_schedule()
+            rate = _bwlimit_bytes
+
+            now = time.monotonic()
+            for host in [host for host in dsts if queued[host] and now - progress[host] > FANOUT_STALL_TIMEOUT]:
+                error(f"Receiver on {host} took nothing for {FANOUT_STALL_TIMEOUT}s, dropping it")
+                remove(host)
+                if drop:
+                    drop(host)
+            if not dsts:
+                break
+
+            poller = select.poll()
+            reading = not eof and all(queued[host] < FANOUT_BUFFER for host in dsts)
+            if reading:
+                poller.register(src_fd, select.POLLIN)
+            writers = {}
+            for host, dst in dsts.items():
+                if queued[host]:
+                    writers[dst.fileno()] = host
+                    poller.register(dst.fileno(), select.POLLOUT)
+
+            for fd, _ in poller.poll(1000):
+                if fd == src_fd:
+                    count = take_tokens(bucket, rate) if rate else RELAY_CHUNK
+                    chunk = os.read(src_fd, count)
+                    if not chunk:
+                        eof = True
+                        continue
+                    now = time.monotonic()
+                    for host in dsts:
+                        if not queued[host]:
+                            progress[host] = now
+                        queues[host].append(memoryview(chunk))
+                        queued[host] += len(chunk)
+                    if rate:
+                        bucket['tokens'] -= len(chunk)
+                    continue
+
+                host = writers[fd]
+                if host not in dsts:
+                    continue
+                try:
+                    written = os.write(fd, queues[host][0])
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    debug(f"Receiver on {host} went away")
+                    remove(host)
+                    continue
+                queues[host][0] = queues[host][0][written:]
+                if not queues[host][0]:
+                    queues[host].popleft()
+                queued[host] -= written
+                meter[host] += written
+                progress[host] = time.monotonic()
+    except OSError:
+        pass
+    finally:
+        for stream in list(dsts.values()) + [src]:
+            try:
+                stream.close()
+            except OSError:
+                pass
 
-        pv_stderr = None
-        if pv_proc:
-            _, pv_stderr = pv_proc.communicate()
 
-        _, send_stderr = send_proc.communicate()
+def record_transfer(record):
+    """Report a finished transfer and append it to the metrics log."""
+    if record['ok']:
+        info(f"Transferred {format_bytes(record['bytes'])} in {format_duration(record['seconds'])} ({record['mb_per_s']:.1f} MB/s)")
+    if not _metrics_log:
+        return
+    try:
+        with open(_metrics_log, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+    except OSError as e:
+        error(f"Could not write transfer metrics to {_metrics_log}: {e}")
 
-        # Check if any part of the pipeline failed
-        send_failed = send_proc.returncode != 0
-        pv_failed = pv_proc and pv_proc.returncode != 0
-        receive_failed = receive_proc.returncode != 0
 
-        if send_failed or pv_failed or receive_failed:
+def send_and_receive(send_cmd, receive_cmd, host, dataset, kind):
+    """Execute a zfs send | ssh zfs receive pipeline using streaming (no memory buffering).
+
+    receive_cmd is expected to come from remote_receive_command(). Compression
+    and mbuffer stages are inserted locally when configured:
+        zfs send | lzop | mbuffer | relay | ssh mbuffer | lzop -d | zfs receive
+
+    The stream going into ssh is relayed through this process, which applies
+    the bandwidth limit (see relay_stream) and meters it;
+    a record of the transfer (kind is "full", "incremental" or "resume") is
+    passed to record_transfer() whether or not it succeeded.
+    """
+    commands = [send_cmd] + send_stages() + [receive_cmd]
+    names = ['zfs send'] + [stage.split(' ')[0] for stage in commands[1:-1]] + ['zfs receive']
+    meter = {'bytes': 0}
+    started = datetime.now()
+    start = time.monotonic()
+    try:
+        for command in commands:
+            debug(command)
+
+        # Create a true pipeline: send.stdout -> [stages ->] relay -> receive.stdin
+        # This streams data directly without buffering in memory
+        procs = []
+        for i, command in enumerate(commands):
+            last = i == len(commands) - 1
+            procs.append(subprocess.Popen(
+                command.split(' '),
+                stdin=subprocess.PIPE if last else (procs[-1].stdout if procs else None),
+                stdout=None if last else subprocess.PIPE,
+                stderr=subprocess.PIPE
+            ))
+            if 0 < i < len(commands) - 1:
+                # Allow the previous process to receive SIGPIPE if this one exits
+                procs[-2].stdout.close()
+
+        # The relay owns both ends of the metered link; detach them so that
+        # communicate() below doesn't read from or close them underneath it
+        relay_src, relay_dst = procs[-2].stdout, procs[-1].stdin
+        procs[-2].stdout = procs[-1].stdin = None
+        relay = threading.Thread(target=relay_stream, args=(relay_src, relay_dst, meter), daemon=True)
+        relay.start()
+
+        # Wait from the receiving end backwards and capture stderr
+        stderrs = [None] * len(procs)
+        for i in reversed(range(len(procs))):
+            _, stderrs[i] = procs[i].communicate()
+            record_command(procs[i].args, start)
+
+        relay.join()
+        seconds = time.monotonic() - start
+
+        # Check if any part of the pipeline failed
+        failed = [proc.returncode != 0 for proc in procs]
+        record_transfer({
+            'started': started.strftime("%Y-%m-%dT%H:%M:%S"),
+            'direction': 'push',
+            'host': host,
+            'dataset': dataset,
+            'kind': kind,
+            'bytes': meter['bytes'],
+            'seconds': round(seconds, 3),
+            'mb_per_s': round(meter['bytes'] / seconds / 1e6, 2) if seconds > 0 else 0.0,
+            'compress': _compress,
+            'ok': not any(failed),
+        })
+
+        if any(failed):
             # Report which component(s) failed
-            if send_failed:
-                error(f"zfs send failed with code {send_proc.returncode}")
-            if pv_failed:
-                error(f"pv (bandwidth limiter) failed with code {pv_proc.returncode}")
-            if receive_failed:
-                error(f"zfs receive failed with code {receive_proc.returncode}")
+            for name, proc, proc_failed in zip(names, procs, failed):
+                if proc_failed:
+                    error(f"{name} failed with code {proc.returncode}")
 
             # Report all captured stderr (the real error is often in receive)
-            if send_stderr and send_stderr.strip():
-                error(f"  send stderr: {send_stderr.decode().strip()}")
-            if pv_stderr and pv_stderr.strip():
-                error(f"  pv stderr: {pv_stderr.decode().strip()}")
-            if receive_stderr and receive_stderr.strip():
-                error(f"  receive stderr: {receive_stderr.decode().strip()}")
+            for name, stderr in zip(names, stderrs):
+                if stderr and stderr.strip():
+                    error(f"  {name.replace('zfs ', '')} stderr: {stderr.decode().strip()}")
 
             # If send failed but had no stderr, hint that the error is likely elsewhere
-            if send_failed and not (send_stderr and send_stderr.strip()):
+            send_stderr, receive_stderr = stderrs[0], stderrs[-1]
+            if failed[0] and not (send_stderr and send_stderr.strip()):
                 if receive_stderr and receive_stderr.strip():
                     error("  (send likely failed due to broken pipe from receive failure)")
                 else:
@@ -521,128 +1724,199 @@ def send_and_receive(send_cmd, receive_cmd):
         return False
 
 
-def pushdatasets(host, dataset, user, destination, strip_prefix):
-    # Strip the local backup prefix from the dataset path
-    # e.g., if dataset is "slowpool/encryptedbackups/host-storage/fastpool/data"
-    # and strip_prefix is "slowpool/encryptedbackups", the relative path becomes
-    # "host-storage/fastpool/data"
-    if strip_prefix and dataset.startswith(strip_prefix + "/"):
-        relative_path = dataset[len(strip_prefix) + 1:]
-    else:
-        relative_path = dataset
+def send_and_receive_fanout(send_cmd, receivers, dataset, kind):
+    """Run one send pipeline teed to a receive per host in receivers ({host: receive_cmd}):
+        zfs send | lzop | mbuffer | relay -+-> ssh host1 ... zfs receive
+                                           +-> ssh host2 ... zfs receive
 
-    remote_dataset = f"{destination}/{relative_path}"
-    info(f"Pushing {dataset} -> {remote_dataset}")
+    As send_and_receive(), with the relay (see relay_fanout) writing every
+    chunk to each receiver and a transfer record per host. Returns the hosts
+    that received the whole stream: a failed or stuck receiver only fails its
+    own host, a failure on the sending side fails them all.
+    """
+    commands = [send_cmd] + send_stages()
+    names = ['zfs send'] + [stage.split(' ')[0] for stage in commands[1:]]
+    meter = {host: 0 for host in receivers}
+    started = datetime.now()
+    start = time.monotonic()
+    try:
+        for command in commands + list(receivers.values()):
+            debug(command)
+
+        procs = []
+        for command in commands:
+            procs.append(subprocess.Popen(
+                command.split(' '),
+                stdin=procs[-1].stdout if procs else None,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE
+            ))
+            if len(procs) > 1:
+                procs[-2].stdout.close()
+        sinks = {host: subprocess.Popen(command.split(' '), stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+                 for host, command in receivers.items()}
+
+        relay_src = procs[-1].stdout
+        relay_dsts = {host: sink.stdin for host, sink in sinks.items()}
+        procs[-1].stdout = None
+        for sink in sinks.values():
+            sink.stdin = None
+        # A receiver the relay gives up on as stuck is killed, so that waiting
+        # for it below can't hang the push
+        relay = threading.Thread(target=relay_fanout, args=(relay_src, relay_dsts, meter, lambda host: sinks[host].kill()),
+                                 daemon=True)
+        relay.start()
+
+        sink_stderrs = {}
+        for host, sink in sinks.items():
+            sink_stderrs[host] = sink.communicate()[1]
+            record_command(sink.args, start)
+        stderrs = [None] * len(procs)
+        for i in reversed(range(len(procs))):
+            _, stderrs[i] = procs[i].communicate()
+            record_command(procs[i].args, start)
+
+        relay.join()
+        seconds = time.monotonic() - start
+
+        send_failed = [proc.returncode != 0 for proc in procs]
+        received = set()
+        for host, sink in sinks.items():
+            ok = not any(send_failed) and sink.returncode == 0
+            if ok:
+                received.add(host)
+            record_transfer({
+                'started': started.strftime("%Y-%m-%dT%H:%M:%S"),
+                'direction': 'push',
+                'host': host,
+                'dataset': dataset,
+                'kind': kind,
+                'bytes': meter[host],
+                'seconds': round(seconds, 3),
+                'mb_per_s': round(meter[host] / seconds / 1e6, 2) if seconds > 0 else 0.0,
+                'compress': _compress,
+                'ok': ok,
+            })
+            if sink.returncode != 0:
+                error(f"zfs receive on {host} failed with code {sink.returncode}")
+                if sink_stderrs[host] and sink_stderrs[host].strip():
+                    error(f"  receive stderr: {sink_stderrs[host].decode().strip()}")
+
+        if any(send_failed):
+            for name, proc, proc_failed, stderr in zip(names, procs, send_failed, stderrs):
+                if proc_failed:
+                    error(f"{name} failed with code {proc.returncode}")
+                    if stderr and stderr.strip():
+                        error(f"  {name.replace('zfs ', '')} stderr: {stderr.decode().strip()}")
+
+        return received
 
-    # Ensure parent dataset exists on remote
-    if not ensure_remote_parent_exists(host, remote_dataset, user):
-        sys.exit(1)
+    except Exception as e:
+        error(f"Transfer failed: {e}")
+        return set()
+
+
+def pushdatasets(host, dataset, user, destination, strip_prefix, local_snapshots, item):
+    """Push one dataset by running the steps plan_push() worked out for it
+    (item). local_snapshots come from the run's listing; the parents on the
+    remote must already exist."""
+    remote_dataset = get_remote_dataset(dataset, destination, strip_prefix)
+    info(f"Pushing {dataset} -> {remote_dataset}")
 
-    local_snapshots = get_local_snapshots(dataset)
     if not local_snapshots:
         info(f"Skipping {dataset} - no snapshots found locally")
         return
+    latest_local = local_snapshots[-1]['name']
 
-    remote_snapshots = get_remote_snapshots(host, remote_dataset, user)
-
-    earliest_local = local_snapshots[0]
-    latest_local = local_snapshots[-1]
-
-    # Find common snapshots between local and remote
-    common_snapshots = [s for s in remote_snapshots if s in local_snapshots]
-
-    if not common_snapshots:
-        # Initial sync: no common snapshots, need full send
-        start_time = datetime.now()
-        info(f"No remote snapshots found. Performing initial sync for {dataset}")
-        info(f"Started at {start_time.strftime('%Y-%m-%d %H:%M:%S')}")
-        info(f"Local has {len(local_snapshots)} snapshots: {earliest_local} -> {latest_local}")
-
-        # Estimate total transfer size
-        total_size = 0
-        initial_size = get_send_size(dataset, earliest_local)
-        if initial_size:
-            total_size += initial_size
-
-        if earliest_local != latest_local:
-            incremental_size = get_send_size(dataset, latest_local, incremental_from=earliest_local)
-            if incremental_size:
-                total_size += incremental_size
-
-        if total_size > 0:
-            size_msg = f"Estimated total size: {format_bytes(total_size)}"
-            if _bwlimit:
-                bwlimit_bytes = parse_size_to_bytes(_bwlimit)
-                if bwlimit_bytes:
-                    estimated_seconds = total_size / bwlimit_bytes
-                    size_msg += f" (ETA: {format_duration(estimated_seconds)} at {_bwlimit}/s)"
-            info(size_msg)
-
-        # Step 1: Full send of earliest snapshot (raw for encrypted datasets)
-        info(f"Pushing earliest snapshot '{earliest_local}'")
-        send_cmd = f"zfs send -w {dataset}@{earliest_local}"
-        receive_cmd = f"ssh {user}@{host} zfs receive -F -u {remote_dataset}"
-
-        if not send_and_receive(send_cmd, receive_cmd):
+    # An interrupted receive leaves a resume token on the remote; continue that
+    # stream before anything else, then plan from whatever it delivered.
+    if item['kind'] == 'resume':
+        resumed = resume_send(host, dataset, user, remote_dataset, item['resume_token'])
+        if not resumed and get_remote_resume_token(host, remote_dataset, user):
             sys.exit(1)
-        info(f"Successfully pushed earliest snapshot '{earliest_local}'")
-
-        # Step 2: Incremental from earliest to latest (if more than one snapshot)
-        if earliest_local != latest_local:
-            info(f"Pushing incremental '{earliest_local}' -> '{latest_local}'")
-            send_cmd = f"zfs send -w -I {dataset}@{earliest_local} {dataset}@{latest_local}"
-
-            if not send_and_receive(send_cmd, receive_cmd):
-                sys.exit(1)
-            info(f"Successfully pushed all snapshots up to '{latest_local}'")
-        else:
-            info("Only one snapshot exists, no incremental needed.")
-
-        end_time = datetime.now()
-        elapsed = end_time - start_time
-        info(f"Completed at {end_time.strftime('%Y-%m-%d %H:%M:%S')} (elapsed: {elapsed})")
+        remote_entry = {'snapshots': get_remote_snapshots(host, remote_dataset, user), 'resume_token': None}
+        item = plan_push(dataset, local_snapshots, remote_entry)
 
+    steps = item['steps']
+    if not steps:
+        info(f"Up-to-date - {dataset}")
     else:
-        # Incremental sync: find latest common snapshot and sync from there
-        latest_common = common_snapshots[-1]
-        debug(f"Found {len(common_snapshots)} common snapshots. Latest: {latest_common}")
-
-        if latest_common == latest_local:
-            info(f"Up-to-date - {dataset}")
-            debug(f"Latest is {dataset}@{latest_local}")
-            return
+        if steps[0]['kind'] == 'full':
+            info(f"No common snapshots with the remote. Performing initial sync for {dataset} in {len(steps)} steps")
+        receive_cmd = remote_receive_command(user, host, f"-s -F -u {remote_dataset}")
+        for step in steps:
+            # Raw sends keep encrypted datasets encrypted on the remote; -s on the
+            # receive keeps the partial state of an interruption to resume from
+            if not send_and_receive(f"zfs send -w {step['args']}", receive_cmd, host, dataset, step['kind']):
+                sys.exit(1)
+        info(f"Successfully synced up to '{latest_local}'")
 
-        info(f"Pushing incremental snapshots.")
-        debug(f"{latest_common}' -> '{latest_local}")
-        send_cmd = f"zfs send -w -I {dataset}@{latest_common} {dataset}@{latest_local}"
-        receive_cmd = f"ssh {user}@{host} zfs receive -F -u {remote_dataset}"
+    if _protect != 'none':
+        protect_base(dataset, latest_local)
 
-        if not send_and_receive(send_cmd, receive_cmd):
-            sys.exit(1)
-        info(f"Successfully synced up to '{latest_local}'")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Push ZFS datasets to a remote host.')
-    parser.add_argument('--host', help='Remote host to push to')
+    parser.add_argument('--host', nargs='+', help='Remote host to push to; several hosts are pushed to at once from one send per dataset (fan-out)')
     parser.add_argument('--datasets', nargs='+', help='Local source datasets to push')
     parser.add_argument('--user', default=DEFAULT_user, help='Remote SSH user')
-    parser.add_argument('--destination', required=True, help='Remote dataset to receive backups')
+    parser.add_argument('--destination', nargs='+', required=True, help='Remote dataset to receive backups, one for all hosts or one per --host')
     parser.add_argument('--strip-prefix', default=DEFAULT_strip_prefix, help='Prefix to strip from dataset paths (default: %(default)s)')
     parser.add_argument('--debug', default=DEFAULT_debug, help='Debug code', action=argparse.BooleanOptionalAction)
     parser.add_argument('--quiet', '-q', default=DEFAULT_quiet, help='Suppress informational output (errors still shown)', action=argparse.BooleanOptionalAction)
-    parser.add_argument('--bwlimit', default=DEFAULT_bwlimit, help='Bandwidth limit for transfers (requires pv). Format: 100k, 10m, 1g for KB/s, MB/s, GB/s')
+    parser.add_argument('--bwlimit', default=DEFAULT_bwlimit, help='Bandwidth limit for transfers. Format: 100k, 10m, 1g for KB/s, MB/s, GB/s. Can be changed mid-run, see --bwlimit-file')
+    parser.add_argument('--bwlimit-schedule', default=DEFAULT_bwlimit_schedule, help='Time-of-day bandwidth limits applied mid-transfer as windows change, e.g. "00:00-07:00=unlimited,07:00-23:00=2m"; --bwlimit applies outside them')
+    parser.add_argument('--bwlimit-file', default=None, help='Control file re-read on SIGUSR1 to change the bandwidth limit (default: /var/run/zfs-push-backups-<first host>.bwlimit)')
+    parser.add_argument('--compress', choices=sorted(COMPRESSORS), default=DEFAULT_compress, help='Compress the stream locally and decompress it on the remote host (raw encrypted streams gain little)')
+    parser.add_argument('--mbuffer-size', default=DEFAULT_mbuffer_size, help='Buffer the stream through mbuffer with this much memory on each side, e.g. 256M (default: no buffering)')
+    parser.add_argument('--mbuffer-block', default=DEFAULT_mbuffer_block, help='mbuffer block size (default: %(default)s)')
+    parser.add_argument('--metrics-log', default=DEFAULT_metrics_log, help='JSON-lines file to append per-transfer metrics to, empty to disable (default: %(default)s)')
+    parser.add_argument('--journal-dir', default=DEFAULT_journal_dir, help='Directory for the replication journal used to skip unchanged datasets, empty to disable (default: %(default)s)')
+    parser.add_argument('--bootstrap', choices=BOOTSTRAP_MODES, default=DEFAULT_bootstrap, help='How datasets new to the remote are first pushed: every snapshot, only the --bootstrap-anchors snapshots and the latest, or only the latest (default: %(default)s)')
+    parser.add_argument('--bootstrap-anchors', default=DEFAULT_bootstrap_anchors, help='Comma-separated snapshot types kept by --bootstrap anchors (default: %(default)s)')
+    parser.add_argument('--protect', choices=PROTECT_MODES, default=DEFAULT_protect, help='Keep the newest pushed snapshot of each dataset usable as the next incremental base with a hold or a bookmark (default: %(default)s)')
+    parser.add_argument('--protect-tag', default=None, help='Hold tag, and bookmark name prefix, used by --protect (default: zfs-push-backups-<host>; a fan-out push always uses the default per host)')
+    parser.add_argument('--profile', default=False, help=f'Write the wall time, subprocess count and command times of each phase of this run to {PROFILE_DIR} as JSON', action=argparse.BooleanOptionalAction)
     args = parser.parse_args()
 
+    if args.profile:
+        start_profile()
+
     _quiet = args.quiet
     _debug = args.debug
     _bwlimit = args.bwlimit
-
-    if not args.user or not args.host or not args.datasets or not args.destination:
-        print("Usage: zfs-push-backups --host <host> --datasets <space-separated list> --destination <remote-dataset> [--user <user>]", file=sys.stderr)
+    if _bwlimit:
+        _bwlimit_bytes = parse_size_to_bytes(_bwlimit)
+        if not _bwlimit_bytes:
+            print(f"Invalid --bwlimit '{_bwlimit}'", file=sys.stderr)
+            sys.exit(1)
+    _bwlimit_default = (_bwlimit, _bwlimit_bytes)
+    if args.bwlimit_schedule:
+        _bwlimit_schedule = parse_bwlimit_schedule(args.bwlimit_schedule)
+        if not _bwlimit_schedule:
+            print(f"Invalid --bwlimit-schedule '{args.bwlimit_schedule}'", file=sys.stderr)
+            sys.exit(1)
+    _metrics_log = args.metrics_log
+    _journal_dir = args.journal_dir
+    _compress = args.compress
+    _mbuffer_size = args.mbuffer_size
+    _mbuffer_block = args.mbuffer_block
+
+    if not args.user or not args.host or not args.datasets or len(args.destination) not in (1, len(args.host)):
+        print("Usage: zfs-push-backups --host <host> [<host> ...] --datasets <space-separated list> --destination <remote-dataset> [<remote-dataset> per host ...] [--user <user>]", file=sys.stderr)
         sys.exit(1)
-
-    # Set host-specific lockfile to allow parallel pushes to different hosts
-    _lockfile = get_lockfile_path(args.host)
+    destinations = args.destination * len(args.host) if len(args.destination) == 1 else args.destination
+    targets = [{'host': host, 'user': args.user, 'destination': destination}
+               for host, destination in zip(args.host, destinations)]
+
+    # Set host-specific lockfiles to allow parallel pushes to different hosts
+    _lockfile = get_lockfile_path(args.host[0])
+    _fanout_lockfiles = [get_lockfile_path(host) for host in args.host[1:]]
+    _bwlimit_file = args.bwlimit_file or get_bwlimit_file_path(args.host[0])
+    _bootstrap = args.bootstrap
+    _bootstrap_anchors = set(args.bootstrap_anchors.split(','))
+    _protect = args.protect
+    _protect_tag = args.protect_tag or get_protect_tag(args.host[0])
 
     # Acquire lockfile to prevent concurrent executions to this host
     if not acquire_lock():
@@ -654,5 +1928,9 @@ if __name__ == "__main__":
     signal.signal(signal.SIGTERM, signal_handler)
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGHUP, signal_handler)
+    signal.signal(signal.SIGUSR1, bwlimit_signal_handler)
 
-    preflight(args.host, args.datasets, args.user, args.destination, args.strip_prefix)
+    if len(targets) > 1:
+        preflight_fanout(targets, args.datasets, args.strip_prefix)
+    else:
+        preflight(args.host[0], args.datasets, args.user, destinations[0], args.strip_prefix)
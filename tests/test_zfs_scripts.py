@@ -0,0 +1,459 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import quote
+
+import pytest
+
+pytest.importorskip("jinja2")
+pytest.importorskip("yaml")
+
+from zfssim import model  # noqa: E402
+from zfssim.harness import OFFSITE_FORCED_COMMAND, REPO, TEMPLATES, host_model, import_script, render_scripts, run_script, sim_env, snapshot_names, with_state  # noqa: E402
+
+SNAPSHOT_BYTES = 1024 * 1024
+
+
+@pytest.fixture
+def fleet(tmp_path):
+    """One client with two datasets of five snapshots, each with two children."""
+    workdir = str(tmp_path)
+    env = sim_env(workdir)
+    layout = with_state(env, model.build_fleet, 1, 2, 5, children=2, snapshot_bytes=SNAPSHOT_BYTES)
+    with_state(env, model.add_host, "offsite", ["fastpool/offsite"], OFFSITE_FORCED_COMMAND)
+    policy = [
+        {"dataset": "fastpool/data0", "policy": "critical", "snapshots_discover_children": True},
+        {"dataset": "fastpool/data1", "policy": "low"},
+    ]
+    return env, render_scripts(workdir, policy), layout
+
+
+def pull(env, scripts, *args):
+    result = run_script(env, scripts["pull"], ["--host", "client0", "--datasets", "fastpool/data0", "fastpool/data1"] + list(args))
+    assert result["rc"] == 0, result["stderr"]
+    return result
+
+
+def test_pull_replicates_history_then_only_new_snapshots(fleet):
+    # Pulls walk the children of each dataset: 2 x 3 datasets of 5 snapshots
+    env, scripts, layout = fleet
+
+    first = pull(env, scripts)
+
+    assert snapshot_names(env, "local", "slowpool/encryptedbackups/client0/fastpool/data1") == \
+        snapshot_names(env, "client0", "fastpool/data1")
+    assert first["bytes"] == 6 * 5 * SNAPSHOT_BYTES
+
+    with_state(env, model.take_snapshots, "client0", ["fastpool/data0", "fastpool/data1"], "autosnap_next_hourly")
+    second = pull(env, scripts)
+
+    assert second["bytes"] == 2 * SNAPSHOT_BYTES
+    assert snapshot_names(env, "local", "slowpool/encryptedbackups/client0/fastpool/data0")[-1] == "autosnap_next_hourly"
+
+
+def test_pull_without_changes_streams_nothing(fleet):
+    env, scripts, layout = fleet
+    pull(env, scripts)
+
+    again = pull(env, scripts)
+
+    assert again["bytes"] == 0
+    assert again["programs"].get("zfs", 0) > 0
+
+
+def held_snapshots(env, host, dataset):
+    return [snap["name"] for snap in host_model(env, host)["datasets"][dataset]["snapshots"] if snap["holds"]]
+
+
+def test_pull_leaves_locked_datasets_to_the_other_instance(fleet, tmp_path):
+    env, scripts, layout = fleet
+    lockfile = tmp_path / "run" / f"zfs-pull-backups-client0-{quote('fastpool/data0', safe='')}.lock"
+    lockfile.write_text(str(os.getpid()))
+
+    result = pull(env, scripts, "--protect", "hold")
+
+    assert "Skipping fastpool/data0 - already being pulled" in result["stdout"]
+    assert "Skipping fastpool/data0/child0 - its parent is being pulled" in result["stdout"]
+    assert held_snapshots(env, "client0", "fastpool/data0") == []
+    assert held_snapshots(env, "client0", "fastpool/data1") == snapshot_names(env, "client0", "fastpool/data1")[-1:]
+    journal = json.loads((tmp_path / "state" / "pull-client0.json").read_text())
+    assert sorted(journal) == ["fastpool/data1", "fastpool/data1/child0", "fastpool/data1/child1"]
+
+
+def test_pull_stops_receiving_before_releasing_locks_on_sigterm(fleet, tmp_path):
+    # Five snapshots at 512 KiB/s keep the full receive of data0 busy for ~10s
+    env, scripts, layout = fleet
+    env = dict(env, ZFS_SIM_THROUGHPUT=str(SNAPSHOT_BYTES // 2))
+    lockfile = tmp_path / "run" / f"zfs-pull-backups-client0-{quote('fastpool/data0', safe='')}.lock"
+    proc = subprocess.Popen([sys.executable, scripts["pull"], "--host", "client0", "--datasets", "fastpool/data0"],
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while not lockfile.exists() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    time.sleep(1)
+
+    proc.send_signal(signal.SIGTERM)
+
+    assert proc.wait(timeout=5) != 0
+    assert not lockfile.exists()
+    assert "slowpool/encryptedbackups/client0/fastpool/data0" not in host_model(env, "local")["datasets"]
+
+
+def test_pull_resumes_an_interrupted_receive(fleet):
+    env, scripts, layout = fleet
+    args = ["--host", "client0", "--datasets", "fastpool/data0"]
+
+    cut = run_script(dict(env, ZFS_SIM_SEND_ABORT_AFTER=str(SNAPSHOT_BYTES // 2)), scripts["pull"], args)
+    resumed = run_script(env, scripts["pull"], args)
+
+    assert cut["rc"] != 0
+    assert resumed["rc"] == 0, resumed["stderr"]
+    assert "Resuming interrupted receive of fastpool/data0" in resumed["stdout"]
+    for dataset in ("fastpool/data0", "fastpool/data0/child0"):
+        assert snapshot_names(env, "local", f"slowpool/encryptedbackups/client0/{dataset}") == \
+            snapshot_names(env, "client0", dataset)
+    # Only what the first run didn't get is sent again
+    assert resumed["bytes"] == 3 * 5 * SNAPSHOT_BYTES - SNAPSHOT_BYTES // 2
+
+
+def test_pull_journal_is_not_trusted_on_a_guid_mismatch(fleet, tmp_path):
+    env, scripts, layout = fleet
+    pull(env, scripts)
+    path = tmp_path / "state" / "pull-client0.json"
+    journal = json.loads(path.read_text())
+    guid = journal["fastpool/data0"]["guid"]
+    path.write_text(json.dumps(dict(journal, **{"fastpool/data0": dict(journal["fastpool/data0"], guid="1")})))
+
+    again = pull(env, scripts)
+
+    assert "unchanged since the last run" not in again["stdout"]
+    assert again["bytes"] == 0
+    assert json.loads(path.read_text())["fastpool/data0"]["guid"] == guid
+
+
+def test_pull_journal_is_not_trusted_when_the_backup_lost_its_snapshot(fleet):
+    env, scripts, layout = fleet
+    pull(env, scripts)
+    local = "slowpool/encryptedbackups/client0/fastpool/data1"
+    subprocess.run(["zfs", "destroy", f"{local}@{snapshot_names(env, 'local', local)[-1]}"], env=env, check=True)
+
+    again = pull(env, scripts)
+
+    assert snapshot_names(env, "local", local) == snapshot_names(env, "client0", "fastpool/data1")
+    assert again["bytes"] == SNAPSHOT_BYTES
+
+
+def test_raw_pull_refuses_encrypted_datasets_pulled_without_it(fleet):
+    env, scripts, layout = fleet
+    with_state(env, model.encrypt, "client0", "fastpool/data1")
+    pull(env, scripts)
+
+    result = run_script(env, scripts["pull"], ["--host", "client0", "--datasets", "fastpool/data0", "fastpool/data1", "--raw"])
+
+    assert result["rc"] == 1
+    assert "--raw can't be used for encrypted datasets already pulled without it" in result["stderr"]
+    assert "slowpool/encryptedbackups/client0/fastpool/data1/child1" in result["stderr"]
+    assert "fastpool/data0" not in result["stderr"]
+    assert result["bytes"] == 0
+
+
+def test_raw_pull_keeps_pulling_datasets_first_pulled_raw(fleet):
+    env, scripts, layout = fleet
+    with_state(env, model.encrypt, "client0", "fastpool/data1")
+    pull(env, scripts, "--raw")
+    with_state(env, model.take_snapshots, "client0", ["fastpool/data0", "fastpool/data1"], "autosnap_next_hourly")
+
+    again = pull(env, scripts, "--raw")
+
+    assert again["bytes"] == 2 * SNAPSHOT_BYTES
+    assert host_model(env, "local")["datasets"]["slowpool/encryptedbackups/client0/fastpool/data1"]["encryption_root"]
+
+
+def test_recursive_pull_includes_children(fleet):
+    env, scripts, layout = fleet
+
+    pull(env, scripts, "--recursive")
+
+    assert snapshot_names(env, "local", "slowpool/encryptedbackups/client0/fastpool/data0/child1") == \
+        snapshot_names(env, "client0", "fastpool/data0/child1")
+
+
+def test_push_sends_once_then_nothing(fleet):
+    env, scripts, layout = fleet
+    pull(env, scripts)
+    args = ["--host", "offsite", "--destination", "fastpool/offsite",
+            "--datasets", "slowpool/encryptedbackups/client0/fastpool/data0"]
+
+    first = run_script(env, scripts["push"], args)
+    second = run_script(env, scripts["push"], args)
+
+    assert first["rc"] == 0, first["stderr"]
+    assert second["rc"] == 0, second["stderr"]
+    assert snapshot_names(env, "offsite", "fastpool/offsite/client0/fastpool/data0") == \
+        snapshot_names(env, "client0", "fastpool/data0")
+    assert first["bytes"] == 3 * 5 * SNAPSHOT_BYTES
+    assert second["bytes"] == 0
+    assert "All 3 datasets unchanged since the last run" in second["stdout"]
+
+
+def test_push_through_compression_and_buffer_stages(fleet):
+    env, scripts, layout = fleet
+    pull(env, scripts)
+
+    result = run_script(env, scripts["push"], ["--host", "offsite", "--destination", "fastpool/offsite",
+                                               "--compress", "lzop", "--mbuffer-size", "16M",
+                                               "--datasets", "slowpool/encryptedbackups/client0/fastpool/data0"])
+
+    assert result["rc"] == 0, result["stderr"]
+    assert snapshot_names(env, "offsite", "fastpool/offsite/client0/fastpool/data0") == \
+        snapshot_names(env, "client0", "fastpool/data0")
+
+
+def test_offsite_refuses_commands_outside_its_whitelist(fleet):
+    env, scripts, layout = fleet
+
+    result = subprocess.run(["ssh", "zfsbackup@offsite", "zfs", "destroy", "-r", "fastpool/offsite"],
+                            env=env, capture_output=True, text=True)
+
+    assert result.returncode == 1
+    assert "Command not permitted" in result.stderr
+    assert "fastpool/offsite" in host_model(env, "offsite")["datasets"]
+
+
+def test_push_resumes_then_runs_the_rest_of_the_plan(fleet):
+    env, scripts, layout = fleet
+    pull(env, scripts)
+    args = ["--host", "offsite", "--destination", "fastpool/offsite",
+            "--datasets", "slowpool/encryptedbackups/client0/fastpool/data0"]
+
+    cut = run_script(dict(env, ZFS_SIM_SEND_ABORT_AFTER=str(SNAPSHOT_BYTES // 2)), scripts["push"], args)
+    resumed = run_script(env, scripts["push"], args)
+
+    assert cut["rc"] != 0
+    assert resumed["rc"] == 0, resumed["stderr"]
+    assert "Resuming interrupted push of slowpool/encryptedbackups/client0/fastpool/data0" in resumed["stdout"]
+    assert snapshot_names(env, "offsite", "fastpool/offsite/client0/fastpool/data0") == \
+        snapshot_names(env, "client0", "fastpool/data0")
+    assert resumed["bytes"] == 3 * 5 * SNAPSHOT_BYTES - SNAPSHOT_BYTES // 2
+
+
+def test_bwlimit_schedule_rejects_hours_past_midnight(fleet):
+    push = import_script(fleet[1]["push"])
+
+    assert push.parse_bwlimit_schedule("23:00-24:00=1m,00:00-07:00=unlimited") == \
+        [(23 * 60, 24 * 60, "1m", 1024 * 1024), (0, 7 * 60, "unlimited", None)]
+    for spec in ("24:30-07:00=1m", "24:00-07:00=1m", "23:00-24:30=1m", "23:00-25:00=1m", "07:60-08:00=1m"):
+        assert push.parse_bwlimit_schedule(spec) is None, spec
+
+
+def test_bwlimit_schedule_switches_limit_as_windows_change(fleet, monkeypatch):
+    push = import_script(fleet[1]["push"])
+    push._bwlimit_schedule = push.parse_bwlimit_schedule("23:00-07:00=unlimited,07:00-18:00=2m")
+    push._bwlimit_default = ("10m", 10 * 1024 * 1024)
+    limits = []
+    for hour, minute in ((6, 59), (7, 0), (12, 0), (18, 0), (23, 30)):
+        monkeypatch.setattr(push.time, "localtime", lambda: time.struct_time((2025, 1, 1, hour, minute, 0, 2, 1, 0)))
+        push.apply_bwlimit_schedule()
+        limits.append(push._bwlimit_bytes)
+
+    assert limits == [None, 2 * 1024 * 1024, 2 * 1024 * 1024, 10 * 1024 * 1024, None]
+
+
+def test_orchestrator_runs_the_pull_and_push_scripts(fleet, tmp_path):
+    env, scripts, layout = fleet
+    clients = [{"name": "client0", "host": "client0", "user": "zfsbackup", "healthcheck": "", "datasets": [
+        {"dataset": "fastpool/data0", "policy": "critical"},
+        {"dataset": "fastpool/data1", "policy": "low"},
+    ]}]
+    offsite = [{"host": "offsite", "user": "zfsbackup", "destination": "fastpool/offsite",
+                "datasets": ["slowpool/encryptedbackups/client0/fastpool/data0"]}]
+    scripts = render_scripts(str(tmp_path), [], backups_zfs_server_orchestrator_clients=clients,
+                             backups_zfs_server_orchestrator_offsite=offsite,
+                             backups_zfs_server_pull_bwlimit="100m")
+
+    pulled = run_script(env, scripts["orchestrator"], ["--once", "pull"])
+    pushed = run_script(env, scripts["orchestrator"], ["--once", "push"])
+
+    assert pulled["rc"] == 0, pulled["stderr"]
+    assert "Pulling critical datasets from 1 clients" in pulled["stdout"]
+    assert "[client0] * Checking remote host is up" in pulled["stdout"]
+    for dataset in ("fastpool/data0", "fastpool/data1/child1"):
+        assert snapshot_names(env, "local", f"slowpool/encryptedbackups/client0/{dataset}") == \
+            snapshot_names(env, "client0", dataset)
+    assert pushed["rc"] == 0, pushed["stderr"]
+    assert snapshot_names(env, "offsite", "fastpool/offsite/client0/fastpool/data0") == \
+        snapshot_names(env, "client0", "fastpool/data0")
+
+
+def test_fanout_push_drops_a_failing_host_and_completes_the_others(fleet):
+    # offsite2 already has an unrelated data0 with snapshots, so its full receive fails
+    env, scripts, layout = fleet
+    pull(env, scripts)
+    with_state(env, model.add_host, "offsite2", ["fastpool/offsite/client0/fastpool/data0"], OFFSITE_FORCED_COMMAND)
+    with_state(env, model.take_snapshots, "offsite2", ["fastpool/offsite/client0/fastpool/data0"], "unrelated")
+    local = "slowpool/encryptedbackups/client0/fastpool/data0"
+
+    result = run_script(env, scripts["push"], ["--host", "offsite", "offsite2", "--destination", "fastpool/offsite",
+                                               "--protect", "bookmark", "--datasets", local])
+
+    assert result["rc"] != 0
+    assert f"Push of {local} to offsite2 failed, skipping the rest for that host" in result["stderr"]
+    for dataset in ("fastpool/data0", "fastpool/data0/child1"):
+        assert snapshot_names(env, "offsite", f"fastpool/offsite/client0/{dataset}") == \
+            snapshot_names(env, "client0", dataset)
+    assert snapshot_names(env, "offsite2", "fastpool/offsite/client0/fastpool/data0") == ["unrelated"]
+    bookmarks = [bookmark["name"] for bookmark in host_model(env, "local")["datasets"][local]["bookmarks"]]
+    assert bookmarks == [f"zfs-push-backups-offsite_{snapshot_names(env, 'local', local)[-1]}"]
+
+
+def test_fanout_relay_drops_a_stuck_receiver(fleet, monkeypatch):
+    push = import_script(fleet[1]["push"])
+    monkeypatch.setattr(push, "FANOUT_STALL_TIMEOUT", 0.5)
+    stream = os.urandom(4 * push.FANOUT_BUFFER)
+    src_read, src_write = os.pipe()
+    stuck_read, stuck_write = os.pipe()
+    ok_read, ok_write = os.pipe()
+    received = []
+    threading.Thread(target=lambda: (os.write(src_write, stream), os.close(src_write)), daemon=True).start()
+    reader = threading.Thread(target=lambda: received.append(os.fdopen(ok_read, "rb").read()), daemon=True)
+    reader.start()
+    meter = {"stuck": 0, "ok": 0}
+    dropped = []
+
+    push.relay_fanout(os.fdopen(src_read, "rb"), {"stuck": os.fdopen(stuck_write, "wb"), "ok": os.fdopen(ok_write, "wb")},
+                      meter, dropped.append)
+    reader.join(10)
+    os.close(stuck_read)
+
+    assert dropped == ["stuck"]
+    assert received == [stream]
+    assert meter["ok"] == len(stream)
+    assert meter["stuck"] < push.FANOUT_BUFFER
+
+
+def test_snapshot_covers_discovered_children(fleet):
+    env, scripts, layout = fleet
+
+    result = run_script(env, scripts["snapshot"], ["--type", "hourly"], host="client0")
+
+    assert result["rc"] == 0, result["stderr"]
+    for dataset in ("fastpool/data0", "fastpool/data0/child0", "fastpool/data0/child1", "fastpool/data1"):
+        assert len(snapshot_names(env, "client0", dataset)) == 6
+
+
+def test_snapshot_takes_one_batch_per_pool(fleet):
+    env, scripts, layout = fleet
+
+    result = run_script(env, scripts["snapshot"], ["--type", "hourly"], host="client0")
+
+    assert result["rc"] == 0, result["stderr"]
+    assert result["programs"] == {"zfs": 2}  # discovery listing and one zfs snapshot
+
+
+def test_children_are_discovered_from_one_listing(fleet, tmp_path):
+    env, scripts, layout = fleet
+    scripts = render_scripts(str(tmp_path), [
+        {"dataset": "fastpool/data0", "policy": "critical", "snapshots_discover_children": True},
+        {"dataset": "fastpool/data1", "policy": "critical", "snapshots_discover_children": True},
+        {"dataset": "fastpool/data1/child0", "policy": "none"},
+    ])
+
+    result = run_script(env, scripts["snapshot"], ["--type", "hourly"], host="client0")
+
+    assert result["rc"] == 0, result["stderr"]
+    assert result["programs"] == {"zfs": 2}
+    for dataset in ("fastpool/data0/child0", "fastpool/data0/child1", "fastpool/data1/child1"):
+        assert len(snapshot_names(env, "client0", dataset)) == 6
+    # the declared policy wins over the one child0 would inherit
+    assert len(snapshot_names(env, "client0", "fastpool/data1/child0")) == 5
+
+
+def test_snapshot_failure_is_reported_per_dataset(fleet, tmp_path):
+    env, scripts, layout = fleet
+    scripts = render_scripts(str(tmp_path), [
+        {"dataset": "fastpool/data0", "policy": "critical"},
+        {"dataset": "fastpool/missing", "policy": "critical"},
+        {"dataset": "fastpool/data1", "policy": "critical"},
+    ])
+
+    result = run_script(env, scripts["snapshot"], ["--type", "hourly"], host="client0")
+
+    assert result["rc"] == 1
+    assert "Failed to create snapshot fastpool/missing@" in result["stderr"]
+    assert "1 failed" in result["stdout"]
+    assert len(snapshot_names(env, "client0", "fastpool/data0")) == 6
+    assert len(snapshot_names(env, "client0", "fastpool/data1")) == 6
+
+
+def test_prune_keeps_policy_retention(fleet):
+    env, scripts, layout = fleet
+
+    result = run_script(env, scripts["prune"], [], host="client0")
+
+    assert result["rc"] == 0, result["stderr"]
+    assert len(snapshot_names(env, "client0", "fastpool/data0")) == 5
+    # low keeps 3 hourly and 7 daily snapshots; the fleet has one daily
+    assert len(snapshot_names(env, "client0", "fastpool/data1")) == 4
+
+
+def test_prune_reports_held_snapshots_past_retention(fleet):
+    env, scripts, layout = fleet
+    names = [f"fastpool/data1@{name}" for name in snapshot_names(env, "client0", "fastpool/data1")]
+    subprocess.run(["zfs", "hold", "stale-backup"] + names, env=dict(env, ZFS_SIM_HOST="client0"), check=True)
+
+    result = run_script(env, scripts["prune"], [], host="client0")
+
+    assert result["rc"] == 0, result["stderr"]
+    assert len(snapshot_names(env, "client0", "fastpool/data1")) == 5
+    assert "1 snapshots are past their retention but held" in result["stderr"]
+    assert sum(name in result["stderr"] for name in names) == 1
+
+
+def test_report_lists_managed_datasets(fleet):
+    env, scripts, layout = fleet
+
+    result = run_script(env, scripts["report"], ["--json"], host="client0")
+
+    assert result["rc"] == 0, result["stderr"]
+    report = json.loads(result["stdout"])
+    assert "fastpool/data1" in json.dumps(report["managed"])
+    assert result["bytes"] == 0
+
+
+def test_profile_records_phases_and_commands(fleet, tmp_path):
+    env, scripts, layout = fleet
+
+    result = pull(env, scripts, "--profile")
+
+    [path] = (tmp_path / "logs").glob("zfs-pull-backups-profile-*.json")
+    profile = json.loads(path.read_text())
+    assert {"preflight", "listing", "transfer"} <= set(profile["phases"])
+    assert profile["subprocesses"] == result["subprocesses"]
+    assert profile["commands"]["ssh zfs send"]["count"] == profile["commands"]["zfs receive"]["count"]
+
+
+def test_policy_script_profile(fleet, tmp_path):
+    env, scripts, layout = fleet
+
+    result = run_script(env, scripts["snapshot"], ["--type", "hourly", "--profile"], host="client0")
+
+    assert result["rc"] == 0, result["stderr"]
+    [path] = (tmp_path / "logs").glob("zfs-snapshot-profile-*.json")
+    profile = json.loads(path.read_text())
+    assert set(profile["phases"]["discovery"]["commands"]) == {"zfs list"}
+    assert profile["phases"]["snapshot"]["subprocesses"] == 1
+
+
+def test_profiling_block_is_the_same_in_every_script():
+    blocks = {}
+    for name in ("pull", "push", "snapshot", "prune", "report"):
+        with open(os.path.join(REPO, TEMPLATES[name])) as f:
+            source = f.read()
+        start = source.index("# -- Profiling (--profile) --")
+        blocks[name] = source[start:source.index("# -- End of profiling --", start)]
+
+    assert all(block == blocks["pull"] for block in blocks.values())
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""Benchmark the ZFS scripts against a simulated fleet.
+
+Each scenario builds a fresh fleet of N client hosts x M datasets x K
+snapshots, runs whatever setup it needs through the scripts themselves, then
+measures one step and reports its wall time, the subprocesses it started
+(locally and over ssh) and the bytes zfs send streamed.
+
+    python3 tests/zfssim/bench.py --hosts 4 --datasets 20 --snapshots 100 \\
+        --latency 0.005 --ssh-latency 0.05
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zfssim import model  # noqa: E402
+from zfssim.harness import OFFSITE_FORCED_COMMAND, host_model, render_scripts, run_script, sim_env, with_state  # noqa: E402
+
+OFFSITE_HOST = "offsite"
+OFFSITE_DESTINATION = "fastpool/offsite"
+
+
+def new_fleet(workdir, opts):
+    """Build the fleet and render the scripts for it; returns (env, scripts, layout)."""
+    env = sim_env(workdir, latency=opts.latency, ssh_latency=opts.ssh_latency,
+                  mux_latency=opts.mux_latency, throughput=opts.throughput)
+    layout = with_state(env, model.build_fleet, opts.hosts, opts.datasets, opts.snapshots,
+                        children=opts.children, snapshot_bytes=opts.snapshot_bytes)
+    policy = [{"dataset": root, "policy": "critical", "snapshots_discover_children": opts.children > 0}
+              for root in layout["client0"]]
+    return env, render_scripts(workdir, policy), layout
+
+
+def advance(env, layout):
+    """Take one new hourly snapshot of every client dataset."""
+    stamp = time.strftime("%Y-%m-%d_%H:%M:%S")
+    for host in layout:
+        datasets = [name for name in host_model(env, host)["datasets"] if "/" in name]
+        with_state(env, model.take_snapshots, host, datasets, f"autosnap_{stamp}_hourly")
+
+
+def pull_all(env, scripts, layout, opts):
+    args = ["--recursive"] if opts.children else []
+    return [run_script(env, scripts["pull"], ["--host", host, "--datasets"] + roots + args)
+            for host, roots in layout.items()]
+
+
+def push_offsite(env, scripts, layout):
+    if not os.path.exists(os.path.join(env["ZFS_SIM_STATE"], f"{OFFSITE_HOST}.json")):
+        with_state(env, model.add_host, OFFSITE_HOST, [OFFSITE_DESTINATION], OFFSITE_FORCED_COMMAND)
+    datasets = [f"slowpool/encryptedbackups/{host}/{root}" for host, roots in layout.items() for root in roots]
+    return [run_script(env, scripts["push"], ["--host", OFFSITE_HOST, "--destination", OFFSITE_DESTINATION,
+                                              "--datasets"] + datasets)]
+
+
+def scenario_pull_initial(env, scripts, layout, opts):
+    return pull_all(env, scripts, layout, opts)
+
+
+def scenario_pull_incremental(env, scripts, layout, opts):
+    pull_all(env, scripts, layout, opts)
+    advance(env, layout)
+    return pull_all(env, scripts, layout, opts)
+
+
+def scenario_pull_noop(env, scripts, layout, opts):
+    pull_all(env, scripts, layout, opts)
+    return pull_all(env, scripts, layout, opts)
+
+
+def scenario_push_initial(env, scripts, layout, opts):
+    pull_all(env, scripts, layout, opts)
+    return push_offsite(env, scripts, layout)
+
+
+def scenario_push_incremental(env, scripts, layout, opts):
+    pull_all(env, scripts, layout, opts)
+    push_offsite(env, scripts, layout)
+    advance(env, layout)
+    pull_all(env, scripts, layout, opts)
+    return push_offsite(env, scripts, layout)
+
+
+def scenario_push_noop(env, scripts, layout, opts):
+    pull_all(env, scripts, layout, opts)
+    push_offsite(env, scripts, layout)
+    return push_offsite(env, scripts, layout)
+
+
+def scenario_snapshot(env, scripts, layout, opts):
+    return [run_script(env, scripts["snapshot"], ["--type", "hourly"], host="client0")]
+
+
+def scenario_prune(env, scripts, layout, opts):
+    return [run_script(env, scripts["prune"], [], host="client0")]
+
+
+def scenario_report(env, scripts, layout, opts):
+    return [run_script(env, scripts["report"], ["--json"], host="client0")]
+
+
+SCENARIOS = {
+    "pull-initial": scenario_pull_initial,
+    "pull-incremental": scenario_pull_incremental,
+    "pull-noop": scenario_pull_noop,
+    "push-initial": scenario_push_initial,
+    "push-incremental": scenario_push_incremental,
+    "push-noop": scenario_push_noop,
+    "snapshot": scenario_snapshot,
+    "prune": scenario_prune,
+    "report": scenario_report,
+}
+
+
+def run_scenario(name, opts):
+    """Run one scenario in a scratch directory and sum its measured runs."""
+    with tempfile.TemporaryDirectory(prefix=f"zfssim-{name}-") as workdir:
+        env, scripts, layout = new_fleet(workdir, opts)
+        runs = SCENARIOS[name](env, scripts, layout, opts)
+    failed = [run for run in runs if run["rc"] != 0]
+    for run in failed:
+        sys.stderr.write(f"{name}: exit {run['rc']}\n{run['stderr']}")
+    return {
+        "scenario": name,
+        "runs": len(runs),
+        "failed": len(failed),
+        "seconds": round(sum(run["seconds"] for run in runs), 3),
+        "subprocesses": sum(run["subprocesses"] for run in runs),
+        "remote": sum(run["remote"] for run in runs),
+        "bytes": sum(run["bytes"] for run in runs),
+    }
+
+
+def print_table(results):
+    header = f"{'scenario':<18} {'runs':>4} {'failed':>6} {'wall s':>9} {'subprocs':>9} {'remote':>7} {'bytes':>14}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['scenario']:<18} {r['runs']:>4} {r['failed']:>6} {r['seconds']:>9.3f} "
+              f"{r['subprocesses']:>9} {r['remote']:>7} {r['bytes']:>14}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the ZFS backup and policy scripts against a simulated fleet")
+    parser.add_argument("scenarios", nargs="*", metavar="SCENARIO",
+                        help=f"Scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--hosts", type=int, default=2, help="Client hosts (default: %(default)s)")
+    parser.add_argument("--datasets", type=int, default=4, help="Datasets per host (default: %(default)s)")
+    parser.add_argument("--children", type=int, default=0, help="Child datasets under each dataset (default: %(default)s)")
+    parser.add_argument("--snapshots", type=int, default=48, help="Snapshots per dataset (default: %(default)s)")
+    parser.add_argument("--snapshot-bytes", type=int, default=1024 * 1024, help="Bytes written per snapshot (default: %(default)s)")
+    parser.add_argument("--latency", type=float, default=0, help="Seconds added to every zfs and zpool call")
+    parser.add_argument("--ssh-latency", type=float, default=0, help="Seconds added to every new ssh connection")
+    parser.add_argument("--mux-latency", type=float, default=0, help="Seconds added to every multiplexed ssh session")
+    parser.add_argument("--throughput", type=float, default=0, help="Bytes per second zfs send streams at (default: unlimited)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    opts = parser.parse_args()
+    unknown = [name for name in opts.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(unknown)}")
+
+    results = [run_scenario(name, opts) for name in opts.scenarios or SCENARIOS]
+    if opts.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+    sys.exit(1 if any(r["failed"] for r in results) else 0)
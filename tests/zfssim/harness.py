@@ -0,0 +1,196 @@
+"""Render the ZFS scripts and run them against the simulated fleet in model.py.
+
+A workdir holds everything one run needs: the rendered scripts, the fleet
+state, lockfiles, journals and logs. Scripts run as real subprocesses with
+bin/ first on PATH, so every zfs, zpool and ssh call they make goes through
+the simulator and shows up in the call log.
+"""
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import time
+
+import jinja2
+import yaml
+
+from zfssim import model
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(os.path.dirname(HERE))
+SIM_BIN = model.SIM_BIN
+# sshd forced command of the offsite hosts, which only lets the push through
+OFFSITE_FORCED_COMMAND = os.path.join(REPO, "roles/backups-zfs-archive-offsite/files/restrict_commands.sh")
+
+TEMPLATES = {
+    "pull": "roles/backups-zfs-server/templates/zfs-pull-backups.py",
+    "push": "roles/backups-zfs-server/templates/zfs-push-backups.py",
+    "snapshot": "roles/system-zfs-policy/templates/zfs-snapshot.py.j2",
+    "prune": "roles/system-zfs-policy/templates/zfs-prune.py.j2",
+    "report": "roles/system-zfs-policy/templates/zfs-snapshot-report.py.j2",
+    "orchestrator": "roles/backups-zfs-server/templates/zfs-backup-orchestrator.py",
+}
+
+# Names the role installs scripts under in backups_zfs_server_script_path,
+# where the orchestrator runs them from
+INSTALLED = {
+    "pull": "zfs-pull-backups",
+    "push": "zfs-push-backups",
+}
+
+DEFAULTS = (
+    "roles/backups-zfs-server/defaults/main.yaml",
+    "roles/system-zfs-policy/defaults/main.yaml",
+)
+
+
+def role_defaults():
+    """Role default variables, unrendered."""
+    variables = {}
+    for path in DEFAULTS:
+        with open(os.path.join(REPO, path)) as f:
+            variables.update(yaml.safe_load(f))
+    return variables
+
+
+def render_scripts(workdir, datasets, **extra):
+    """Render every script in TEMPLATES into workdir/bin and return {name: path}.
+
+    datasets is the policy list the scripts would get from the
+    zfs_datasets_with_policy filter: [{'dataset', 'policy', ...}]; extra
+    overrides role variables (e.g. the orchestrator's client list). The
+    scripts in INSTALLED are also linked into workdir under their installed
+    names.
+
+    Paths the scripts keep outside their own directory (lockfiles under
+    /var/run) are moved into the workdir, and the root check of the policy
+    scripts is dropped, so the harness runs unprivileged.
+    """
+    variables = role_defaults()
+    variables.update(
+        zfs=datasets,
+        host_name="sim",
+        inventory_hostname="sim",
+        vault_zfsbackups_user="zfsbackup",
+        backups_zfs_server_script_path=workdir,
+        backups_zfs_server_logging_dir=os.path.join(workdir, "logs"),
+        system_zfs_policy_log_dir=os.path.join(workdir, "logs"),
+    )
+    variables.update(extra)
+    env = jinja2.Environment(keep_trailing_newline=True)
+    env.filters["to_json"] = json.dumps
+    env.filters["bool"] = bool
+    env.filters["zfs_datasets_with_policy"] = lambda value: value
+    rewrites = (
+        ("/var/run/", os.path.join(workdir, "run") + "/"),
+        ("os.geteuid()", "0"),
+    )
+    bindir = os.path.join(workdir, "bin")
+    for sub in ("bin", "logs", "run", "state"):
+        os.makedirs(os.path.join(workdir, sub), exist_ok=True)
+    scripts = {}
+    for name, template in TEMPLATES.items():
+        with open(os.path.join(REPO, template)) as f:
+            text = env.from_string(f.read()).render(**variables)
+        for old, new in rewrites:
+            text = text.replace(old, new)
+        path = os.path.join(bindir, f"{name}.py")
+        with open(path, "w") as f:
+            f.write(text)
+        scripts[name] = path
+        if name in INSTALLED:
+            link = os.path.join(workdir, INSTALLED[name])
+            if os.path.lexists(link):
+                os.remove(link)
+            os.symlink(path, link)
+    return scripts
+
+
+def import_script(path):
+    """Import a rendered script as a module, to test its functions directly."""
+    spec = importlib.util.spec_from_file_location(os.path.splitext(os.path.basename(path))[0], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def sim_env(workdir, latency=0, ssh_latency=0, mux_latency=0, throughput=0):
+    """Environment running commands against the fleet stored in workdir/sim."""
+    env = dict(os.environ)
+    env.update(
+        PATH=SIM_BIN + os.pathsep + env.get("PATH", ""),
+        ZFS_SIM_STATE=os.path.join(workdir, "sim"),
+        ZFS_SIM_HOST="local",
+        ZFS_SIM_LATENCY=str(latency),
+        ZFS_SIM_SSH_LATENCY=str(ssh_latency),
+        ZFS_SIM_SSH_MUX_LATENCY=str(mux_latency),
+        ZFS_SIM_THROUGHPUT=str(throughput),
+    )
+    return env
+
+
+def read_calls(env, offset=0):
+    """Calls logged by the stand-ins since byte offset; returns (calls, new offset)."""
+    path = os.path.join(env["ZFS_SIM_STATE"], "calls.jsonl")
+    if not os.path.exists(path):
+        return [], offset
+    with open(path) as f:
+        f.seek(offset)
+        data = f.read()
+        return [json.loads(line) for line in data.splitlines()], f.tell()
+
+
+def run_script(env, script, args, host="local"):
+    """Run a rendered script on host and measure it.
+
+    Returns {'rc', 'seconds', 'subprocesses', 'remote', 'programs', 'bytes',
+    'stdout', 'stderr'}: subprocesses counts the stand-in commands the script
+    started on host itself, remote those ssh ran on other hosts, and bytes
+    is the total zfs send streamed.
+    """
+    env = dict(env, ZFS_SIM_HOST=host)
+    _, offset = read_calls(env)
+    started = time.monotonic()
+    result = subprocess.run([sys.executable, script] + list(args), env=env,
+                            capture_output=True, text=True, check=False)
+    seconds = time.monotonic() - started
+    calls, _ = read_calls(env, offset)
+    programs = {}
+    for call in calls:
+        programs[call["prog"]] = programs.get(call["prog"], 0) + 1
+    return {
+        "rc": result.returncode,
+        "seconds": seconds,
+        "subprocesses": sum(1 for call in calls if call["host"] == host),
+        "remote": sum(1 for call in calls if call["host"] != host),
+        "programs": programs,
+        "bytes": sum(call["bytes"] for call in calls
+                     if call["prog"] == "zfs" and call["argv"][0] == "send"),
+        "stdout": result.stdout,
+        "stderr": result.stderr,
+    }
+
+
+def host_model(env, host):
+    """Current state of host in the fleet."""
+    with open(os.path.join(env["ZFS_SIM_STATE"], f"{host}.json")) as f:
+        return json.load(f)
+
+
+def snapshot_names(env, host, dataset):
+    """Short names of the snapshots of dataset on host, oldest first."""
+    return [snap["name"] for snap in host_model(env, host)["datasets"][dataset]["snapshots"]]
+
+
+def with_state(env, func, *args, **kwargs):
+    """Call a model function with ZFS_SIM_STATE pointing at env's fleet."""
+    saved = os.environ.get("ZFS_SIM_STATE")
+    os.environ["ZFS_SIM_STATE"] = env["ZFS_SIM_STATE"]
+    try:
+        return func(*args, **kwargs)
+    finally:
+        if saved is None:
+            del os.environ["ZFS_SIM_STATE"]
+        else:
+            os.environ["ZFS_SIM_STATE"] = saved
@@ -0,0 +1,926 @@
+"""Synthetic ZFS fleet model backing the stand-in zfs, zpool and ssh commands.
+
+Every host is a JSON file in $ZFS_SIM_STATE holding its datasets, snapshots,
+bookmarks, holds, resume state and encryption roots. The stand-ins in bin/ act on the host named
+by $ZFS_SIM_HOST ("local" by default); ssh switches it to the target host for
+the remote command. Send streams are a JSON header followed by as many filler
+bytes as the snapshots' written properties add up to.
+
+Only the subset of zfs that the backup and policy scripts use is modelled.
+
+Tunables (environment):
+    ZFS_SIM_LATENCY           seconds added to every zfs and zpool call
+    ZFS_SIM_SSH_LATENCY       seconds added to every new ssh connection
+    ZFS_SIM_SSH_MUX_LATENCY   seconds added to every multiplexed ssh session
+    ZFS_SIM_THROUGHPUT        bytes per second a zfs send streams at (0: unlimited)
+    ZFS_SIM_SEND_ABORT_AFTER  cut every zfs send off after this many bytes
+
+A host created with a forced_command (see add_host) runs every ssh command
+through that script with $SSH_ORIGINAL_COMMAND set, as sshd would for a
+`command="..."` key, so a command the script rejects fails here too.
+
+Every call is appended to $ZFS_SIM_STATE/calls.jsonl with its host, argv,
+duration, exit code and the bytes it streamed.
+"""
+import base64
+import fcntl
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+HEADER_MAGIC = b"ZFSSIM1 "
+CHUNK = 1024 * 1024
+SIM_BIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bin")
+# Stand-ins a forced command reaches through bash functions, since such
+# scripts usually put the system directories first on PATH
+FORCED_COMMAND_TOOLS = ("zfs", "zpool", "lzop", "zstd", "mbuffer", "pv")
+
+
+def state_dir():
+    return os.environ["ZFS_SIM_STATE"]
+
+
+def current_host():
+    return os.environ.get("ZFS_SIM_HOST", "local")
+
+
+def host_path(host):
+    return os.path.join(state_dir(), f"{host}.json")
+
+
+def log_call(prog, argv, started, rc, nbytes=0):
+    record = {
+        "prog": prog,
+        "host": current_host(),
+        "argv": argv,
+        "started": started,
+        "seconds": round(time.monotonic() - started, 6),
+        "rc": rc,
+        "bytes": nbytes,
+    }
+    path = os.path.join(state_dir(), "calls.jsonl")
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.write(json.dumps(record) + "\n")
+
+
+@contextmanager
+def locked_host(host, write=True):
+    lock_path = host_path(host) + ".lock"
+    with open(lock_path, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX if write else fcntl.LOCK_SH)
+        with open(host_path(host)) as f:
+            model = json.load(f)
+        yield model
+        if write:
+            tmp = host_path(host) + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(model, f)
+            os.replace(tmp, host_path(host))
+
+
+def new_guid():
+    return random.getrandbits(63)
+
+
+def next_txg(model):
+    model["txg"] += 1
+    return model["txg"]
+
+
+def latency(var):
+    delay = float(os.environ.get(var, "0") or 0)
+    if delay:
+        time.sleep(delay)
+
+
+class ZfsError(Exception):
+    pass
+
+
+# -- fleet construction ----------------------------------------------------
+
+def empty_host(pools=()):
+    model = {"txg": 100, "datasets": {}, "features": {}}
+    for pool in pools:
+        add_dataset(model, pool)
+    return model
+
+
+def add_dataset(model, name, props=None):
+    model["datasets"][name] = {
+        "guid": new_guid(),
+        "createtxg": next_txg(model),
+        "creation": int(time.time()),
+        "props": dict(props or {}),
+        "snapshots": [],
+        "bookmarks": [],
+        "resume": None,
+    }
+    return model["datasets"][name]
+
+
+def add_snapshot(model, dataset, snap, creation=None, written=0, referenced=None):
+    ds = model["datasets"][dataset]
+    prev_ref = ds["snapshots"][-1]["referenced"] if ds["snapshots"] else 0
+    ds["snapshots"].append({
+        "name": snap,
+        "guid": new_guid(),
+        "createtxg": next_txg(model),
+        "creation": int(creation if creation is not None else time.time()),
+        "written": int(written),
+        "referenced": int(referenced if referenced is not None else prev_ref + written),
+        "holds": [],
+    })
+
+
+def write_host(host, model):
+    os.makedirs(state_dir(), exist_ok=True)
+    with open(host_path(host), "w") as f:
+        json.dump(model, f)
+
+
+def read_host(host):
+    with open(host_path(host)) as f:
+        return json.load(f)
+
+
+# -- naming helpers --------------------------------------------------------
+
+def split_name(name):
+    """Return (dataset, '@'|'#'|None, short) for a zfs object name."""
+    for sep in ("@", "#"):
+        if sep in name:
+            dataset, short = name.split(sep, 1)
+            return dataset, sep, short
+    return name, None, None
+
+
+def get_dataset(model, name):
+    ds = model["datasets"].get(name)
+    if ds is None:
+        raise ZfsError(f"cannot open '{name}': dataset does not exist")
+    return ds
+
+
+def get_snapshot(model, name):
+    dataset, sep, short = split_name(name)
+    ds = get_dataset(model, dataset)
+    for snap in ds["snapshots"]:
+        if snap["name"] == short:
+            return ds, snap
+    raise ZfsError(f"cannot open '{name}': snapshot does not exist")
+
+
+def get_bookmark(model, name):
+    dataset, sep, short = split_name(name)
+    ds = get_dataset(model, dataset)
+    for bm in ds["bookmarks"]:
+        if bm["name"] == short:
+            return ds, bm
+    raise ZfsError(f"cannot open '{name}': bookmark does not exist")
+
+
+def encryption_root(model, name):
+    """The encryption root a dataset inherits from (itself if it is one), or None."""
+    while name:
+        if model["datasets"].get(name, {}).get("encryption_root"):
+            return name
+        name = name.rpartition("/")[0]
+    return None
+
+
+def descendants(model, name, depth=None):
+    """Datasets at or below name (sorted), optionally limited in depth."""
+    prefix = name + "/"
+    base_depth = name.count("/")
+    result = []
+    for ds_name in sorted(model["datasets"]):
+        if ds_name == name or ds_name.startswith(prefix):
+            if depth is None or ds_name.count("/") - base_depth <= depth:
+                result.append(ds_name)
+    return result
+
+
+def written_between(ds, from_txg, to_snap):
+    """Bytes written after from_txg up to and including to_snap."""
+    return sum(s["written"] for s in ds["snapshots"]
+               if from_txg < s["createtxg"] <= to_snap["createtxg"])
+
+
+# -- zfs list / get --------------------------------------------------------
+
+def object_rows(model, names, recursive, depth, types):
+    """Yield (kind, full_name, dataset, obj) in zfs list order."""
+    if not names:
+        names = sorted(n for n in model["datasets"] if "/" not in n)
+        recursive = True
+    seen = set()
+    for name in names:
+        dataset, sep, short = split_name(name)
+        if sep:
+            ds, obj = (get_snapshot if sep == "@" else get_bookmark)(model, name)
+            if name not in seen:
+                seen.add(name)
+                yield ("snapshot" if sep == "@" else "bookmark"), name, ds, obj
+            continue
+        get_dataset(model, name)
+        if recursive or depth is not None:
+            targets = descendants(model, name, depth)
+        else:
+            targets = [name]
+        for ds_name in targets:
+            if ds_name in seen:
+                continue
+            seen.add(ds_name)
+            ds = model["datasets"][ds_name]
+            yield "filesystem", ds_name, ds, None
+            if depth is not None and ds_name.count("/") - name.count("/") >= depth:
+                continue
+            if "snapshot" in types:
+                for snap in ds["snapshots"]:
+                    yield "snapshot", f"{ds_name}@{snap['name']}", ds, snap
+            if "bookmark" in types:
+                for bm in ds["bookmarks"]:
+                    yield "bookmark", f"{ds_name}#{bm['name']}", ds, bm
+
+
+def wanted(row, types):
+    return row[0] in types or (row[0] == "filesystem" and "volume" in types)
+
+
+def prop_value(model, kind, full_name, ds, obj, prop, parsable):
+    if prop == "name":
+        return full_name
+    if prop == "type":
+        return kind
+    target = obj if obj is not None else ds
+    if prop in ("guid", "createtxg"):
+        return str(target[prop])
+    if prop == "creation":
+        if parsable:
+            return str(target["creation"])
+        return time.strftime("%a %b %d %H:%M %Y", time.localtime(target["creation"]))
+    if prop == "userrefs":
+        return str(len(obj["holds"])) if kind == "snapshot" else "-"
+    if prop == "receive_resume_token":
+        if kind == "filesystem" and ds.get("resume"):
+            return ds["resume"]["token"]
+        return "-"
+    if prop == "referenced":
+        if kind == "snapshot":
+            return str(obj["referenced"])
+        if kind == "filesystem":
+            return str(ds["snapshots"][-1]["referenced"] if ds["snapshots"] else 0)
+        return "-"
+    if prop == "used":
+        if kind == "filesystem":
+            return str(sum(s["written"] for s in ds["snapshots"]))
+        return str(obj.get("written", 0)) if kind == "snapshot" else "-"
+    if prop == "written":
+        if kind == "snapshot":
+            return str(obj["written"])
+        return "0" if kind == "filesystem" else "-"
+    if prop.startswith("written@"):
+        base_name = prop.split("@", 1)[1]
+        base = next((s for s in ds["snapshots"] if s["name"] == base_name), None)
+        if base is None or kind == "bookmark":
+            return "-"
+        upto = obj if kind == "snapshot" else (ds["snapshots"][-1] if ds["snapshots"] else None)
+        if upto is None or upto["createtxg"] < base["createtxg"]:
+            return "-"
+        return str(written_between(ds, base["createtxg"], upto))
+    if prop == "encryptionroot":
+        return encryption_root(model, split_name(full_name)[0]) or "-"
+    if prop.startswith("feature@"):
+        return "-"
+    if prop in ds.get("props", {}):
+        return str(ds["props"][prop])
+    return "-"
+
+
+def parse_flags(args, with_value, boolean):
+    """Minimal getopt supporting clustered short flags like -Hp."""
+    opts = {}
+    rest = []
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg.startswith("-") and len(arg) > 1 and not rest:
+            letters = arg[1:]
+            j = 0
+            while j < len(letters):
+                letter = letters[j]
+                if letter in with_value:
+                    value = letters[j + 1:] or args[i + 1]
+                    if not letters[j + 1:]:
+                        i += 1
+                    opts.setdefault(letter, []).append(value)
+                    break
+                if letter in boolean:
+                    opts[letter] = opts.get(letter, 0) + 1 if isinstance(opts.get(letter, 0), int) else 1
+                else:
+                    raise ZfsError(f"invalid option '{letter}'")
+                j += 1
+        else:
+            rest.append(arg)
+        i += 1
+    return opts, rest
+
+
+def expand_types(values):
+    types = set()
+    for value in values:
+        for t in value.split(","):
+            if t == "all":
+                types |= {"filesystem", "volume", "snapshot", "bookmark"}
+            elif t in ("snap", "snapshot"):
+                types.add("snapshot")
+            else:
+                types.add(t)
+    return types
+
+
+def cmd_list(model, args, out):
+    opts, names = parse_flags(args, "tosSd", "Hpr")
+    types = expand_types(opts.get("t", ["filesystem,volume"]))
+    props = ",".join(opts.get("o", ["name"])).split(",")
+    depth = int(opts["d"][-1]) if "d" in opts else None
+    rows = [r for r in object_rows(model, names, "r" in opts, depth, types) if wanted(r, types)]
+    for key in opts.get("s", []):
+        rows.sort(key=lambda r: int(prop_value(model, *r, key, True)))
+    for key in opts.get("S", []):
+        rows.sort(key=lambda r: int(prop_value(model, *r, key, True)), reverse=True)
+    for row in rows:
+        values = [prop_value(model, *row, p, "p" in opts) for p in props]
+        out.append("\t".join(values))
+
+
+def cmd_get(model, args, out):
+    opts, rest = parse_flags(args, "tosd", "Hpr")
+    props = rest[0].split(",")
+    names = rest[1:]
+    fields = ",".join(opts.get("o", ["name,property,value,source"])).split(",")
+    types = expand_types(opts.get("t", ["all"]))
+    depth = int(opts["d"][-1]) if "d" in opts else None
+    expand = types if ("r" in opts or depth is not None) else {"filesystem"}
+    for row in object_rows(model, names, "r" in opts, depth, expand):
+        if not wanted(row, types) and row[1] not in names:
+            continue
+        for prop in props:
+            value = prop_value(model, *row, prop, "p" in opts)
+            line = []
+            for field in fields:
+                line.append({"name": row[1], "property": prop, "value": value,
+                             "source": "-"}[field])
+            out.append("\t".join(line))
+
+
+# -- dataset mutation ------------------------------------------------------
+
+def cmd_create(model, args, out):
+    opts, rest = parse_flags(args, "o", "p")
+    name = rest[0]
+    if name in model["datasets"]:
+        raise ZfsError(f"cannot create '{name}': dataset already exists")
+    parent = name.rsplit("/", 1)[0]
+    if "/" in name and parent not in model["datasets"]:
+        if "p" not in opts:
+            raise ZfsError(f"cannot create '{name}': parent does not exist")
+        parts = name.split("/")
+        for i in range(1, len(parts)):
+            ancestor = "/".join(parts[:i])
+            if ancestor not in model["datasets"]:
+                add_dataset(model, ancestor)
+    props = dict(o.split("=", 1) for o in opts.get("o", []))
+    add_dataset(model, name, props)
+
+
+def cmd_snapshot(model, args, out):
+    opts, names = parse_flags(args, "o", "r")
+    for name in names:
+        dataset, sep, short = split_name(name)
+        ds = get_dataset(model, dataset)
+        if any(s["name"] == short for s in ds["snapshots"]):
+            raise ZfsError(f"cannot create snapshot '{name}': dataset already exists")
+    txg = next_txg(model)
+    now = int(time.time())
+    for name in names:
+        dataset, sep, short = split_name(name)
+        ds = model["datasets"][dataset]
+        written = int(ds["props"].get("sim:churn", 0))
+        prev_ref = ds["snapshots"][-1]["referenced"] if ds["snapshots"] else 0
+        ds["snapshots"].append({"name": short, "guid": new_guid(), "createtxg": txg,
+                                "creation": now, "written": written,
+                                "referenced": prev_ref + written, "holds": []})
+
+
+def cmd_destroy(model, args, out):
+    opts, names = parse_flags(args, "", "rRfnv")
+    for name in names:
+        dataset, sep, short = split_name(name)
+        if sep == "@":
+            ds, snap = get_snapshot(model, name)
+            if snap["holds"]:
+                raise ZfsError(f"cannot destroy snapshot {name}: dataset is busy")
+            ds["snapshots"].remove(snap)
+        elif sep == "#":
+            ds, bm = get_bookmark(model, name)
+            ds["bookmarks"].remove(bm)
+        else:
+            for child in descendants(model, name) if "r" in opts else [name]:
+                get_dataset(model, child)
+                del model["datasets"][child]
+
+
+def cmd_hold(model, args, out):
+    opts, rest = parse_flags(args, "", "r")
+    tag, names = rest[0], rest[1:]
+    for name in names:
+        ds, snap = get_snapshot(model, name)
+        if tag in snap["holds"]:
+            raise ZfsError(f"cannot hold snapshot '{name}': tag already exists on this dataset")
+    for name in names:
+        get_snapshot(model, name)[1]["holds"].append(tag)
+
+
+def cmd_release(model, args, out):
+    opts, rest = parse_flags(args, "", "r")
+    tag, names = rest[0], rest[1:]
+    failed = []
+    for name in names:
+        ds, snap = get_snapshot(model, name)
+        if tag in snap["holds"]:
+            snap["holds"].remove(tag)
+        else:
+            failed.append(name)
+    if failed:
+        raise ZfsError("\n".join(f"cannot release hold from snapshot '{n}': no such tag on this dataset"
+                                 for n in failed))
+
+
+def cmd_holds(model, args, out):
+    opts, names = parse_flags(args, "", "Hrp")
+    for name in names:
+        ds, snap = get_snapshot(model, name)
+        for tag in snap["holds"]:
+            out.append(f"{name}\t{tag}\t{time.strftime('%a %b %d %H:%M %Y')}")
+
+
+def cmd_bookmark(model, args, out):
+    snap_name, bm_name = args[-2], args[-1]
+    ds, snap = get_snapshot(model, snap_name)
+    dataset, sep, short = split_name(bm_name)
+    if any(b["name"] == short for b in ds["bookmarks"]):
+        raise ZfsError(f"cannot create bookmark '{bm_name}': bookmark exists")
+    ds["bookmarks"].append({"name": short, "guid": snap["guid"],
+                            "createtxg": snap["createtxg"], "creation": snap["creation"]})
+
+
+# -- send / receive --------------------------------------------------------
+
+def snap_record(snap):
+    return {k: snap[k] for k in ("name", "guid", "creation", "written", "referenced")}
+
+
+def build_stream(model, dataset, snaps, from_obj, from_is_bookmark, full_upto):
+    """Describe a single-dataset stream; returns the stream record."""
+    ds = model["datasets"][dataset]
+    if from_obj is None:
+        size = snaps[0]["referenced"] + sum(s["written"] for s in snaps[1:])
+    else:
+        size = written_between(ds, from_obj["createtxg"], snaps[-1])
+    return {
+        "dataset": dataset,
+        "from_guid": from_obj["guid"] if from_obj else None,
+        "encrypted": encryption_root(model, dataset) is not None,
+        "snapshots": [snap_record(s) for s in snaps],
+        "size": int(size),
+    }
+
+
+def plan_send(model, args):
+    opts, rest = parse_flags(args, "It", "nvPwcLRieDe")
+    header = {"raw": "w" in opts, "compressed": "c" in opts, "large_block": "L" in opts,
+              "streams": [], "resume_offset": 0}
+    if "t" in opts:
+        token = json.loads(base64.b64decode(opts["t"][0]).decode())
+        header.update(token["header"])
+        header["resume_offset"] = token["received"]
+        for stream in header["streams"]:
+            ds = model["datasets"].get(stream["dataset"])
+            guids = {s["guid"] for s in ds["snapshots"]} if ds else set()
+            if not all(s["guid"] in guids for s in stream["snapshots"]):
+                raise ZfsError("cannot resume send: snapshot in resume token no longer exists")
+        return opts, header
+    target = rest[-1]
+    ds, snap = get_snapshot(model, target)
+    dataset = split_name(target)[0]
+    from_name = opts["I"][0] if "I" in opts else (rest[0] if "i" in opts and len(rest) > 1 else None)
+    intermediate = "I" in opts
+    if "R" in opts:
+        header["replicate"] = dataset
+        from_short = split_name(from_name)[2] if from_name else None
+        for child in descendants(model, dataset):
+            cds = model["datasets"][child]
+            target_snap = next((s for s in cds["snapshots"] if s["name"] == snap["name"]), None)
+            if target_snap is None:
+                continue
+            base = next((s for s in cds["snapshots"] if s["name"] == from_short), None) if from_short else None
+            upto = [s for s in cds["snapshots"] if s["createtxg"] <= target_snap["createtxg"]]
+            if base is not None:
+                snaps = [s for s in upto if s["createtxg"] > base["createtxg"]]
+                header["streams"].append(build_stream(model, child, snaps, base, False, None))
+            else:
+                header["streams"].append(build_stream(model, child, upto, None, False, upto[0]))
+        return opts, header
+    if from_name is None:
+        header["streams"].append(build_stream(model, dataset, [snap], None, False, snap))
+        return opts, header
+    if from_name.startswith("#") or from_name.startswith("@"):
+        from_name = dataset + from_name
+    if "#" in from_name:
+        if intermediate:
+            raise ZfsError("cannot use -I with a bookmark source")
+        fds, base = get_bookmark(model, from_name)
+    else:
+        fds, base = get_snapshot(model, from_name)
+    if fds is not ds:
+        raise ZfsError(f"incremental source ({from_name}) must be a snapshot of the same dataset")
+    if base["createtxg"] >= snap["createtxg"]:
+        raise ZfsError("incremental source must be earlier than destination")
+    if intermediate:
+        snaps = [s for s in ds["snapshots"] if base["createtxg"] < s["createtxg"] <= snap["createtxg"]]
+    else:
+        snaps = [snap]
+    header["streams"].append(build_stream(model, dataset, snaps, base, "#" in from_name, None))
+    return opts, header
+
+
+def throttle_write(out, nbytes):
+    rate = float(os.environ.get("ZFS_SIM_THROUGHPUT", "0") or 0)
+    chunk = b"\0" * CHUNK
+    sent = 0
+    started = time.monotonic()
+    while sent < nbytes:
+        n = min(CHUNK, nbytes - sent)
+        out.write(chunk[:n])
+        sent += n
+        if rate:
+            ahead = sent / rate - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+    out.flush()
+    return sent
+
+
+def cmd_send(args):
+    with locked_host(current_host(), write=False) as model:
+        opts, header = plan_send(model, args)
+    total = sum(s["size"] for s in header["streams"])
+    remaining = max(total - header["resume_offset"], 0)
+    if "n" in opts:
+        lines = []
+        for stream in header["streams"]:
+            kind = "incremental" if stream["from_guid"] else "full"
+            lines.append(f"{kind}\t{stream['dataset']}@{stream['snapshots'][-1]['name']}\t{stream['size']}")
+        lines.append(f"size\t{remaining}")
+        sys.stdout.write("\n".join(lines) + "\n")
+        return 0
+    header["size"] = total
+    out = sys.stdout.buffer
+    out.write(HEADER_MAGIC + json.dumps(header).encode() + b"\n")
+    abort_after = os.environ.get("ZFS_SIM_SEND_ABORT_AFTER")
+    try:
+        if abort_after is not None and int(abort_after) < remaining:
+            sent = throttle_write(out, int(abort_after))
+            sys.stderr.write("warning: cannot send: connection reset (simulated)\n")
+            return 1, sent
+        return 0, throttle_write(out, remaining)
+    except BrokenPipeError:
+        sys.stderr.write("warning: cannot send: Broken pipe\n")
+        return 1, 0
+
+
+def apply_stream(model, target_root, header, stream, force, resumed):
+    if header.get("replicate"):
+        rel = stream["dataset"][len(header["replicate"]):]
+        target = target_root + rel
+    else:
+        target = target_root
+    snaps = stream["snapshots"]
+    ds = model["datasets"].get(target)
+    if stream["from_guid"] is None:
+        if ds is not None and not (resumed and not ds["snapshots"]):
+            if ds["snapshots"] or not force:
+                raise ZfsError(f"cannot receive new filesystem stream: destination '{target}' exists")
+        parent = target.rsplit("/", 1)[0]
+        if parent not in model["datasets"]:
+            raise ZfsError(f"cannot receive new filesystem stream: parent of '{target}' does not exist")
+        if ds is None:
+            ds = add_dataset(model, target)
+        # A raw stream keeps the source's encryption; anything else is
+        # encrypted (or not) by the parent it lands under
+        if header.get("raw") and stream.get("encrypted"):
+            ds["encryption_root"] = True
+    else:
+        if ds is None:
+            raise ZfsError(f"cannot receive incremental stream: destination '{target}' does not exist")
+        idx = next((i for i, s in enumerate(ds["snapshots"]) if s["guid"] == stream["from_guid"]), None)
+        if idx is None:
+            raise ZfsError(f"cannot receive incremental stream: most recent snapshot of {target} does not match incremental source")
+        if idx != len(ds["snapshots"]) - 1:
+            if not force:
+                raise ZfsError(f"cannot receive incremental stream: destination {target} has been modified since most recent snapshot")
+            del ds["snapshots"][idx + 1:]
+    for snap in snaps:
+        if any(s["guid"] == snap["guid"] for s in ds["snapshots"]):
+            continue
+        record = dict(snap)
+        record["createtxg"] = next_txg(model)
+        record["holds"] = []
+        ds["snapshots"].append(record)
+    ds["resume"] = None
+
+
+def cmd_receive(args):
+    opts, rest = parse_flags(args, "ox", "FusAvnde")
+    target = rest[-1]
+    if "A" in opts:
+        with locked_host(current_host()) as model:
+            ds = get_dataset(model, target)
+            if not ds.get("resume"):
+                raise ZfsError(f"'{target}' does not have any resumable receive state to abort")
+            if ds["resume"].get("created"):
+                del model["datasets"][target]
+            else:
+                ds["resume"] = None
+        return 0, 0
+    stdin = sys.stdin.buffer
+    line = stdin.readline()
+    if not line.startswith(HEADER_MAGIC):
+        raise ZfsError("cannot receive: invalid stream (bad magic number)")
+    header = json.loads(line[len(HEADER_MAGIC):])
+    expected = header["size"] - header["resume_offset"]
+    received = 0
+    while True:
+        chunk = stdin.read(CHUNK)
+        if not chunk:
+            break
+        received += len(chunk)
+    with locked_host(current_host()) as model:
+        if received < expected:
+            if "s" in opts and not header.get("replicate"):
+                ds = model["datasets"].get(target)
+                created = ds is None
+                if created:
+                    parent = target.rsplit("/", 1)[0]
+                    if parent in model["datasets"]:
+                        ds = add_dataset(model, target)
+                if ds is not None:
+                    token_header = {k: v for k, v in header.items() if k not in ("resume_offset", "size")}
+                    token = base64.b64encode(json.dumps({
+                        "header": token_header,
+                        "received": header["resume_offset"] + received,
+                    }).encode()).decode()
+                    ds["resume"] = {"token": token, "created": created or bool(ds["resume"] and ds["resume"].get("created"))}
+            truncated = True
+        else:
+            truncated = False
+        if not truncated:
+            resumed = header["resume_offset"] > 0
+            if resumed:
+                ds = model["datasets"].get(target)
+                if ds is None or not ds.get("resume"):
+                    raise ZfsError("cannot receive resume stream: destination has no resume state")
+            for stream in header["streams"]:
+                apply_stream(model, target, header, stream, "F" in opts, resumed)
+    if truncated:
+        raise ZfsError("cannot receive: failed to read from stream")
+    return 0, received
+
+
+# -- entry points ----------------------------------------------------------
+
+HANDLERS = {
+    "list": cmd_list, "get": cmd_get, "create": cmd_create, "snapshot": cmd_snapshot,
+    "snap": cmd_snapshot, "destroy": cmd_destroy, "hold": cmd_hold, "release": cmd_release,
+    "holds": cmd_holds, "bookmark": cmd_bookmark,
+}
+READ_ONLY = {"list", "get", "holds"}
+
+
+def zfs_main(argv):
+    started = time.monotonic()
+    latency("ZFS_SIM_LATENCY")
+    sub, args = argv[1], argv[2:]
+    rc, nbytes = 0, 0
+    try:
+        if sub == "send":
+            result = cmd_send(args)
+        elif sub in ("receive", "recv"):
+            result = cmd_receive(args)
+        else:
+            out = []
+            with locked_host(current_host(), write=sub not in READ_ONLY) as model:
+                HANDLERS[sub](model, args, out)
+            if out:
+                sys.stdout.write("\n".join(out) + "\n")
+            result = 0
+        if isinstance(result, tuple):
+            rc, nbytes = result
+        else:
+            rc = result
+    except ZfsError as e:
+        sys.stderr.write(str(e) + "\n")
+        rc = 1
+    except KeyError as e:
+        sys.stderr.write(f"unsupported zfs invocation: {e}\n")
+        rc = 2
+    log_call("zfs", argv[1:], started, rc, nbytes)
+    return rc
+
+
+def zpool_main(argv):
+    started = time.monotonic()
+    latency("ZFS_SIM_LATENCY")
+    # zpool get -H -o value feature@<name> <pool>
+    prop, pool = argv[-2], argv[-1]
+    model = read_host(current_host())
+    value = model.get("features", {}).get(prop, "active")
+    sys.stdout.write(value + "\n")
+    log_call("zpool", argv[1:], started, 0)
+    return 0
+
+
+def ssh_main(argv):
+    started = time.monotonic()
+    args = argv[1:]
+    control_path = None
+    control_cmd = None
+    background = False
+    options = {}
+    i = 0
+    while i < len(args) and args[i].startswith("-"):
+        flag = args[i]
+        if flag in ("-S", "-o", "-O", "-p", "-i", "-l", "-F", "-E"):
+            value = args[i + 1]
+            if flag == "-S":
+                control_path = value
+            elif flag == "-O":
+                control_cmd = value
+            elif flag == "-o":
+                key, _, val = value.partition("=")
+                options[key.lower()] = val
+            i += 2
+            continue
+        if "f" in flag[1:]:
+            background = True
+        if "M" in flag[1:]:
+            options["controlmaster"] = "yes"
+        i += 1
+    destination = args[i]
+    remote = " ".join(args[i + 1:])
+    host = destination.split("@", 1)[-1]
+    control_path = options.get("controlpath", control_path)
+    if control_cmd:
+        rc = 0
+        if control_cmd == "exit" and control_path and os.path.exists(control_path):
+            os.remove(control_path)
+        elif control_cmd == "check" and not (control_path and os.path.exists(control_path)):
+            rc = 255
+        log_call("ssh", args, started, rc)
+        return rc
+    if not os.path.exists(host_path(host)):
+        sys.stderr.write(f"ssh: Could not resolve hostname {host}: Name or service not known\n")
+        log_call("ssh", args, started, 255)
+        return 255
+    multiplexed = control_path and os.path.exists(control_path)
+    latency("ZFS_SIM_SSH_MUX_LATENCY" if multiplexed else "ZFS_SIM_SSH_LATENCY")
+    if options.get("controlmaster") in ("yes", "auto") and control_path and not multiplexed:
+        open(control_path, "w").close()
+        if background and not remote:
+            log_call("ssh", args, started, 0)
+            return 0
+    env = dict(os.environ, ZFS_SIM_HOST=host)
+    if not remote:
+        log_call("ssh", args, started, 0)
+        return 0
+    with locked_host(host, write=False) as model:
+        forced_command = model.get("forced_command")
+    if forced_command:
+        env.update({f"BASH_FUNC_{tool}%%": f'() {{ "{SIM_BIN}/{tool}" "$@"; }}' for tool in FORCED_COMMAND_TOOLS})
+        env.update({"BASH_FUNC_logger%%": "() { :; }", "SSH_ORIGINAL_COMMAND": remote, "SSH_CLIENT": "sim"})
+        rc = subprocess.call(["bash", forced_command], env=env)
+    else:
+        rc = subprocess.call(["sh", "-c", remote], env=env)
+    log_call("ssh", args, started, rc)
+    return rc
+
+
+def passthrough_main(argv):
+    """Stand-in for lzop/zstd/mbuffer/pv: copy stdin to stdout."""
+    started = time.monotonic()
+    name = os.path.basename(argv[0])
+    if len(argv) > 1 and argv[1] in ("-V", "--version"):
+        return 0
+    total = 0
+    stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+    while True:
+        chunk = stdin.read1(CHUNK) if hasattr(stdin, "read1") else stdin.read(CHUNK)
+        if not chunk:
+            break
+        stdout.write(chunk)
+        total += len(chunk)
+    stdout.flush()
+    log_call(name, argv[1:], started, 0, total)
+    return 0
+
+
+def mqtt_main(argv):
+    """Stand-in for mosquitto_pub: append each published message to mqtt.jsonl."""
+    started = time.monotonic()
+    args = argv[1:]
+    record = {}
+    for flag, key in (("-t", "topic"), ("-m", "message")):
+        if flag in args:
+            record[key] = args[args.index(flag) + 1]
+    with open(os.path.join(state_dir(), "mqtt.jsonl"), "a") as f:
+        f.write(json.dumps(record) + "\n")
+    log_call("mosquitto_pub", args, started, 0)
+    return 0
+
+
+# -- synthetic fleets ------------------------------------------------------
+
+def build_fleet(hosts, datasets, snapshots, children=0, snapshot_bytes=1024 * 1024,
+                server_dataset="slowpool/encryptedbackups", seed=0):
+    """Create N client hosts x M datasets (+children) x K snapshots and a backup server.
+
+    The backup server is host "local". Snapshots are an hour apart, every 24th
+    one a daily, and each writes snapshot_bytes; so does every snapshot taken
+    later with zfs snapshot.
+
+    Returns {host: [root datasets]} describing what each client should back up.
+    """
+    random.seed(seed)
+    server = empty_host(["slowpool"])
+    parts = server_dataset.split("/")
+    for i in range(2, len(parts) + 1):
+        add_dataset(server, "/".join(parts[:i]))
+    server["datasets"][server_dataset]["encryption_root"] = True
+    write_host("local", server)
+    layout = {}
+    now = int(time.time())
+    for h in range(hosts):
+        host = f"client{h}"
+        model = empty_host(["fastpool"])
+        roots = []
+        for d in range(datasets):
+            root = f"fastpool/data{d}"
+            roots.append(root)
+            names = [root] + [f"{root}/child{c}" for c in range(children)]
+            for name in names:
+                add_dataset(model, name, {"sim:churn": snapshot_bytes})
+                for k in range(snapshots):
+                    created = now - (snapshots - k) * 3600
+                    stamp = time.strftime("%Y-%m-%d_%H:%M:%S", time.localtime(created))
+                    kind = "daily" if k % 24 == 0 else "hourly"
+                    add_snapshot(model, name, f"autosnap_{stamp}_{kind}", creation=created,
+                                 written=snapshot_bytes)
+        write_host(host, model)
+        layout[host] = roots
+    return layout
+
+
+def add_host(host, datasets=(), forced_command=None):
+    """Create an empty host with the pools and datasets given (e.g. an offsite target).
+
+    forced_command is a script every ssh command to the host goes through,
+    like the offsite role's restrict_commands.sh.
+    """
+    model = empty_host(sorted({name.split("/")[0] for name in datasets}))
+    if forced_command:
+        model["forced_command"] = forced_command
+    for name in datasets:
+        parts = name.split("/")
+        for i in range(2, len(parts) + 1):
+            if "/".join(parts[:i]) not in model["datasets"]:
+                add_dataset(model, "/".join(parts[:i]))
+    write_host(host, model)
+
+
+def encrypt(host, dataset):
+    """Make dataset on host an encryption root, inherited by its children."""
+    with locked_host(host) as model:
+        model["datasets"][dataset]["encryption_root"] = True
+
+
+def take_snapshots(host, datasets, snapshot):
+    """Snapshot datasets on host at once, as the hourly policy timer would."""
+    with locked_host(host) as model:
+        cmd_snapshot(model, [f"{name}@{snapshot}" for name in datasets], [])